@@ -27,7 +27,7 @@ except ImportError:
 os.umask(0o027)
 
 
-from prewikka import mainmenu, siteconfig, utils, view
+from prewikka import database, mainmenu, siteconfig, utils, view
 
 
 try:
@@ -61,6 +61,13 @@ class Request(local):
         self.parameters = None
         self.cache = _cache()
         self.view_kwargs = {}
+        self.profile = None
+        # Databases written during the request, read from their primary afterwards
+        self.db_written = set()
+        # Time budget of the dataprovider queries, see dataprovider.QueryBudget
+        self.query_budget = None
+        # Pending queries of DataProviderManager.batch()
+        self.query_batch = None
         self._cleanup_list = []
 
     def register_cleanup(self, callable):
@@ -103,6 +110,15 @@ class Env(object):
     htdocs_mapping = {}
     request = Request()
 
+    # Threads may use their own connection, see database.thread_connections()
+    @property
+    def db(self):
+        return database.get_connection(self._db)
+
+    @db.setter
+    def db(self, db):
+        self._db = db
+
 
 env = Env()
 builtins.env = env
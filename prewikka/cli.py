@@ -40,8 +40,13 @@ class CLIManager(object):
         else:
             return registrar.DelayedRegistrar.make_decorator("cli", self._register, command, category, permissions=permissions, help=help, **options)
 
-    def unregister(self, command=None, category=None):
-        if command and category:
+    def unregister(self, command=None, category=None, owner=None):
+        if owner is not None:
+            for command, categories in self._commands.items():
+                for category, (method, permissions, help, options) in list(categories.items()):
+                    if getattr(method, "__self__", None) is owner:
+                        categories.pop(category)
+        elif command and category:
             self._commands[command].pop(category)
         elif command:
             self._commands.pop(command)
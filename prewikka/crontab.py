@@ -23,6 +23,10 @@ import collections
 import croniter
 import datetime
 import gevent
+import gevent.event
+import gevent.threadpool
+import heapq
+import time
 
 from prewikka.compat.gevent import fix_ssl
 from prewikka.utils import timeutil
@@ -56,7 +60,8 @@ class CronJob(object):
     def __eq__(self, other):
         return self.id == other.id
 
-    def __init__(self, id, name, schedule, func, base, runcnt, ext_type=None, ext_id=None, user=None, error=None, enabled=True):
+    def __init__(self, id, name, schedule, func, base, runcnt, ext_type=None, ext_id=None, user=None, error=None, enabled=True, progress=None,
+                 duration=None):
         self.id = id
         self.name = name
         self.user = user
@@ -67,7 +72,10 @@ class CronJob(object):
         self.enabled = enabled
         self.base = base
         self.runcnt = runcnt
+        self.progress = progress
+        self.duration = duration
         self._running = False
+        self._timeout_error = None
 
         self.set_schedule(schedule)
 
@@ -87,13 +95,53 @@ class CronJob(object):
 
     def update(self, job):
         # Update the current job data (following a modified schedule or a plugin reinitialization)
+        self.name = job.name
+        self.user = job.user
         self.callback = job.callback
         self.error = job.error
         if job.schedule != self.schedule:
             self.set_schedule(job.schedule)
 
+    def set_progress(self, **kwargs):
+        """
+        Save the progress of the running job.
+
+        The progress is kept until the job completes successfully, so that
+        an interrupted or failed job can resume its work on its next run.
+        """
+        self.progress = kwargs
+        env.db.query("UPDATE Prewikka_Crontab SET progress=%s WHERE id=%d", utils.json.dumps(kwargs), self.id)
+
+    def _get_next_schedule(self, now):
+        # Runs missed while the job was running (or the scheduler was busy)
+        # are coalesced into the one that just happened
+        missed = 0
+        next_schedule = self._cron.get_next(datetime.datetime)
+        while next_schedule <= now:
+            missed += 1
+            next_schedule = self._cron.get_next(datetime.datetime)
+
+        if missed:
+            logger.info("[%d/%s]: skipping %d missed run(s)", self.id, self.name, missed)
+
+        return next_schedule
+
+    def mark_timeout(self, timeout):
+        """
+        Mark the running job as having exceeded its timeout.
+
+        The job is not interrupted: it keeps running until completion,
+        but its execution is reported as failed.
+        """
+        logger.error("[%d/%s]: cronjob exceeded its %d seconds timeout", self.id, self.name, timeout)
+
+        self._timeout_error = utils.json.dumps(error.PrewikkaError(N_("Scheduled job execution exceeded its %d seconds timeout", timeout),
+                                                                   N_("Scheduled job execution failed")))
+        env.db.query("UPDATE Prewikka_Crontab SET error=%s WHERE id=%d", self._timeout_error, self.id)
+
     def _run(self):
-        self._running = True
+        start = time.time()
+        self._timeout_error = None
 
         # setup the environment
         env.request.init(None)
@@ -111,19 +159,101 @@ class CronJob(object):
         except Exception as err:
             logger.exception("[%d/%s]: cronjob failed: %s", self.id, self.name, err)
             err = utils.json.dumps(error.PrewikkaError(err, N_("Scheduled job execution failed")))
+        else:
+            self.progress = None
+
+        err = err or self._timeout_error
 
         self.runcnt += 1
-        self._running = False
+        self.duration = time.time() - start
         self.base = timeutil.utcnow()
-        self.next_schedule = self._cron.get_next(datetime.datetime)
-        env.db.query("UPDATE Prewikka_Crontab SET base=%s, runcnt=runcnt+1, error=%s WHERE id=%d", self.base, err, self.id)
+        self.next_schedule = self._get_next_schedule(self.base)
+        env.db.query("UPDATE Prewikka_Crontab SET base=%s, runcnt=runcnt+1, error=%s, progress=%s, duration=%s WHERE id=%d",
+                     self.base, err, utils.json.dumps(self.progress) if self.progress else None, self.duration, self.id)
 
-    def run(self, now):
+    def run(self, now, callback=None):
+        """
+        Run the job if it is due.
+
+        Return False if the job could not be started because of the concurrency limits, True otherwise.
+        The optional callback is called with the job once its execution completes.
+        """
         if now < self.next_schedule or self._running:
-            return
+            return True
+
+        if not executor.can_run(self):
+            logger.debug("[%d/%s]: concurrency limit reached, postponing", self.id, self.name)
+            return False
 
         env.log.info("[%d/%s]: RUNNING JOB schedule=%s callback=%s" % (self.id, self.name, self.schedule, self.callback))
-        gevent.spawn(self._run)
+        executor.submit(self, callback)
+        return True
+
+
+class CronExecutor(object):
+    """
+    Run the cron jobs in a bounded pool of OS threads, so that a long job does not
+    prevent the other jobs, nor the scheduler itself, from running, even while it
+    is blocked in a call gevent cannot switch from (like the libpreludedb ones).
+
+    Each job uses database connections of its own (see database.thread_connections()),
+    the shared ones being used by the scheduler.
+
+    The maximum number of concurrent jobs of a given type, as well as the job
+    timeout, can be overridden in the [cron <type>] configuration sections.
+    """
+
+    def __init__(self):
+        self._running = collections.Counter()
+        self.configure({})
+
+    def configure(self, config):
+        self.workers = int(config.get("workers", 4))
+        self.concurrency = int(config.get("concurrency", 1))
+        self.timeout = int(config.get("timeout", 0))
+        self._pool = None
+
+    def _get_option(self, job, name, default):
+        config = env.config.cron.get_instance_by_name(job.ext_type) if job.ext_type else None
+        if config is None:
+            return default
+
+        return int(config.get(name, default))
+
+    def can_run(self, job):
+        return self._running[job.ext_type] < self._get_option(job, "concurrency", self.concurrency)
+
+    def submit(self, job, callback=None):
+        job._running = True
+        self._running[job.ext_type] += 1
+        gevent.spawn(self._execute, job, self._get_option(job, "timeout", self.timeout), callback)
+
+    def _execute(self, job, timeout, callback):
+        if self._pool is None:
+            self._pool = gevent.threadpool.ThreadPool(self.workers)
+
+        try:
+            result = self._pool.spawn(self._run_job, job)
+            result.wait(timeout or None)
+            if not result.ready():
+                job.mark_timeout(timeout)
+
+                # The job is not interrupted in the middle of its transactions, keep accounting for it until it completes
+                result.wait()
+
+            if result.exception:
+                logger.error("[%d/%s]: cronjob execution failed: %s", job.id, job.name, result.exception)
+        finally:
+            job._running = False
+            self._running[job.ext_type] -= 1
+
+        if callback:
+            callback(job)
+
+    @staticmethod
+    def _run_job(job):
+        with database.thread_connections():
+            job._run()
 
 
 class Crontab(object):
@@ -133,13 +263,27 @@ class Crontab(object):
         self._plugin_callback = {}
         self._formatters = {}
 
+        # Job callbacks have to be refreshed
+        self._revisions = {}
+
     def __init__(self):
         self._reinit()
-        self._joblist = set()
+        self._jobs = {}
+        self._heap = []
+        self._postponed = set()
+        self._wakeup = None
         hookmanager.register("HOOK_PLUGINS_RELOAD", self._reinit)
+        hookmanager.register("HOOK_PLUGIN_UNLOAD", self._unregister_plugin)
+
+    def _unregister_plugin(self, plugin):
+        for ext_type, func in tuple(self._plugin_callback.items()):
+            if getattr(func, "__self__", None) is plugin:
+                self._plugin_callback.pop(ext_type)
+                self._formatters.pop(ext_type, None)
+                self._revisions = {}
 
     def _make_job(self, res):
-        id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error_s = res
+        id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error_s, progress, duration = res
 
         func = self._plugin_callback.get(ext_type)
         if not func:
@@ -159,7 +303,14 @@ class Crontab(object):
         if userid:
             user = usergroup.User(userid=userid)
 
-        return CronJob(int(id), name, schedule, func, base, int(runcnt), ext_type=ext_type, ext_id=ext_id, user=user, error=err, enabled=bool(int(enabled)))
+        if progress:
+            progress = utils.json.loads(progress)
+
+        if duration is not None:
+            duration = float(duration)
+
+        return CronJob(int(id), name, schedule, func, base, int(runcnt), ext_type=ext_type, ext_id=ext_id, user=user, error=err,
+                       enabled=bool(int(enabled)), progress=progress, duration=duration)
 
     @database.use_lock("Prewikka_Crontab")
     def _init_system_job(self, ext_type, name, schedule, enabled, method):
@@ -169,49 +320,89 @@ class Crontab(object):
         if not res:
             self.add(name, schedule, ext_type=ext_type, enabled=enabled)
 
-    def _update_joblist(self):
-        # Update jobs instead of re-creating them because some of them may be currently running
-        mainlist = set(self.list(enabled=True))
+    def _schedule_job(self, job):
+        heapq.heappush(self._heap, (job.next_schedule, job.id))
 
-        # Suppress jobs that were removed from the main list
-        self._joblist -= self._joblist.difference(mainlist)
+    def _update_joblist(self):
+        # Only reload the jobs that were added or modified (see the revision column) since the last refresh
+        revisions = dict((int(id), int(revision)) for id, revision in env.db.query("SELECT id, revision FROM Prewikka_Crontab WHERE enabled = 1"))
+
+        # Suppress jobs that were removed or disabled, their heap entries are discarded when popped
+        for id in set(self._jobs) - set(revisions):
+            del self._jobs[id]
+
+        modified = [id for id, revision in revisions.items() if self._revisions.get(id) != revision]
+        if modified:
+            for job in self.list(id=modified):
+                # Update jobs instead of re-creating them because some of them may be currently running
+                current = self._jobs.get(job.id)
+                if not current:
+                    self._jobs[job.id] = current = job
+                else:
+                    schedule = current.schedule
+                    current.update(job)
+                    if current.schedule == schedule:
+                        continue
+
+                self._schedule_job(current)
+
+        self._revisions = revisions
+
+    def _job_completed(self, job):
+        if self._jobs.get(job.id) is job:
+            self._schedule_job(job)
+
+        # Jobs postponed because of the concurrency limits get another chance
+        for id in self._postponed:
+            job = self._jobs.get(id)
+            if job:
+                self._schedule_job(job)
+
+        self._postponed.clear()
+        self._wakeup.set()
 
-        # Add jobs that were added to the main list
-        self._joblist |= mainlist.difference(self._joblist)
+    def _run_jobs(self):
+        now = timeutil.utcnow()
 
-        # Take schedule changes into account
-        for job in self._joblist:
-            for j in mainlist:
-                if j == job:
-                    job.update(j)
-                    break
+        while self._heap and self._heap[0][0] <= now:
+            next_schedule, id = heapq.heappop(self._heap)
 
-        return self._joblist
+            # Skip stale entries (removed jobs, modified schedules or running jobs)
+            job = self._jobs.get(id)
+            if not job or job.next_schedule != next_schedule or job._running:
+                continue
 
-    def _run_jobs(self):
-        first = now = timeutil.utcnow()
+            if not job.run(now, callback=self._job_completed):
+                self._postponed.add(id)
 
-        for job in self._update_joblist():
-            job.run(now)
             now = timeutil.utcnow()
 
-        return (self._REFRESH - (now - first)).total_seconds()
-
     def run(self, core):
+        executor.configure(env.config.crontab)
+        self._wakeup = gevent.event.Event()
+
+        refresh = timeutil.utcnow()
         while True:
-            next = self._run_jobs()
-            if next > 0:
-                gevent.sleep(next)
+            if timeutil.utcnow() >= refresh:
+                core.reload_plugin_if_needed()
+                self._update_joblist()
+                refresh = timeutil.utcnow() + self._REFRESH
+
+            self._run_jobs()
+
+            # Sleep until the next due job, or the next job list refresh
+            wakeup = min(self._heap[0][0], refresh) if self._heap else refresh
 
-            core.reload_plugin_if_needed()
+            self._wakeup.clear()
+            self._wakeup.wait(max((wakeup - timeutil.utcnow()).total_seconds(), 0))
 
     def list(self, **kwargs):
         qs = env.db.kwargs2query(kwargs, prefix=" WHERE ")
-        for res in env.db.query("SELECT id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error FROM Prewikka_Crontab%s" % qs):
+        for res in env.db.query("SELECT id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error, progress, duration FROM Prewikka_Crontab%s" % qs):
             yield self._make_job(res)
 
     def get(self, id):
-        res = env.db.query("SELECT id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error FROM Prewikka_Crontab WHERE id=%d", id)
+        res = env.db.query("SELECT id, name, userid, schedule, ext_type, ext_id, base, runcnt, enabled, error, progress, duration FROM Prewikka_Crontab WHERE id=%d", id)
         if not res:
             raise error.PrewikkaError(N_('Invalid CronJob'), N_('CronJob with id=%d cannot be found in database', id))
 
@@ -247,6 +438,8 @@ class Crontab(object):
             env.db.query("INSERT INTO Prewikka_Crontab (%s) VALUES %%s" % (", ".join(cols + ["base"])), data + [timeutil.utcnow()])
             return env.db.get_last_insert_ident()
         else:
+            # Bump the revision so that the scheduler reloads the job
+            data.append("revision = revision + 1")
             env.db.query("UPDATE Prewikka_Crontab SET %s WHERE id IN %%s" % (", ".join(data)), env.db._mklist(id))
             return id
 
@@ -315,6 +508,7 @@ def schedule_to_menuparams(x):
     return params
 
 
+executor = CronExecutor()
 crontab = Crontab()
 
 list = crontab.list
@@ -21,17 +21,20 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import abc
 import collections
+import contextlib
+import copy
 import fcntl
 import functools
 import operator
 import pkgutil
 import re
+import threading
 import time
 from datetime import datetime
 
 import pkg_resources
 import preludedb
-from prewikka import compat, error, log, utils, version
+from prewikka import compat, error, log, profiling, utils, version
 from prewikka.utils import cache
 
 
@@ -39,6 +42,229 @@ NotNone = object
 ModuleInfo = collections.namedtuple("ModuleInfo", ["branch", "version", "enabled"])
 
 
+_READ_QUERY_REGEX = re.compile(r"^\s*(SELECT|SHOW|WITH|EXPLAIN)\b", re.IGNORECASE)
+
+# Seconds the replica is behind the primary, NULL (or 0) when up to date
+_REPLICATION_LAG_QUERY = {
+    "pgsql": "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+             "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+    "mysql": "SELECT COALESCE(MAX(IF(APPLYING_TRANSACTION = '', 0, "
+             "TIMESTAMPDIFF(SECOND, APPLYING_TRANSACTION_ORIGINAL_COMMIT_TIMESTAMP, NOW(6)))), 0) "
+             "FROM performance_schema.replication_applier_status_by_worker",
+}
+
+
+_thread = threading.local()
+
+
+def mark_written(db):
+    """Record that the current request wrote to db, so that its next reads go to the primary"""
+    env.request.db_written.add(id(db))
+
+
+@contextlib.contextmanager
+def thread_connections():
+    """
+    Context manager giving the current thread its own database connections.
+
+    Within its scope, get_connection() returns a clone of the shared connection it
+    is given, opened on first use, so that the thread can run queries concurrently
+    with the thread owning the shared connections.
+    """
+    previous = getattr(_thread, "connections", None)
+    _thread.connections = {}
+    try:
+        yield
+    finally:
+        _thread.connections = previous
+
+
+def get_connection(shared):
+    """Return the connection the current thread should use in place of shared, see thread_connections()"""
+    connections = getattr(_thread, "connections", None)
+    if connections is None or shared is None:
+        return shared
+
+    # The shared connection is kept along with its clone so that its id is not reused
+    entry = connections.get(id(shared))
+    if entry is None:
+        entry = connections[id(shared)] = (shared, shared.clone())
+
+    return entry[1]
+
+
+def get_replication_lag(sql, dbtype):
+    """Return the replication lag in seconds of the preludedb.SQL connection sql, or None if unknown"""
+    query = _REPLICATION_LAG_QUERY.get(dbtype)
+    if not query:
+        return None
+
+    rows = sql.query(query)
+    if not rows or rows[0][0] is None:
+        return None
+
+    return float(rows[0][0])
+
+
+# Queries returning the maximum execution time of the following queries of the session,
+# and changing it, in milliseconds (0 for no limit)
+_STATEMENT_TIMEOUT_QUERY = {
+    "pgsql": ("SELECT setting FROM pg_settings WHERE name = 'statement_timeout'", "SET statement_timeout = %d"),
+    "mysql": ("SELECT @@SESSION.max_execution_time", "SET SESSION max_execution_time = %d"),
+}
+
+# Errors meaning that the connection to the server failed, rather than the query itself
+_CONNECTION_ERROR_REGEX = re.compile(r"connection error|could not connect|can't connect|connection refused|lost connection|server has gone away|"
+                                     r"server closed the connection|terminating connection|no connection to the server", re.IGNORECASE)
+
+_STATEMENT_TIMEOUT_REGEX = re.compile(r"canceling statement due to statement timeout|maximum statement execution time exceeded", re.IGNORECASE)
+
+
+@contextlib.contextmanager
+def statement_timeout(sql, dbtype, timeout):
+    """
+    Context manager interrupting the queries run on the preludedb.SQL connection sql
+    after timeout seconds (None for no limit), raising DatabaseTimeoutError.
+    The previous timeout of the session is restored afterwards.
+    """
+    queries = _STATEMENT_TIMEOUT_QUERY.get(dbtype)
+    if not timeout or not queries:
+        yield
+        return
+
+    get_query, set_query = queries
+    previous = int(sql.query(get_query)[0][0] or 0)
+
+    sql.query(set_query % max(1, int(timeout * 1000)))
+    failed = True
+    try:
+        yield
+        failed = False
+    except Exception as e:
+        if _STATEMENT_TIMEOUT_REGEX.search(text_type(e)):
+            raise DatabaseTimeoutError(details=e)
+
+        raise
+    finally:
+        try:
+            sql.query(set_query % previous)
+        except Exception:
+            # PostgreSQL refuses any query in an aborted transaction, whose rollback
+            # also reverts the timeout: the original error is the one to report.
+            if not failed:
+                raise
+
+
+class ReplicaRouter(object):
+    """
+    Route read queries to the read replicas of a database, in a round-robin fashion.
+
+    Each replica is described by a (name, connect, check_interval, max_lag) tuple,
+    connect being a callable returning a connection having a get_replication_lag()
+    method. Replicas are checked at most every check_interval seconds, the ones
+    failing or lagging more than max_lag seconds behind are skipped until the next
+    check. The primary is used when no replica is usable, and once the current
+    request wrote to it (see mark_written()), so that it can read its own writes.
+    """
+
+    def __init__(self, primary, replicas):
+        self._primary = primary
+        self._replicas = [utils.AttrObj(name=name, connect=connect, check_interval=check_interval, max_lag=max_lag,
+                                        conn=None, usable=False, next_check=0)
+                          for name, connect, check_interval, max_lag in replicas]
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._replicas)
+
+    def _check(self, replica):
+        try:
+            if replica.conn is None:
+                replica.conn = replica.connect()
+
+            lag = replica.conn.get_replication_lag()
+        except Exception as e:
+            log.get_logger().warning("read replica %s is unavailable: %s", replica.name, e)
+            replica.conn = None
+            replica.usable = False
+            return
+
+        replica.usable = lag is None or lag <= replica.max_lag
+        if not replica.usable:
+            log.get_logger().warning("read replica %s is %.1f seconds behind, skipping it", replica.name, lag)
+
+    def _disable(self, conn):
+        for replica in self._replicas:
+            if replica.conn is conn:
+                replica.usable = False
+                replica.next_check = time.time() + replica.check_interval
+
+    def get(self):
+        """Return the connection read queries should use"""
+        if not self._replicas or id(self._primary) in env.request.db_written:
+            return self._primary
+
+        now = time.time()
+        with self._lock:
+            index = self._index
+            self._index = (index + 1) % len(self._replicas)
+
+            # Only one thread checks a given replica
+            due = [replica for replica in self._replicas if now >= replica.next_check]
+            for replica in due:
+                replica.next_check = now + replica.check_interval
+
+        for replica in due:
+            self._check(replica)
+
+        for i in range(len(self._replicas)):
+            replica = self._replicas[(index + i) % len(self._replicas)]
+            if replica.usable:
+                return replica.conn
+
+        return self._primary
+
+    def clone(self):
+        """Return a router for the connection of the current thread to the primary, without replicas"""
+        return ReplicaRouter(get_connection(self._primary), [])
+
+    def run(self, func):
+        """Call func with the connection to read from, falling back to the primary if a replica fails"""
+        conn = self.get()
+        if conn is self._primary:
+            return func(conn)
+
+        try:
+            return func(conn)
+        except Exception as e:
+            # The primary would fail the same way on an invalid query, or one exceeding its timeout
+            if isinstance(e, DatabaseTimeoutError) or not _CONNECTION_ERROR_REGEX.search(text_type(e)):
+                raise
+
+            log.get_logger().warning("query on read replica failed, using the primary: %s", e)
+            self._disable(conn)
+            return func(self._primary)
+
+    @classmethod
+    def from_config(cls, primary, settings, replicas, connect):
+        """
+        Create a router for the primary connection, opened with settings,
+        from the replica sections: their options override the primary ones.
+        connect is called with the resulting settings to open a replica connection.
+        """
+        ret = []
+        for section in replicas:
+            rsettings = dict(settings)
+            rsettings.update(section.items())
+
+            check_interval = float(rsettings.pop("check_interval", 10))
+            max_lag = float(rsettings.pop("max_lag", 30))
+            ret.append((section.get_instance_name() or rsettings.get("host"), functools.partial(connect, rsettings), check_interval, max_lag))
+
+        return cls(primary, ret)
+
+
 class DatabaseError(error.PrewikkaUserError):
     name = N_("Database error")
 
@@ -50,6 +276,13 @@ class DatabaseSchemaError(DatabaseError):
     name = N_("Database schema error")
 
 
+class DatabaseTimeoutError(DatabaseError):
+    name = N_("Query timeout")
+
+    def __init__(self, **kwargs):
+        DatabaseError.__init__(self, N_("The query exceeded its allowed execution time. Please use a more specific filter or a shorter period."), **kwargs)
+
+
 # Internal workaround since SWIG generated exception use class RuntimeError
 def _fix_exception(func):
     def inner(self, *args, **kwargs):
@@ -446,7 +679,7 @@ class DatabaseUpdateHelper(DatabaseHelper):
 
 class DatabaseCommon(object):
     required_branch = version.__branch__
-    required_version = "0"
+    required_version = "3"
 
     NotNone = NotNone
     __sentinel = object()
@@ -457,6 +690,16 @@ class DatabaseCommon(object):
 
     @_fix_exception
     def __init__(self, settings):
+        self._init_connection(settings)
+
+        stpl = tuple((k, v) for k, v in settings.items())
+
+        self._version = self._db.getServerVersion()
+        self._dbhash = hash(stpl)
+        self._dbtype = settings["type"]
+        self._settings = settings
+
+    def _init_connection(self, settings):
         self.__ESCAPE_PREFILTER = {
             bool: int,
             datetime: lambda dt: self.escape(self.datetime(dt)),
@@ -464,13 +707,14 @@ class DatabaseCommon(object):
         }
 
         self._transaction_state = self.__TRANSACTION_STATE_NONE
-
-        stpl = tuple((k, v) for k, v in settings.items())
         self._db = preludedb.SQL(settings)
 
-        self._version = self._db.getServerVersion()
-        self._dbhash = hash(stpl)
-        self._dbtype = settings["type"]
+    @_fix_exception
+    def clone(self):
+        """Return a copy of the database object using a connection of its own"""
+        db = copy.copy(self)
+        db._init_connection(self._settings)
+        return db
 
     def _get_prefilter(self, v):
         if not(isinstance(v, (text_type, bytes))) and isinstance(v, collections.Iterable):
@@ -544,7 +788,11 @@ class DatabaseCommon(object):
         elif kwargs:
             sql = sql % dict((key, self.escape(value)) for key, value in kwargs.items())
 
-        return self._db.query(sql)
+        if not _READ_QUERY_REGEX.match(sql):
+            mark_written(self)
+
+        with profiling.span("sql", statement=sql[:200]):
+            return self._db.query(sql)
 
     def _chk(self, key, value, join="AND"):
         if value is not None:
@@ -568,6 +816,20 @@ class DatabaseCommon(object):
     def get_type(self):
         return self._dbtype
 
+    def has_window_functions(self):
+        """Return True if the server supports window functions (OVER clauses)"""
+        return False
+
+    def get_replication_lag(self):
+        return get_replication_lag(self._db, self._dbtype)
+
+    def get_reader(self):
+        """Return the database read-only queries may be sent to"""
+        return self
+
+    def statement_timeout(self, timeout):
+        return statement_timeout(self._db, self._dbtype, timeout)
+
     def escape(self, data):
         prefilter = self._get_prefilter(data)
         if prefilter:
@@ -656,6 +918,17 @@ class DatabaseCommon(object):
 
 
 class MySQLDatabase(DatabaseCommon):
+    @cache.memoize_property("mariadb_cache")
+    def is_mariadb(self):
+        return "mariadb" in text_type(self.query("SELECT VERSION()")[0][0]).lower()
+
+    def has_window_functions(self):
+        # MariaDB 10.0 and 10.1 version numbers are above MySQL 8.0 ones
+        if self.is_mariadb:
+            return self._version >= 100200
+
+        return self._version >= 80000
+
     def _lock_table(self, table):
         self.query("LOCK TABLES %s" % ", ".join(t + " WRITE" for t in self._mklist(table)))
 
@@ -691,10 +964,13 @@ class MySQLDatabase(DatabaseCommon):
 
 
 class PgSQLDatabase(DatabaseCommon):
+    def has_window_functions(self):
+        return True
+
     def _lock_table(self, table):
         self.query("LOCK TABLE %s IN EXCLUSIVE MODE" % ", ".join(self._mklist(table)))
 
-    @cache.memoize("table_info")
+    @cache.memoize("table_info", maxsize=256)
     def _get_table_info(self, table):
         out = {}
         typemap = {"bigint": "integer", "smallint": "integer", "character varying": "text"}
@@ -876,6 +1152,11 @@ class PrewikkaDatabaseCommon(DatabaseCommon):
         dh = DatabaseUpdateHelper("prewikka", self.required_version, self.required_branch)
         dh.apply()
 
+        self._router = ReplicaRouter.from_config(self, self._settings, env.config.database_replica, Database)
+
+        self._plugin_check_interval = env.config.general.get_float("plugin_check_interval", 5.)
+        self._plugin_check_time = time.time()
+        self._plugin_modinfos = {}
         self._last_plugin_activation_change = self._get_last_plugin_changed()
 
     @cache.memoize_property("modinfos_cache")
@@ -898,20 +1179,54 @@ class PrewikkaDatabaseCommon(DatabaseCommon):
         rows = self.query("SELECT time FROM Prewikka_Module_Changed")[0][0]
         return utils.timeutil.get_timestamp_from_string(rows)
 
-    def has_plugin_changed(self):
-        last = self._get_last_plugin_changed()
+    def get_plugin_changes(self):
+        """Return the modules whose registry entry changed since the last call
+
+        The Prewikka_Module_Changed table is queried at most once every
+        `plugin_check_interval` seconds. None is returned when no change
+        was triggered, otherwise a dict mapping the full module name of
+        each modified module to its new ModuleInfo (None if it was removed).
+        """
+        now = time.time()
+        if now < self._plugin_check_time + self._plugin_check_interval:
+            return None
+
+        self._plugin_check_time = now
 
+        last = self._get_last_plugin_changed()
         if last <= self._last_plugin_activation_change:
-            return False
+            return None
 
         self._last_plugin_activation_change = last
+
+        old = self._plugin_modinfos
+        self.refresh_plugin_state()
+        new = self._plugin_modinfos
+
+        return dict((mod, new.get(mod)) for mod in set(old) | set(new) if old.get(mod) != new.get(mod))
+
+    def refresh_plugin_state(self):
+        """Record the module registry state the loaded plugins correspond to"""
         self.modinfos_cache.clear()
+        self._plugin_modinfos = dict(self.modinfos)
 
-        return True
+    def clone(self):
+        db = DatabaseCommon.clone(self)
+        db._router = ReplicaRouter(db, [])
+        return db
+
+    def get_reader(self):
+        return self._router.get()
+
+    def has_plugin_changed(self):
+        return self.get_plugin_changes() is not None
 
     def trigger_plugin_change(self):
         self.query("UPDATE Prewikka_Module_Changed SET time=current_timestamp")
 
+        # Make sure the current process picks the change up on its next request
+        self._plugin_check_time = 0
+
 
 class PrewikkaPgSQLDatabase(PgSQLDatabase, PrewikkaDatabaseCommon):
     def __init__(self, settings):
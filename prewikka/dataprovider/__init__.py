@@ -19,6 +19,8 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
+import contextlib
 import copy
 import itertools
 import time
@@ -26,7 +28,7 @@ import time
 from datetime import datetime, timedelta
 from enum import Enum
 
-from prewikka import compat, error, hookmanager, pluginmanager
+from prewikka import compat, database, error, hookmanager, pluginmanager, profiling
 from prewikka.utils import AttrObj, CachingIterator, json
 from prewikka.utils.timeutil import parser, tzutc
 
@@ -128,54 +130,272 @@ class ItemNotFoundError(error.PrewikkaUserError):
     pass
 
 
-class QueryResultsRow(CachingIterator):
-    __slots__ = ("_parent")
+class QueryTimeoutError(database.DatabaseTimeoutError):
+    pass
+
+
+class QueryCancelledError(error.PrewikkaUserError):
+    def __init__(self):
+        error.PrewikkaUserError.__init__(self, N_("Query cancelled"), N_("The query was cancelled as the client disconnected"))
+
+
+class QueryBudget(object):
+    """
+    Time budget of the dataprovider queries of a request.
+
+    Each query may run for at most query_timeout seconds, and the queries of the
+    request for at most request_timeout seconds altogether (0 meaning no limit).
+    The is_connected callable, if any, is checked before each query so that
+    no more queries are run once the client is gone.
+    """
+
+    def __init__(self, query_timeout=0, request_timeout=0, is_connected=None):
+        self.query_timeout = query_timeout
+        self.request_timeout = request_timeout
+        self.is_connected = is_connected
+        self.cancelled = False
+        self.spent = 0
+
+        # Timeout of the running query, in seconds
+        self.timeout = None
 
-    def __init__(self, parent, items):
-        CachingIterator.__init__(self, items)
-        self._parent = parent
+    @classmethod
+    def from_config(cls, config, endpoint=None, user=None, is_connected=None):
+        """
+        Create the budget of a request from the [query_timeout] sections config.
+        The settings of the default section are overridden by the ones of the
+        sections named after the view (like "AlertDataSearch") and the view
+        endpoint (like "AlertDataSearch.ajax_table"), then by the "user:<login>" one.
+        """
+        sections = dict((section.get_instance_name() or None, section) for section in config)
+
+        names = [None]
+        if endpoint:
+            names += [endpoint.split(".", 1)[0], endpoint]
+
+        if user:
+            names.append("user:%s" % user.name)
+
+        query_timeout = request_timeout = 0.
+        for name in names:
+            section = sections.get(name)
+            if section is not None:
+                query_timeout = section.get_float("query", query_timeout)
+                request_timeout = section.get_float("request", request_timeout)
 
-    def _get_current_path_type(self):
-        return self._parent._paths_types[len(self._cache)]
+        return cls(query_timeout, request_timeout, is_connected)
+
+    def cancel(self):
+        self.cancelled = True
+
+    @contextlib.contextmanager
+    def run(self):
+        """
+        Context manager wrapping the execution of a query, raising
+        QueryCancelledError or QueryTimeoutError if it cannot be run.
+        """
+        if not self.cancelled and self.is_connected and not self.is_connected():
+            self.cancelled = True
 
-    def _get_current_path(self):
-        return self._parent._paths[len(self._cache)]
+        if self.cancelled:
+            raise QueryCancelledError()
 
-    def _cast(self, value):
-        type = self._get_current_path_type()
+        timeout = self.query_timeout or None
+        if self.request_timeout:
+            remaining = self.request_timeout - self.spent
+            if remaining <= 0:
+                raise QueryTimeoutError()
+
+            timeout = min(timeout or remaining, remaining)
+
+        start = time.time()
+        self.timeout = timeout
         try:
-            if type is datetime:
-                return to_datetime(value)
+            yield timeout
+        finally:
+            self.timeout = None
+            self.spent += time.time() - start
 
-            elif type is timedelta:
-                return timedelta(seconds=int(value))
 
-            elif type is object:
-                return value
+def get_query_timeout():
+    """Return the time in seconds the running query may take, None meaning no limit"""
+    budget = env.request.query_budget
+    return budget.timeout if budget else None
 
-            return type(value)
-        except (KeyError, ValueError):
-            raise error.PrewikkaUserError(N_("Conversion error"),
-                                          N_("Value %(value)r cannot be converted to %(type)s", {"value": value, "type": type}))
 
-    def preprocess_value(self, value):
-        if value is None:
-            return None
+class QueryBatch(object):
+    """
+    Queries deferred by the backends within DataProviderManager.batch().
 
-        if self._parent._paths_types:
-            value = self._cast(value)
+    Backends register each pending query along with the function sending
+    them, which is called with all the pending queries it registered once
+    the results of one of them are needed. The sending is accounted for in
+    the time budget of the request; when the budget is exhausted, the error
+    is given to the set_error() method of each of the queries.
+    """
 
-        cont = [self._get_current_path(), value]
-        list(hookmanager.trigger("HOOK_DATAPROVIDER_VALUE_READ", cont))
+    def __init__(self, budget):
+        self._budget = budget
+        self._pending = collections.OrderedDict()
+
+    def add(self, send, query):
+        self._pending.setdefault(send, []).append(query)
+
+    def flush(self):
+        pending, self._pending = self._pending, collections.OrderedDict()
+        for send, queries in pending.items():
+            try:
+                with profiling.span("dataprovider", batch=len(queries)), self._budget.run():
+                    send(queries)
+            except (QueryCancelledError, QueryTimeoutError) as err:
+                for query in queries:
+                    query.set_error(err)
+
+
+class QueryResultsRow(object):
+    """A QueryResults row, holding already converted values"""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values):
+        self._values = values
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __getitem__(self, key):
+        return self._values[key]
 
-        return cont[1]
+    def __repr__(self):
+        return "QueryResultsRow(%r)" % (self._values,)
+
+    def __json__(self):
+        return list(self._values)
+
+
+_CASTS = {
+    datetime: to_datetime,
+    timedelta: lambda value: timedelta(seconds=int(value)),
+    object: None
+}
 
 
 class QueryResults(CachingIterator):
-    __slots__ = ("_paths", "_paths_types", "duration")
+    __slots__ = ("_paths", "_paths_types", "duration", "total", "partial", "_converters")
+
+    def __init__(self, items, count=None, total=None):
+        CachingIterator.__init__(self, items, count)
+        self._paths = []
+        self._paths_types = []
+        self._converters = None
+        self._init_attributes(total)
+
+    def _init_attributes(self, total):
+        # Number of rows matching the query regardless of limit and offset, if known
+        self.total = total
+
+        # Whether the backend timed out and only returned part of the results
+        self.partial = False
+
+    def _make_converter(self, path, type, read_hook):
+        """
+        Return a function converting the values of one column, or None if the values are to be used as is.
+
+        @param path: the column path, given to the HOOK_DATAPROVIDER_VALUE_READ handlers
+        @param type: the column type the values are cast to (if any)
+        @param read_hook: whether HOOK_DATAPROVIDER_VALUE_READ handlers are registered
+        """
+        cast = _CASTS.get(type, type) if type else None
+        if not cast and not read_hook:
+            return None
+
+        # Values already having the expected type are not cast again
+        exact_type = type if cast is type else None
+
+        def convert(value):
+            if value is None:
+                return None
+
+            if cast and value.__class__ is not exact_type:
+                try:
+                    value = cast(value)
+                except (KeyError, ValueError):
+                    raise error.PrewikkaUserError(N_("Conversion error"),
+                                                  N_("Value %(value)r cannot be converted to %(type)s", {"value": value, "type": type}))
+
+            if read_hook:
+                cont = [path, value]
+                list(hookmanager.trigger("HOOK_DATAPROVIDER_VALUE_READ", cont))
+                value = cont[1]
+
+            return value
+
+        return convert
+
+    def _get_columns(self, width):
+        paths, types = self._paths or [], self._paths_types or []
+        return [(paths[i] if i < len(paths) else None, types[i] if i < len(types) else None) for i in range(width)]
+
+    def _get_converters(self, width):
+        if self._converters is None or self._converters[0] != width:
+            read_hook = hookmanager.has_handlers("HOOK_DATAPROVIDER_VALUE_READ")
+            converters = tuple(self._make_converter(path, type, read_hook) for path, type in self._get_columns(width))
+
+            self._converters = (width, converters if any(converters) else None)
+
+        return self._converters[1]
+
+    def _convert_row(self, items):
+        items = tuple(items)
+
+        converters = self._get_converters(len(items))
+        if not converters:
+            return items
+
+        return tuple(convert(value) if convert else value for convert, value in zip(converters, items))
+
+    def _convert_column(self, path, type, column, read_hook):
+        convert = self._make_converter(path, type, False)
+        values = list(map(convert, column)) if convert else list(column)
+
+        if read_hook:
+            # Batch-aware handlers process the whole column in a single call
+            conts = [[path, value] for value in values]
+            hookmanager.trigger_batch("HOOK_DATAPROVIDER_VALUE_READ", [cont for cont in conts if cont[1] is not None])
+            values = [cont[1] for cont in conts]
+
+        return values
 
     def preprocess_value(self, value):
-        return QueryResultsRow(self, value)
+        return QueryResultsRow(self._convert_row(value))
+
+    def convert(self):
+        """
+        Convert all the remaining rows at once, column by column.
+
+        This is faster than converting the rows one at a time while iterating,
+        at the expense of keeping all the rows in memory.
+        """
+        rows = [tuple(row) for row in self._items]
+        self._items = iter([])
+
+        width = len(rows[0]) if rows else 0
+        converters = self._get_converters(width) if rows else None
+
+        if converters and all(len(row) == width for row in rows):
+            read_hook = hookmanager.has_handlers("HOOK_DATAPROVIDER_VALUE_READ")
+            columns = [self._convert_column(path, type, column, read_hook) for (path, type), column in zip(self._get_columns(width), zip(*rows))]
+            rows = zip(*columns)
+        elif converters:
+            rows = (self._convert_row(row) for row in rows)
+
+        self._cache.extend(QueryResultsRow(row) for row in rows)
+        self._count = len(self._cache)
+
+        return self
 
 
 class ResultObject(object):
@@ -242,6 +462,14 @@ class DataProviderInstance(pluginmanager.PluginBase):
         """
         raise error.NotImplementedError
 
+    def get_values_total(self, paths, criteria, distinct, limit, offset):
+        """
+        Same as get_values(), the total number of rows matching the query
+        regardless of limit and offset (the number of groups, for an aggregated
+        query) being also computed and stored in the total attribute of the result.
+        """
+        raise error.NotImplementedError
+
     def get_by_id(self, id_):
         """Retrieve a root object by its ID."""
         raise error.NotImplementedError
@@ -254,6 +482,15 @@ class DataProviderInstance(pluginmanager.PluginBase):
         """Delete objects (or, if a root path is given, subobjects) matching the given criteria."""
         raise error.NotImplementedError
 
+    def delete_batch(self, criteria, paths, limit):
+        """
+        Delete at most limit objects matching the given criteria, oldest first.
+
+        @return: The number of deleted objects
+        @rtype: int
+        """
+        raise error.NotImplementedError
+
     def insert(self, data, criteria):
         """Insert a root object, or, if criteria are given, a subobject."""
         raise error.NotImplementedError
@@ -377,6 +614,7 @@ class _CriterionOperatorFamily(Enum):
     STANDARD = 1
     REGEX = 2
     SUBSTRING = 3
+    SET = 4
 
 
 # ["String1", StringN, "ENUM_VALUE"], Family, Negated, Case-Insensitive
@@ -406,6 +644,10 @@ _CriterionOperatorList = [
     (["!<>", "NOT_SUBSTR"], _CriterionOperatorFamily.SUBSTRING, True, False),
     (["<>*", "SUBSTR_NOCASE"], _CriterionOperatorFamily.SUBSTRING, False, True),
     (["!<>*", "NOT_SUBSTR_NOCASE"], _CriterionOperatorFamily.SUBSTRING, True, True),
+
+    # SET
+    (["in", "IN"], _CriterionOperatorFamily.SET, False, False),
+    (["!in", "NOT_IN"], _CriterionOperatorFamily.SET, True, False),
 ]
 
 
@@ -434,6 +676,10 @@ class _CriterionEnum(Enum):
     def is_substring(self):
         return self.family is _CriterionOperatorFamily.SUBSTRING
 
+    @property
+    def is_set(self):
+        return self.family is _CriterionOperatorFamily.SET
+
     def __json__(self):
         return self.name
 
@@ -447,14 +693,38 @@ CriterionOperator = _CriterionEnum(
 
 
 class Criterion(json.JSONObject):
+    """
+    A criterion on a path, or a boolean combination of criteria.
+
+    The IN and NOT_IN operators take a list of values as right operand, e.g.
+    Criterion("alert.messageid", "in", ["id1", "id2"]). The left operand can
+    also be a tuple of paths to match several columns at once, in which case
+    the right operand is a list of tuples:
+    Criterion(("alert.analyzer.analyzerid", "alert.messageid"), "in", [("a1", "id1")])
+    """
+
     def __init__(self, left=None, operator=None, right=None):
         json.JSONObject.__init__(self)
 
         if isinstance(operator, text_type):
             operator = CriterionOperator[operator]
 
+        if operator is not None and operator.is_set:
+            left, right = self._normalize_set(left, right)
+
         self._init(left, operator, right)
 
+    @staticmethod
+    def _normalize_set(left, right):
+        # JSON-deserialized criteria hold lists instead of tuples
+        if isinstance(left, list):
+            left = tuple(left)
+
+        if isinstance(left, tuple):
+            return left, [tuple(value) for value in right]
+
+        return left, list(right)
+
     def _init(self, left, operator, right):
         self.left, self.operator, self.right = left, operator, right
 
@@ -463,7 +733,9 @@ class Criterion(json.JSONObject):
         if not self:
             return res
 
-        if not self.operator.is_boolean:
+        if isinstance(self.left, tuple):
+            res.update(self.left)
+        elif not self.operator.is_boolean:
             res.add(self.left)
         else:
             if self.left:
@@ -481,6 +753,9 @@ class Criterion(json.JSONObject):
             left = self.left._compile(base, format_only) if self.left else None
             return Criterion(left, self.operator, self.right._compile(base, format_only))
 
+        if self.operator.is_set:
+            return self._compile_set(base, format_only)
+
         left = base.format_path(self.left)
         if format_only:
             return Criterion(left, self.operator, self.right)
@@ -490,6 +765,32 @@ class Criterion(json.JSONObject):
         list(hookmanager.trigger("HOOK_DATAPROVIDER_VALUE_WRITE", tpl))
         return base.compile_criterion(Criterion(tpl[0], self.operator, tpl[1]))
 
+    def _compile_set(self, base, format_only):
+        multi = isinstance(self.left, tuple)
+        left = tuple(base.format_path(path) for path in self.left) if multi else base.format_path(self.left)
+        if format_only:
+            return Criterion(left, self.operator, self.right)
+
+        if not hookmanager.has_handlers("HOOK_DATAPROVIDER_VALUE_WRITE"):
+            return base.compile_criterion(Criterion(left, self.operator, self.right))
+
+        values = []
+        for value in self.right:
+            if multi:
+                value = tuple(self._write_value(path, v) for path, v in zip(left, value))
+            else:
+                value = self._write_value(left, value)
+
+            values.append(value)
+
+        return base.compile_criterion(Criterion(left, self.operator, values))
+
+    @staticmethod
+    def _write_value(path, value):
+        tpl = [path, value]
+        list(hookmanager.trigger("HOOK_DATAPROVIDER_VALUE_WRITE", tpl))
+        return tpl[1]
+
     @staticmethod
     def _value_escape(value):
         if isinstance(value, (int, float)):
@@ -513,6 +814,33 @@ class Criterion(json.JSONObject):
 
         return "%s %s %s" % (path, operator.name, self._value_escape(value))
 
+    def _set_to_string(self, paths, operator, values, _depth):
+        # The criteria syntax has no set operator: the values are expanded
+        # into a flat chain of (in)equalities.
+        multi = isinstance(paths, tuple)
+        if not multi:
+            paths, values = (paths,), [(value,) for value in values]
+
+        if operator.negated:
+            cmp, inner, outer = CriterionOperator.NOT_EQUAL, " || ", " && "
+        else:
+            cmp, inner, outer = CriterionOperator.EQUAL, " && ", " || "
+
+        if not values:
+            # Always true for NOT_IN, always false for IN
+            res = "%s || !%s" % (paths[0], paths[0]) if operator.negated else "%s && !%s" % (paths[0], paths[0])
+        else:
+            terms = []
+            for row in values:
+                term = inner.join(self._criterion_to_string(path, cmp, value) for path, value in zip(paths, row))
+                terms.append("(%s)" % term if multi else term)
+
+            res = outer.join(terms)
+            if len(terms) == 1:
+                return res
+
+        return res if _depth == 0 else "(%s)" % res
+
     def to_string(self, noroot=False, _depth=0):
         if not self:
             return ""
@@ -527,7 +855,13 @@ class Criterion(json.JSONObject):
 
         lst = [self.left, self.operator, self.right]
         if noroot:
-            lst[0] = lst[0].split(".", 1)[-1]
+            if isinstance(lst[0], tuple):
+                lst[0] = tuple(path.split(".", 1)[-1] for path in lst[0])
+            else:
+                lst[0] = lst[0].split(".", 1)[-1]
+
+        if self.operator.is_set:
+            return self._set_to_string(*lst, _depth=_depth)
 
         return self._criterion_to_string(*lst)
 
@@ -740,13 +1074,56 @@ class DataProviderManager(pluginmanager.PluginManager):
         if offset < 0 or offset > 2**31 - 1:
             raise DataProviderError("Offset parameter out of bounds")
 
-    def query(self, paths, criteria=None, distinct=False, limit=-1, offset=0, type=None, **kwargs):
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager letting the backends defer the queries issued in its scope,
+        and send them together once the results of one of them are needed.
+        Results are thus best read once all the queries of the batch are issued.
+        """
+        if env.request.query_batch is not None:
+            yield
+            return
+
+        env.request.query_batch = QueryBatch(self._get_budget())
+        try:
+            yield
+        finally:
+            env.request.query_batch = None
+
+    @staticmethod
+    def _get_budget():
+        # Requests outside of the web interface (crontab, CLI) have no time limit
+        return env.request.query_budget or QueryBudget()
+
+    def _get_values(self, backend, o, distinct, limit, offset, with_total, **kwargs):
+        if with_total:
+            try:
+                return backend.get_values_total(o.parsed_paths, o.criteria, distinct, limit, offset, **kwargs)
+            except error.NotImplementedError:
+                # Whatever total the backend may provide, it does not follow the with_total semantics
+                results = backend.get_values(o.parsed_paths, o.criteria, distinct, limit, offset, **kwargs)
+                results.total = None
+                return results
+
+        return backend.get_values(o.parsed_paths, o.criteria, distinct, limit, offset, **kwargs)
+
+    def query(self, paths, criteria=None, distinct=False, limit=-1, offset=0, type=None, with_total=False, **kwargs):
+        """
+        Retrieve the values of the given paths.
+
+        When with_total is set, backends able to do so also compute the total
+        number of matching rows (or groups), available through the total attribute
+        of the result. The attribute is None for the other backends.
+        """
         self._check_limit_offset(limit, offset)
         o = self._normalize(type, paths, criteria)
 
-        start = time.time()
-        results = self._backends[o.type].get_values(o.parsed_paths, o.criteria, distinct, limit, offset, **kwargs)
-        results.duration = time.time() - start
+        with profiling.span("dataprovider", backend=o.type, paths=o.paths) as span, self._get_budget().run():
+            start = time.time()
+            results = self._get_values(self._backends[o.type], o, distinct, limit, offset, with_total, **kwargs)
+            results.duration = time.time() - start
+            span.set(rows=results._count)
 
         results._paths = o.paths
         results._paths_types = o.paths_types
@@ -759,11 +1136,42 @@ class DataProviderManager(pluginmanager.PluginManager):
     def get(self, criteria=None, order_by=["{backend}.{time_field}/order_desc"], limit=-1, offset=0, type=None):
         self._check_limit_offset(limit, offset)
         o = self._normalize(type, order_by, criteria)
-        return self._backends[o.type].get(o.criteria, o.paths, limit, offset)
 
-    def delete(self, criteria=None, paths=None, type=None):
+        with self._get_budget().run():
+            return self._backends[o.type].get(o.criteria, o.paths, limit, offset)
+
+    def delete(self, criteria=None, paths=None, type=None, batch_size=None, batch_delay=0, progress=None):
+        """
+        Delete objects matching the given criteria.
+
+        When batch_size is given, objects are deleted by chunks of at most batch_size objects,
+        oldest first, waiting batch_delay seconds between two chunks. The progress callback,
+        if any, is called after each chunk with the total number of deleted objects.
+        Backends not supporting batched deletion delete everything at once.
+        """
         o = self._normalize(type, paths, criteria)
-        return self._backends[o.type].delete(o.criteria, o.parsed_paths)
+        backend = self._backends[o.type]
+
+        if not batch_size:
+            return backend.delete(o.criteria, o.parsed_paths)
+
+        try:
+            count = total = backend.delete_batch(o.criteria, o.parsed_paths, batch_size)
+        except error.NotImplementedError:
+            return backend.delete(o.criteria, o.parsed_paths)
+
+        while True:
+            if progress:
+                progress(total)
+
+            if count < batch_size:
+                return total
+
+            if batch_delay:
+                time.sleep(batch_delay)
+
+            count = backend.delete_batch(o.criteria, o.parsed_paths, batch_size)
+            total += count
 
     @staticmethod
     def _resolve_values(paths, values):
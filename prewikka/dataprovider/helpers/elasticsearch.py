@@ -22,14 +22,22 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import datetime
 import dateutil.parser
+import errno
+import hashlib
+import os
 import re
 import requests
+import tempfile
+import threading
+import time
+import urllib3
+import zlib
 from collections import OrderedDict
 
-from prewikka import dataprovider, error, hookmanager
+from prewikka import dataprovider, error, hookmanager, siteconfig
 from prewikka.dataprovider import CriterionOperator, utils
 from prewikka.dataprovider.parsers import lucene
-from prewikka.utils import json, AttrObj
+from prewikka.utils import json, url as utils_url, AttrObj
 from prewikka.utils.timeutil import timezone, get_timestamp_from_datetime
 
 
@@ -46,6 +54,26 @@ _EXTRACT_MAP = {
 
 _TIME_GROUPBY = ("year", "quarter", "month", "week", "day", "hour", "minute", "second", "timestamp")
 
+# Additional time in seconds given to Elasticsearch to answer a query once its timeout is reached
+_HTTP_TIMEOUT_MARGIN = 5
+
+# Maximum number of buckets returned by an aggregation in a single response
+_MAX_BUCKETS = 10000
+
+# Default time in seconds after which the cached mapping of an index is downloaded again
+_MAPPING_TTL = 3600
+
+# Default and maximum time in seconds during which a node that could not be reached is skipped
+_NODE_BACKOFF = 30
+_NODE_MAX_BACKOFF = 600
+
+# Instance settings, as opposed to the field mapping
+_CONFIG_KEYS = ("es_url", "es_user", "es_pass", "es_cert", "es_privkey", "es_cacert", "es_type", "es_timeformat", "es_mapping_ttl",
+                "es_pool_size", "es_keepalive", "es_response_compression", "es_request_compression", "es_nodes", "es_node_backoff")
+
+# Methods that can be sent again to another node when the connection is lost after sending them
+_IDEMPOTENT_METHODS = ("GET", "HEAD")
+
 
 class ReconstructTransformer(lucene.ReconstructTransformer):
     def __init__(self, mapping, type=None):
@@ -115,11 +143,175 @@ class ElasticsearchInstance(dataprovider.DataProviderInstance):
             # cannot be more than index.max_result_window, which default to 10000
             limit = 10000
 
+        batch = env.request.query_batch
+        if batch is not None:
+            return self._client.query_deferred(batch, paths, criteria, limit, offset, highlight)
+
         results = self._client.query(paths, criteria, limit, offset, highlight)
 
         return results.api_results
 
 
+class _MappingCache(object):
+    """
+    Flattened field mapping of an index, stored in a file shared by all the processes.
+
+    The mapping is only downloaded with fetch when the file does not exist yet. Once the
+    file is older than ttl seconds, the mapping is downloaded again in the background
+    and the new fields are given to on_update.
+    """
+
+    def __init__(self, path, fetch, ttl, on_update=None):
+        self._path = path
+        self._fetch = fetch
+        self._ttl = ttl
+        self._on_update = on_update
+        self._lock = threading.Lock()
+        self._thread = None
+        self._mtime = 0
+
+    @staticmethod
+    def _to_fields(types):
+        return dict((field, AttrObj(type=type, keyword=type == "keyword")) for field, type in types.items())
+
+    def _read(self):
+        with open(self._path) as fd:
+            fields = self._to_fields(json.load(fd))
+
+        self._mtime = os.path.getmtime(self._path)
+        return fields
+
+    def _write(self, fields):
+        self._mtime = time.time()
+        dirname = os.path.dirname(self._path)
+
+        try:
+            os.mkdir(dirname, 0o700)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                env.log.warning("could not create the Elasticsearch mapping cache directory: %s" % err)
+                return
+
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, "w") as tmp:
+                json.dump(dict((field, value.type) for field, value in fields.items()), tmp)
+
+            # Readers from the other processes see either the old or the new file
+            os.rename(tmpname, self._path)
+        except (IOError, OSError) as err:
+            env.log.warning("could not store the Elasticsearch mapping in %s: %s" % (self._path, err))
+
+    def _is_stale(self):
+        return time.time() - self._mtime >= self._ttl
+
+    def load(self):
+        """Return the cached fields, downloading them when not cached yet"""
+        try:
+            fields = self._read()
+        except (IOError, OSError, ValueError):
+            fields = self._fetch()
+            self._write(fields)
+            return fields
+
+        self.refresh()
+        return fields
+
+    def refresh(self):
+        """Download the mapping again in the background if the cached one is stale"""
+        if not self._is_stale():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._thread = threading.Thread(target=self._refresh)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _refresh(self):
+        try:
+            # Another process may have refreshed the file already
+            fields = self._read()
+            if self._is_stale():
+                fields = self._fetch()
+                self._write(fields)
+
+            if self._on_update:
+                self._on_update(fields)
+        except Exception as err:
+            # The current fields are kept until the next attempt
+            self._mtime = time.time()
+            env.log.warning("could not refresh the Elasticsearch mapping: %s" % err)
+
+
+class _NodeUnreachableError(error.PrewikkaUserError):
+    pass
+
+
+def _is_connect_error(err):
+    """Return whether the request failed before anything could be sent to the node"""
+    if isinstance(err, requests.exceptions.ConnectTimeout):
+        return True
+
+    # requests wraps the urllib3 MaxRetryError, whose reason is the original error
+    reason = err.args[0] if err.args else None
+    reason = getattr(reason, "reason", reason)
+
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class _NodePool(object):
+    """
+    Send the requests to the nodes of a cluster in a round-robin fashion.
+
+    A node that cannot be reached is skipped for backoff seconds, this time
+    doubling with each consecutive failure up to _NODE_MAX_BACKOFF. When
+    every node is being skipped, the one skipped for the longest is tried.
+    """
+
+    def __init__(self, urls, backoff=_NODE_BACKOFF):
+        self._nodes = [AttrObj(url=url, failures=0, retry_at=0) for url in urls]
+        self._backoff = backoff
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _get_nodes(self):
+        with self._lock:
+            index = self._index
+            self._index = (index + 1) % len(self._nodes)
+
+        now = time.time()
+        nodes = self._nodes[index:] + self._nodes[:index]
+
+        alive = [node for node in nodes if node.retry_at <= now]
+        return alive or sorted(nodes, key=lambda node: node.retry_at)[:1]
+
+    def _set_failed(self, node, err):
+        node.failures += 1
+        node.retry_at = time.time() + min(self._backoff * 2 ** (node.failures - 1), _NODE_MAX_BACKOFF)
+        env.log.warning("Elasticsearch node %s is unreachable, skipping it: %s" % (node.url, err))
+
+    def run(self, func):
+        """Call func with the URL of a node, trying the next nodes as long as it cannot be reached"""
+        for node in self._get_nodes():
+            try:
+                ret = func(node.url)
+            except _NodeUnreachableError as err:
+                last_error = err
+                self._set_failed(node, err)
+                continue
+
+            node.failures = node.retry_at = 0
+            return ret
+
+        raise last_error
+
+
 class ElasticsearchClient(object):
     def __init__(self, name, conf):
         self._type = conf.es_type
@@ -129,24 +321,74 @@ class ElasticsearchClient(object):
         self._cert = conf.get("es_cert")
         self._privkey = conf.get("es_privkey")
         self._cacert = conf.get("es_cacert")
+        self._compress_requests = conf.get_bool("es_request_compression", False)
+
+        self._nodes = _NodePool(self._get_node_urls(conf.get("es_nodes")), conf.get_int("es_node_backoff", _NODE_BACKOFF))
+
+        pool_size = conf.get_int("es_pool_size", requests.adapters.DEFAULT_POOLSIZE)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self._nodes), pool_maxsize=pool_size)
+
         self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
         self._session.headers["content-type"] = "application/json"
+        self._session.headers["accept-encoding"] = "gzip" if conf.get_bool("es_response_compression", True) else "identity"
+        if not conf.get_bool("es_keepalive", True):
+            self._session.headers["connection"] = "close"
 
         # Check if Elasticsearch instance is available
-        req = self._request(self._host.rsplit("/", 1)[0], method="GET").json()
+        req = self._nodes.run(lambda url: self._request(url.rsplit("/", 1)[0], method="GET")).json()
         self._version = tuple(int(i) for i in req["version"]["number"].split("."))
         if self._version < (5,):
             raise error.PrewikkaUserError(N_("Invalid configuration"),
                                           N_("Elasticsearch version %s is not supported.", req["version"]["number"]))
 
-        self._mapping = ElasticsearchMap(self._type, conf, self.get_mapping())
+        self._mapping_cache = None
+        ttl = conf.get_int("es_mapping_ttl", _MAPPING_TTL)
+        if ttl > 0:
+            self._mapping_cache = _MappingCache(self._get_mapping_cache_path(), self.get_mapping, ttl, on_update=self._set_fields)
+            fields = self._mapping_cache.load()
+        else:
+            fields = self.get_mapping()
+
+        self._mapping = ElasticsearchMap(self._type, conf, fields)
+
+    def _get_node_urls(self, nodes):
+        """Return the URL of es_url on each of the nodes, given as a comma-separated list of base URLs"""
+        if not nodes:
+            return [self._host]
+
+        # es_url path may itself contain commas, when several indices are queried
+        path = utils_url.urlsplit(self._host).path
+        return [node.strip().rstrip("/") + path for node in nodes.split(",") if node.strip()]
+
+    def _get_mapping_cache_path(self):
+        # The indices and their mapping depend on the queried URL and on the user rights
+        fingerprint = hashlib.sha1(("%s\n%s\n%s\n%s" % (self._host, self._type, self._user, self._version)).encode("utf8"))
+        return os.path.join(siteconfig.tmp_dir, "elasticsearch", "%s.json" % fingerprint.hexdigest())
+
+    def _set_fields(self, fields):
+        mapping = getattr(self, "_mapping", None)
+        if mapping:
+            mapping.set_fields(fields)
 
     def request(self, path, data="", method="POST", **kwargs):
         """ Make a request and return the result """
-        return self._request(self._host + path, data, method, **kwargs)
+        return self._nodes.run(lambda url: self._request(url + path, data, method, **kwargs))
+
+    def _compress(self, data, kwargs):
+        if not self._compress_requests or not data:
+            return data
+
+        kwargs["headers"] = dict(kwargs.get("headers", {}), **{"content-encoding": "gzip"})
+
+        # gzip format, as expected with this content-encoding
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data.encode("utf8")) + compressor.flush()
 
     def _request(self, url, data="", method="POST", **kwargs):
         try:
+            data = self._compress(data, kwargs)
             if self._user:
                 kwargs['auth'] = (self._user, self._password)
             if self._cacert:
@@ -158,6 +400,15 @@ class ElasticsearchClient(object):
                     kwargs['cert'] = self._cert
 
             result = self._session.request(method, url, data=data, **kwargs)
+        except requests.exceptions.ReadTimeout as err:
+            raise dataprovider.QueryTimeoutError(details=err)
+        except requests.exceptions.ConnectionError as err:
+            # A request that may have reached the node is not sent again to another node,
+            # unless it has no side effect
+            if _is_connect_error(err) or method.upper() in _IDEMPOTENT_METHODS:
+                raise _NodeUnreachableError(N_("Request error"), err)
+
+            raise error.PrewikkaUserError(N_("Request error"), err)
         except requests.exceptions.RequestException as err:
             raise error.PrewikkaUserError(N_("Request error"), err)
 
@@ -210,11 +461,114 @@ class ElasticsearchClient(object):
 
         raise error.PrewikkaUserError(N_("Request error"), err)
 
+    def _prepare_search(self, path, criteria, limit, offset, highlight):
+        if self._mapping_cache:
+            self._mapping_cache.refresh()
+
+        # Composite aggregations can be paged through since Elasticsearch 6.3
+        search = ElasticsearchQuery(self._type, self._mapping, path, criteria, limit, offset, highlight,
+                                    allow_composite=self._version >= (6, 3))
+
+        kwargs = {}
+        timeout = dataprovider.get_query_timeout()
+        if timeout:
+            # Elasticsearch returns the results collected so far once the timeout is reached,
+            # the HTTP request is only aborted when Elasticsearch does not answer in time
+            search.get_query()["timeout"] = "%dms" % max(1, int(timeout * 1000))
+            kwargs["timeout"] = timeout + _HTTP_TIMEOUT_MARGIN
+
+        return search, kwargs
+
+    def _search(self, search, **kwargs):
+        """Send search and return its response, holding all the needed buckets of its composite aggregation"""
+        response = self.request("/_search", search.get_json_query(), **kwargs).json()
+        if not search.composite:
+            return response
+
+        aggregation = response.get("aggregations", {}).get("internal_1", {})
+        buckets = aggregation.get("buckets", [])
+
+        while aggregation.get("buckets") and aggregation.get("after_key") and len(buckets) < search.composite.count:
+            if response.get("timed_out"):
+                break
+
+            search.set_composite_page(aggregation["after_key"], search.composite.count - len(buckets))
+            page = self.request("/_search", search.get_json_query(), **kwargs).json()
+
+            aggregation = page.get("aggregations", {}).get("internal_1", {})
+            buckets.extend(aggregation.get("buckets", []))
+            response["timed_out"] = page.get("timed_out", False)
+
+        return response
+
     def query(self, path, criteria, limit=50, offset=0, highlight=None):
-        search = ElasticsearchQuery(self._type, self._mapping, path, criteria, limit, offset, highlight)
-        results = self.request("/_search", search.get_json_query())
+        search, kwargs = self._prepare_search(path, criteria, limit, offset, highlight)
+
+        return ElasticsearchResult(self._mapping, self._search(search, **kwargs), search, limit)
+
+    def query_deferred(self, batch, path, criteria, limit=50, offset=0, highlight=None):
+        """Return the QueryResults of a search sent along with the other pending searches of batch"""
+        search, kwargs = self._prepare_search(path, criteria, limit, offset, highlight)
+        if search.composite:
+            # Paging through a composite aggregation takes several requests
+            return ElasticsearchResult(self._mapping, self._search(search, **kwargs), search, limit).api_results
+
+        results = _DeferredQueryResults(batch, search, limit, kwargs.get("timeout"))
+        batch.add(self._msearch, results)
+
+        return results
+
+    @staticmethod
+    def _is_complete(response):
+        if not response or "error" in response:
+            return False
 
-        return ElasticsearchResult(self._mapping, results.json(), search, limit)
+        shards = response.get("_shards", {})
+        return shards.get("total", 0) - shards.get("skipped", 0) - shards.get("failed", 0) > 0
+
+    def _msearch(self, pending):
+        """
+        Send the searches of the pending deferred results with a single _msearch request.
+
+        Failed searches are sent again on their own, to get the usual error handling.
+        Searches that timed out are not: like with _search, their partial results are
+        kept, and a timeout of the whole request is the error of every search.
+        """
+        start = time.time()
+        responses = []
+
+        if len(pending) > 1:
+            kwargs = {"headers": {"content-type": "application/x-ndjson"}}
+
+            timeouts = [results.http_timeout for results in pending]
+            if None not in timeouts:
+                kwargs["timeout"] = max(timeouts)
+
+            # The index is part of the URL, hence the empty headers
+            body = "".join("{}\n%s\n" % results.search.get_json_query() for results in pending)
+            try:
+                responses = self.request("/_msearch", body, **kwargs).json()["responses"]
+            except dataprovider.QueryTimeoutError as err:
+                for results in pending:
+                    results.set_error(err)
+
+                return
+            except (error.PrewikkaUserError, KeyError) as err:
+                env.log.warning("Elasticsearch multi-search failed, sending the searches one by one: %s" % err)
+
+        for i, results in enumerate(pending):
+            response = responses[i] if i < len(responses) else None
+
+            try:
+                if not self._is_complete(response):
+                    kwargs = {"timeout": results.http_timeout} if results.http_timeout else {}
+                    response = self._search(results.search, **kwargs)
+
+                results.set_result(ElasticsearchResult(self._mapping, response, results.search, results.limit))
+            except Exception as err:
+                results.set_error(err)
+
+            results.duration = time.time() - start
 
     def get_mapping(self, root=None, mapping=None, prefix=""):
         if mapping is None:
@@ -246,6 +600,69 @@ class ElasticsearchClient(object):
         return mapping
 
 
+class _DeferredQueryResults(dataprovider.QueryResults):
+    """
+    QueryResults of a search deferred within DataProviderManager.batch(), sent
+    along with the other pending searches of the batch when first accessed.
+    """
+
+    def __init__(self, batch, search, limit, http_timeout):
+        dataprovider.QueryResults.__init__(self, self._iterate())
+
+        self._batch = batch
+        self._result = None
+        self._error = None
+
+        self.search = search
+        self.limit = limit
+        self.http_timeout = http_timeout
+
+    def _init_attributes(self, total):
+        # Attributes not set by the caller come from the Elasticsearch result
+        self._attributes = {}
+
+    def set_result(self, result):
+        self._result = result
+
+    def set_error(self, err):
+        self._error = err
+
+    def _get_result(self):
+        if self._result is None and self._error is None:
+            self._batch.flush()
+
+        if self._error is not None:
+            raise self._error
+
+        return self._result
+
+    def _iterate(self):
+        for row in self._get_result().rows:
+            yield row
+
+    def _get_attribute(self, name):
+        if name not in self._attributes:
+            self._attributes[name] = getattr(self._get_result().api_results, name)
+
+        return self._attributes[name]
+
+    @property
+    def total(self):
+        return self._get_attribute("total")
+
+    @total.setter
+    def total(self, value):
+        self._attributes["total"] = value
+
+    @property
+    def partial(self):
+        return self._get_attribute("partial")
+
+    @partial.setter
+    def partial(self, value):
+        self._attributes["partial"] = value
+
+
 class ElasticsearchQuery(object):
     # Case depends on Elasticsearch configuration, we can not handle this here for now
     # Default configuration is to lowercase
@@ -262,9 +679,11 @@ class ElasticsearchQuery(object):
         CriterionOperator.REGEX_NOCASE: ("must", "regexp"),
         CriterionOperator.NOT_REGEX: ("must_not", "regexp"),
         CriterionOperator.NOT_REGEX_NOCASE: ("must_not", "regexp"),
+        CriterionOperator.IN: ("must", "terms"),
+        CriterionOperator.NOT_IN: ("must_not", "terms"),
     }
 
-    def __init__(self, type, mapping, path, criteria, limit=50, offset=0, highlight=None):
+    def __init__(self, type, mapping, path, criteria, limit=50, offset=0, highlight=None, allow_composite=True):
         self._type = type
         self._mapping = mapping
         self.path = path
@@ -273,6 +692,12 @@ class ElasticsearchQuery(object):
         self.offset = offset
         self._final_order = []
         self.highlight = highlight
+        self._allow_composite = allow_composite
+
+        # Number of aggregated rows to skip once retrieved, and composite aggregation
+        # (group_by sources, metrics and number of buckets) to page through if any
+        self.row_offset = 0
+        self.composite = None
         default_field = self._mapping.to_es("default_field")
 
         if default_field == 'default_field':
@@ -422,8 +847,104 @@ class ElasticsearchQuery(object):
         self._set_paths_func(paths, group_by)
         self._final_order = sorted(self._final_order, key=lambda x: x.idx)
 
-        if group_by and self.offset:
-            self._add_offset()
+        if group_by:
+            self._set_buckets(group_by)
+
+    def _get_buckets_order(self, group_by):
+        """
+        Return the order of the buckets of each group_by aggregation giving the rows
+        in their final order, or None if Elasticsearch cannot return them this way.
+        """
+        if any(g.field in _TIME_GROUPBY for g in group_by):
+            return None
+
+        levels = [[] for g in group_by]
+        level = 0
+
+        for obj in self._final_order:
+            if not obj.order:
+                continue
+
+            if 0 <= obj.index < len(group_by):
+                new_level, key = obj.index, "_key"
+            elif obj.index >= len(group_by):
+                # Metrics are computed within the buckets of the last aggregation
+                new_level, key = len(group_by) - 1, "internal_%d" % (obj.index + 1)
+            else:
+                return None
+
+            # Nested buckets give rows sorted by the first aggregation, then by the second one...
+            if new_level != level and not (new_level == level + 1 and levels[level]):
+                return None
+
+            level = new_level
+            levels[level].append({key: obj.order})
+
+        return levels
+
+    def _set_buckets(self, group_by):
+        levels = self._get_buckets_order(group_by)
+        if levels is None:
+            # All the buckets are retrieved, then sorted and truncated
+            self.row_offset = self.offset
+            return
+
+        count = self.offset + self.limit
+        if count > _MAX_BUCKETS and self._allow_composite and all(len(order) == 1 and "_key" in order[0] for order in levels):
+            return self._set_composite(levels)
+
+        query = self._query
+        for i, order in enumerate(levels):
+            query = query["aggs"]["internal_%d" % (i + 1)]
+            query["terms"]["order"] = order or [{"_count": "desc"}]
+            query["terms"]["size"] = min(count, _MAX_BUCKETS)
+
+        if not self.offset:
+            return
+
+        if len(levels) > 1:
+            self.row_offset = self.offset
+        else:
+            query.setdefault("aggs", {})["bucket_truncate"] = {
+                "bucket_sort": {
+                    "from": self.offset,
+                    "size": self.limit
+                }
+            }
+
+    def _set_composite(self, levels):
+        # A terms aggregation cannot return that many buckets,
+        # a composite aggregation is paged through instead
+        sources = []
+        query = self._query
+        for i, order in enumerate(levels):
+            name = "internal_%d" % (i + 1)
+            query = query["aggs"][name]
+            sources.append({name: {"terms": {"field": query["terms"]["field"], "order": order[0]["_key"]}}})
+
+        metrics = query.get("aggs", {})
+        count = self.offset + self.limit
+
+        self._query["aggs"] = {
+            "internal_1": {
+                "composite": {
+                    "size": min(count, _MAX_BUCKETS),
+                    "sources": sources
+                },
+                "aggs": metrics
+            }
+        }
+
+        self.row_offset = self.offset
+        self.composite = AttrObj(keys=[next(iter(source)) for source in sources],
+                                 metrics=sorted(metrics, key=lambda name: int(name[9:])),
+                                 count=count)
+
+    def set_composite_page(self, after_key, size):
+        """Make the query return the size composite buckets following after_key"""
+        composite = self._query["aggs"]["internal_1"]["composite"]
+        composite["after"] = after_key
+        composite["size"] = min(size, _MAX_BUCKETS)
 
     def _set_criteria_op(self, typ, criteria, query):
         for term in (criteria.left, criteria.right):
@@ -449,6 +970,9 @@ class ElasticsearchQuery(object):
         if criteria.operator == CriterionOperator.OR:
             return self._set_criteria_op("should", criteria, query)
 
+        if criteria.operator.is_set:
+            return self._set_criteria_set(criteria, query)
+
         field = criteria.left.rsplit(".", 1)[-1]
         if field == "_raw_query":
             self._add_raw_query(criteria.right)
@@ -470,6 +994,28 @@ class ElasticsearchQuery(object):
 
             return query
 
+    def _set_criteria_set(self, criteria, query):
+        multi = isinstance(criteria.left, tuple)
+        fields = [path.rsplit(".", 1)[-1] for path in (criteria.left if multi else (criteria.left,))]
+
+        if multi:
+            filters = [{"bool": {"must": [self._equal_filter(field, value) for field, value in zip(fields, row)]}} for row in criteria.right]
+        else:
+            values = [value for value in criteria.right if value is not None]
+            filters = [self._terms_filter(fields[0], values)] if values else []
+            if len(values) != len(criteria.right):
+                filters.append(self._equal_filter(fields[0], None))
+
+        op = self.OPERATOR_MAP[criteria.operator][0]
+        if not filters:
+            if not criteria.operator.negated:
+                query["bool"]["must_not"].append({"match_all": {}})
+
+            return query
+
+        query["bool"][op].append(filters[0] if len(filters) == 1 else {"bool": {"should": filters}})
+        return query
+
     def _add_raw_query(self, query):
         if self._query_string["query_string"]["query"]:
             raise error.PrewikkaError(N_("Only one _raw_query path can be specified for the selection"), N_("Elasticsearch database path selection error"))
@@ -502,14 +1048,6 @@ class ElasticsearchQuery(object):
         query, index = self._get_aggs_last_index(None, 1)
         query["aggs"] = self._format_aggregate(field.field, "terms", index, field.order)
 
-    def _add_offset(self):
-        self._query["aggs"]["internal_1"]["aggs"]["bucket_truncate"] = {
-            "bucket_sort": {
-                "from": self.offset,
-                "size": self.limit
-            }
-        }
-
     def _format_aggregate(self, field, func, index=1, order=None):
         if field in _TIME_GROUPBY:
             func = "time"
@@ -550,6 +1088,17 @@ class ElasticsearchQuery(object):
             "term": {self._mapping.to_es_keyword(field): value}
         }
 
+    def _terms_filter(self, field, values):
+        return {
+            "terms": {self._mapping.to_es_keyword(field): values}
+        }
+
+    def _equal_filter(self, field, value):
+        if value is None:
+            return {"bool": {"must_not": [self._exists_filter(field)]}}
+
+        return self._term_filter(field, value)
+
     def _contains_filter(self, field, value):
         return {
             "wildcard": {self._mapping.to_es_keyword(field): "*%s*" % value}
@@ -564,7 +1113,7 @@ class ElasticsearchQuery(object):
         return {
             "terms": {
                 "field": self._mapping.to_es_keyword(field),
-                "size": 10000,
+                "size": _MAX_BUCKETS,
                 "order": {
                     "_count": order or "desc"
                 }
@@ -654,20 +1203,27 @@ class ElasticsearchResult(object):
             # For Elasticsearch >= 7
             self.total_result = self.total_result["value"]
 
-        self.api_results = dataprovider.QueryResults(self._get_rows())
+        self.rows = self._get_rows()
+        self.api_results = dataprovider.QueryResults(self.rows)
         self.api_results.total = self.total_result
+        self.api_results.partial = bool(result.get("timed_out"))
 
     def _get_rows(self):
         rows = []
         if self._query._query["size"] == 0:
-            rows = self._aggregations_to_rows(self._manage_aggregations())
+            if self._query.composite:
+                rows = self._composite_to_rows()
+            else:
+                rows = self._aggregations_to_rows(self._manage_aggregations())
+
             for obj in reversed(self._query._final_order):
                 if obj.order:
                     # Multiple sorts work here because sorting is stable
                     rows.sort(key=lambda x: x[obj.idx], reverse=obj.order == "desc")
 
             # Truncate the results since Elasticsearch limits are per bucket
-            rows = rows[:self._limit]
+            offset = self._query.row_offset
+            rows = rows[offset:offset + self._limit]
 
             # When aggregating, Elasticsearch set ["hits"]["total"] to the sum of all
             # values and not the number of aggregations
@@ -726,6 +1282,17 @@ class ElasticsearchResult(object):
 
         return rows
 
+    def _composite_to_rows(self):
+        rows = []
+        composite = self._query.composite
+
+        for bucket in self._result.get("aggregations", {}).get("internal_1", {}).get("buckets", []):
+            keys = [bucket["key"][name] for name in composite.keys]
+            values = [bucket[name]["value"] for name in composite.metrics] or [bucket.get("doc_count", 0)]
+            rows.append(self._ordered_row(keys + values))
+
+        return rows
+
     def _manage_aggregations(self, aggs=None, index=1):
         # If the query is just "count(1)"
         if aggs is None and "aggregations" not in self._result:
@@ -878,14 +1445,17 @@ class ElasticsearchMap(object):
 
         self._mapping, self._group_mapping = self._get_mapping(conf)
         self._reverse_mapping = dict((v, k) for k, v in self._mapping.items())
+        self.set_fields(fields)
 
+    def set_fields(self, fields):
+        """Register the type of the configured paths according to the Elasticsearch fields"""
         for field, es_field in self._mapping.items():
-            if field in self._DEFAULT_CONF[name] or field == "default_field":
+            if field in self._DEFAULT_CONF[self.name] or field == "default_field":
                 continue
 
             es_type = fields[es_field].type if es_field in fields else None
             type_ = self._REVERSED_TYPES.get(es_type, text_type)
-            env.dataprovider.register_path("%s.%s" % (name, field), type_)
+            env.dataprovider.register_path("%s.%s" % (self.name, field), type_)
 
     def format_datetime(self, dt):
         if not self.time_format:
@@ -907,7 +1477,7 @@ class ElasticsearchMap(object):
 
             key = key.lower()
 
-            if key in ["es_url", "es_user", "es_pass", "es_type", "es_timeformat"]:
+            if key in _CONFIG_KEYS:
                 continue
 
             value = value.split(", ", 1)
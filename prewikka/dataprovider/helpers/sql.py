@@ -23,10 +23,11 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import collections
 import copy
+import math
 import re
 
 from prewikka import error
-from prewikka.dataprovider import COMPOSITE_TIME_FIELD, Criterion, CriterionOperator
+from prewikka.dataprovider import COMPOSITE_TIME_FIELD, Criterion, CriterionOperator, QueryResults, get_query_timeout
 from prewikka.dataprovider.pathparser import _Path, SelectionObject, STRING_INDEX_REGEX
 
 
@@ -77,8 +78,8 @@ _OPERATORS = {
     # SQLite doesn't support case-insensitive comparison for unicode characters by default
     # (See https://www.sqlite.org/faq.html#q18)
     "sqlite": {
-        CriterionOperator.EQUAL: "%s(left)s = %(right)s",
-        CriterionOperator.EQUAL_NOCASE: "%s(left)s = %(right)s",
+        CriterionOperator.EQUAL: "%(left)s = %(right)s",
+        CriterionOperator.EQUAL_NOCASE: "%(left)s = %(right)s",
         CriterionOperator.NOT_EQUAL: "%(left)s != %(right)s",
         CriterionOperator.NOT_EQUAL_NOCASE: "%(left)s != %(right)s",
     },
@@ -136,6 +137,10 @@ _FUNCTIONS_MAP = {
         "date": "TIMESTAMP('{0}')",
         "add_date": "DATE_ADD({0}, '{1}')",
         "sub_date": "DATE_SUB({0}, '{1}')",
+        "seconds_diff": "TIMESTAMPDIFF(MICROSECOND, {1}, {0}) / 1000000",
+        "floor": "FLOOR({0})",
+        "greatest": "GREATEST({0}, {1})",
+        "least": "LEAST({0}, {1})",
     },
 
     "pgsql": {
@@ -143,6 +148,10 @@ _FUNCTIONS_MAP = {
         "date": "TIMESTAMP '{0}'",
         "add_date": "{0} + INTERVAL '{1}'",
         "sub_date": "{0} - INTERVAL '{1}'",
+        "seconds_diff": "EXTRACT(EPOCH FROM {0} - {1})",
+        "floor": "CAST(FLOOR({0}) AS BIGINT)",
+        "greatest": "GREATEST({0}, {1})",
+        "least": "LEAST({0}, {1})",
     },
 
     "sqlite": {
@@ -150,6 +159,11 @@ _FUNCTIONS_MAP = {
         "date": "datetime('{0}')",
         "add_date": "datetime({0}, '+{1}')",
         "sub_date": "datetime({0}, '-{1}')",
+        "seconds_diff": "(julianday({0}) - julianday({1})) * 86400",
+        # Truncation instead of flooring only widens the bucket ranges below
+        "floor": "CAST({0} AS INTEGER)",
+        "greatest": "MAX({0}, {1})",
+        "least": "MIN({0}, {1})",
     },
 }
 
@@ -167,6 +181,19 @@ _TIME_UNITS = {
     "usec": (8, "usec"),
 }
 
+# Duration in seconds of the time units having a fixed length
+_UNIT_SECONDS = {
+    "day": 86400,
+    "hour": 3600,
+    "min": 60,
+    "sec": 1,
+    "msec": 0.001,
+    "usec": 0.000001,
+}
+
+# Up to this number of intervals, matching every row against every interval is cheap enough
+_CTE_MAX_INTERVALS = 32
+
 _SPECIAL_TABLES = set(["_intervals", "_main"])
 
 
@@ -190,6 +217,10 @@ class SQLQuery(object):
         self.select = []
         self.joins = []
         self.joined = [base_table]
+        # Tables for which an INNER JOIN gives the same rows as a LEFT JOIN
+        self.inner = set()
+        # Criteria rendered as EXISTS subqueries, and the tables they are run on
+        self.exists = {}
         self.where = None
         self.group_by = []
         self.order_by = []
@@ -197,12 +228,15 @@ class SQLQuery(object):
         self.limit = limit
         self.offset = offset
 
+    def get_joins(self):
+        return ["%s JOIN %s ON %s" % ("INNER" if table in self.inner else "LEFT", expr, condition) for expr, condition, table in self.joins]
+
     def __str__(self):
         query = "SELECT %s %s FROM %s %s" % (
             "DISTINCT" if self.distinct else "",
             ", ".join(self.select),
             "%s AS t0" % self.base_table,
-            " ".join("LEFT JOIN %s ON %s" % (table, condition) for table, condition in self.joins),
+            " ".join(self.get_joins()),
         )
 
         if self.where:
@@ -218,7 +252,7 @@ class SQLQuery(object):
 
 
 class SQLBuilder(object):
-    def __init__(self, paths_map, tables, joins, handle_wildcards=False, db=None, time_paths=()):
+    def __init__(self, paths_map, tables, joins, handle_wildcards=False, db=None, time_paths=(), max_duration=None):
         self._paths_map = paths_map
         self._tables = tables
         self._base_table = tables[0]
@@ -227,6 +261,9 @@ class SQLBuilder(object):
         self._joins = joins
         self._time_paths = time_paths
 
+        # Usual maximum duration in seconds of the objects having a composite time field, if known
+        self._max_duration = max_duration
+
         self._init_relations()
 
         self._reverse_paths_map = dict((v, k) for k, v in paths_map.items())
@@ -339,7 +376,54 @@ class SQLBuilder(object):
         # This method expects all timestamps stored in the database to be in UTC.
         return _EXTRACTION[self._db.get_type()][selection.extract] % selected
 
+    def _process_set_value(self, value):
+        ret = self._process_value(value)
+
+        # Same case-sensitivity as the mysql EQUAL operator
+        if self._db.get_type() == "mysql" and isinstance(value, text_type):
+            return "BINARY %s" % ret
+
+        return ret
+
+    def _process_set_criterion(self, criterion, aliases):
+        multi = isinstance(criterion.left, tuple)
+        paths = criterion.left if multi else (criterion.left,)
+        rows = criterion.right if multi else [(value,) for value in criterion.right]
+        columns = [self._process_path(path, aliases) for path in paths]
+
+        values = []
+        null_terms = []
+        for row in rows:
+            if not any(value is None for value in row):
+                values.append(row)
+                continue
+
+            # NULL never matches an IN list: such rows are tested separately
+            null_terms.append(" AND ".join(
+                (_OPERATORS["special"][CriterionOperator.EQUAL] % {"left": column}) if value is None else
+                "%s = %s" % (column, self._process_set_value(value)) for column, value in zip(columns, row)
+            ))
+
+        terms = []
+        if values:
+            lhs = "(%s)" % ", ".join(columns) if multi else columns[0]
+            rhs = [", ".join(text_type(self._process_set_value(value)) for value in row) for row in values]
+            if multi:
+                rhs = ["(%s)" % row for row in rhs]
+
+            terms.append("%s %s (%s)" % (lhs, "NOT IN" if criterion.operator.negated else "IN", ", ".join(rhs)))
+
+        if criterion.operator.negated:
+            terms += ["NOT (%s)" % term for term in null_terms]
+            return "(%s)" % " AND ".join(terms) if terms else "1 = 1"
+
+        terms += ["(%s)" % term for term in null_terms]
+        return "(%s)" % " OR ".join(terms) if terms else "1 = 0"
+
     def _process_criterion(self, criterion, aliases):
+        if criterion.operator.is_set:
+            return self._process_set_criterion(criterion, aliases)
+
         lhs = self._process_path(criterion.left, aliases)
         rhs = self._process_value(criterion.right)
 
@@ -389,7 +473,8 @@ class SQLBuilder(object):
                 path, value = string_index
                 join_crit.append("%s = %s" % (self._process_path(path, query.joined), self._db.escape(value)))
 
-            query.joins.append(("%s AS %s" % (dest, alias_dest), " AND ".join(join_crit)))
+            # String-indexed joins are never turned into INNER JOINs
+            query.joins.append(("%s AS %s" % (dest, alias_dest), " AND ".join(join_crit), None if string_index else dest))
 
     def _process_selection(self, paths, query, with_aliases=True):
         for i, selection in enumerate(paths):
@@ -403,6 +488,10 @@ class SQLBuilder(object):
         if not criteria:
             return
 
+        branch = query.exists.get(id(criteria))
+        if branch:
+            return self._process_exists(criteria, branch, query)
+
         if criteria.operator == CriterionOperator.NOT:
             return "NOT(%s)" % self._process_criteria(criteria.right, query, with_aliases)
 
@@ -410,6 +499,12 @@ class SQLBuilder(object):
             op = " AND " if criteria.operator == CriterionOperator.AND else " OR "
             return "(%s)" % op.join(self._process_criteria(term, query, with_aliases) for term in (criteria.left, criteria.right))
 
+        if isinstance(criteria.left, tuple):
+            for path in criteria.left:
+                self._add_join(self._paths_map[path][0], query)
+
+            return self._process_criterion(criteria, query.joined if with_aliases else [])
+
         ret = self._handle_indexation_by_string(criteria, query, with_aliases)
         if ret:
             return ret
@@ -426,28 +521,303 @@ class SQLBuilder(object):
             return self._process_criteria(Criterion(path, criteria.operator, criteria.right),
                                           query, with_aliases)
 
-    def build_query(self, paths, criteria, distinct, limit, offset):
-        cte = False
+    @staticmethod
+    def _get_leaf_paths(criterion):
+        return criterion.left if isinstance(criterion.left, tuple) else (criterion.left,)
+
+    def _get_leaf_tables(self, criterion):
+        return set(self._paths_map[re.sub(STRING_INDEX_REGEX, "", path)][0] for path in self._get_leaf_paths(criterion))
+
+    def _is_string_indexed(self, criterion):
+        return any(re.search(STRING_INDEX_REGEX, path) for path in self._get_leaf_paths(criterion))
+
+    def _get_leaves(self, criteria):
+        if criteria.operator == CriterionOperator.NOT:
+            return self._get_leaves(criteria.right)
+
+        if criteria.operator.is_boolean:
+            return self._get_leaves(criteria.left) + self._get_leaves(criteria.right)
+
+        return [criteria]
+
+    def _get_conjuncts(self, criteria):
+        if criteria.operator == CriterionOperator.AND:
+            return self._get_conjuncts(criteria.left) + self._get_conjuncts(criteria.right)
+
+        return [criteria]
+
+    def _get_leaf_roots(self, criterion, query):
+        # For each table of the leaf, the first table of its join path which is not joined yet (if any)
+        roots = set()
+        for table in self._get_leaf_tables(criterion):
+            roots.add(next((t for t in self._join_paths[query.base_table].get(table, [])[1:] if t not in query.joined), None))
+
+        return roots
+
+    def _is_strict(self, criteria):
+        """Return True if the criteria cannot match a row whose columns are all NULL (eg. a failed LEFT JOIN)"""
+        if criteria.operator == CriterionOperator.NOT:
+            return False
+
+        if criteria.operator == CriterionOperator.AND:
+            return self._is_strict(criteria.left) or self._is_strict(criteria.right)
+
+        if criteria.operator == CriterionOperator.OR:
+            return self._is_strict(criteria.left) and self._is_strict(criteria.right)
+
+        if criteria.operator.is_set:
+            if criteria.operator.negated:
+                return bool(criteria.right)
+
+            rows = criteria.right if isinstance(criteria.left, tuple) else [(value,) for value in criteria.right]
+            return not any(value is None for row in rows for value in row)
+
+        return criteria.right is not None or criteria.operator == CriterionOperator.NOT_EQUAL
+
+    def _is_one_to_many(self, tables, query):
+        path = self._join_paths[query.base_table]
+        for table in tables:
+            chain = path[table]
+            for src, dest in zip(chain, chain[1:]):
+                if tuple(self._relations[src][dest]["dest_pkey"]) != tuple(dest.pkey or ()):
+                    return True
+
+        return False
+
+    def _find_units(self, criteria, query, units):
+        # Largest parts of the criteria (not below a NOT) depending on a single unjoined branch of tables
+        leaves = self._get_leaves(criteria)
+        roots = set()
+        for leaf in leaves:
+            roots |= self._get_leaf_roots(leaf, query)
+
+        if len(roots) == 1 and None not in roots and not any(self._is_string_indexed(leaf) for leaf in leaves):
+            units.setdefault(roots.pop(), []).append(criteria)
+
+        elif criteria.operator in (CriterionOperator.AND, CriterionOperator.OR):
+            self._find_units(criteria.left, query, units)
+            self._find_units(criteria.right, query, units)
+
+    def _plan_joins(self, criteria, query):
+        """
+        Choose how the tables only used by the criteria are joined.
+
+        A branch of tables used in a single part of the criteria (not below
+        a NOT) is checked through an EXISTS subquery when it may multiply the
+        rows, provided this part cannot match a missing row. Otherwise, the
+        tables are LEFT JOINed, or INNER JOINed when a top-level condition
+        cannot match a missing row of the table anyway.
+        """
+        if not criteria:
+            return
+
+        leaves = self._get_leaves(criteria)
+        path = self._join_paths[query.base_table]
+
+        units = {}
+        self._find_units(criteria, query, units)
+        for root, subtrees in units.items():
+            unit = subtrees[0]
+            unit_leaves = self._get_leaves(unit)
+
+            if len(subtrees) > 1 or not self._is_strict(unit):
+                continue
+
+            # Other conditions on these tables would have to match the same rows
+            if sum(1 for leaf in leaves if root in self._get_leaf_roots(leaf, query)) != len(unit_leaves):
+                continue
+
+            tables = set()
+            for leaf in unit_leaves:
+                tables |= self._get_leaf_tables(leaf)
+
+            if not self._is_one_to_many(tables, query):
+                continue
+
+            branch = []
+            for table in sorted(tables, key=lambda t: len(path[t])):
+                branch += [t for t in path[table][path[table].index(root):] if t not in branch]
+
+            query.exists[id(unit)] = branch
+
+        string_indexed = set()
+        for leaf in leaves:
+            if self._is_string_indexed(leaf):
+                string_indexed |= self._get_leaf_tables(leaf)
+
+        for term in self._get_conjuncts(criteria):
+            if id(term) in query.exists or not self._is_strict(term):
+                continue
+
+            tables = set()
+            for leaf in self._get_leaves(term):
+                tables |= self._get_leaf_tables(leaf)
+
+            if len(tables) == 1 and not tables & string_indexed:
+                query.inner.update(path.get(tables.pop(), [])[1:])
+
+    def _process_exists(self, criteria, branch, query):
+        aliases = list(query.joined)
+        joins = []
+
+        for dest in branch:
+            chain = self._join_paths[query.base_table][dest]
+            src = chain[-2]
+            alias_src = "t%d" % (len(aliases) - 1 - aliases[::-1].index(src))
+            aliases.append(dest)
+            alias_dest = "t%d" % (len(aliases) - 1)
+
+            fields = zip(self._relations[src][dest]["src_pkey"], self._relations[src][dest]["dest_pkey"])
+            joins.append(("%s AS %s" % (dest, alias_dest), " AND ".join("%s.%s = %s.%s" % (alias_src, i, alias_dest, j) for (i, j) in fields)))
+
+        # The criteria only refer to the tables of the branch, which are all joined in the subquery
+        subquery = SQLQuery(query.base_table)
+        subquery.joined = aliases
+
+        (first, correlation), joins = joins[0], joins[1:]
+        return "EXISTS (SELECT 1 FROM %s%s WHERE %s AND %s)" % (
+            first,
+            "".join(" LEFT JOIN %s ON %s" % join for join in joins),
+            correlation,
+            self._process_criteria(criteria, subquery)
+        )
+
+    def _process_where(self, criteria, query):
+        self._plan_joins(criteria, query)
+        return self._process_criteria(criteria, query)
+
+    def explain(self, paths, criteria):
+        """
+        Return a description of how the tables of the query on the given paths
+        are joined, followed by the query itself. Meant for debugging purposes.
+        """
+        query = self._prepare_query(paths, criteria)
+
+        ret = ["t0: %s (base table)" % query.base_table] + query.get_joins()
+
+        for branch in query.exists.values():
+            ret.append("EXISTS on %s (filter only)" % " -> ".join(text_type(table) for table in branch))
+
+        ret.append(text_type(query))
+        return "\n".join(ret)
+
+    def _is_cte_query(self, paths):
         for path in paths:
             p = path.get_path()
             if p and p.name == COMPOSITE_TIME_FIELD:
-                cte = True
-                break
+                return True
+
+        return False
+
+    def has_window_functions(self, paths=()):
+        """Return True if the query on the given paths can use window functions"""
+        return self._db.has_window_functions() and not self._is_cte_query(paths)
+
+    def build_query(self, paths, criteria, distinct, limit, offset, with_total=False, partition_by=(), partition_limit=-1):
+        """
+        Build a SELECT query on the given paths.
 
-        if cte:
+        If with_total is set, an additional last column holds the total number of
+        rows (or groups) matching the query regardless of limit and offset.
+
+        If partition_by (indexes of the partitioning paths) and partition_limit are
+        given, at most partition_limit rows are kept for each distinct value of the
+        partitioning paths, following the query order (top-N per group).
+
+        Both options rely on window functions, see has_window_functions().
+        """
+        if with_total or partition_by:
+            if not self.has_window_functions(paths):
+                raise error.NotImplementedError(message=N_("Window functions are not supported for this query"))
+
+        if self._is_cte_query(paths):
             return self._build_cte_query(paths, criteria, distinct, limit, offset)
         else:
-            return self._build_query(paths, criteria, distinct, limit, offset)
+            return self._build_query(paths, criteria, distinct, limit, offset, with_total, partition_by, partition_limit)
 
-    def _build_query(self, paths, criteria, distinct, limit, offset):
+    def _prepare_query(self, paths, criteria, distinct=False, limit=-1, offset=0):
         query = SQLQuery(self._get_base_table(paths), distinct=distinct, limit=limit, offset=offset)
 
         self._process_selection(paths, query)
-        query.where = self._process_criteria(criteria, query)
+        query.where = self._process_where(criteria, query)
+
+        return query
+
+    def _build_query(self, paths, criteria, distinct, limit, offset, with_total=False, partition_by=(), partition_limit=-1):
+        query = self._prepare_query(paths, criteria, distinct, limit, offset)
+
+        if with_total or partition_by:
+            return self._build_window_query(query, with_total, partition_by, partition_limit)
 
         return text_type(query)
 
-    def _build_cte_query(self, paths, criteria, distinct, limit, offset):
+    def _build_window_query(self, query, with_total, partition_by, partition_limit):
+        # The window functions apply to the whole (distinct, grouped) result,
+        # so the ordering and the pagination are moved to an outer query.
+        # Columns are referenced through their cN aliases from there on.
+        columns = ["_q.c%d" % i for i in range(len(query.select))]
+        order_by, limit, offset = query.order_by, query.limit, query.offset
+        query.order_by, query.limit, query.offset = [], -1, 0
+
+        source = "(%s) AS _q" % query
+        if partition_by:
+            order = []
+            for command in order_by:
+                index, direction = command.split()
+                order.append("%s %s" % (columns[int(index) - 1], direction))
+
+            source = "(SELECT _q.*, ROW_NUMBER() OVER (PARTITION BY %s%s) AS _rank FROM %s) AS _q WHERE _q._rank <= %d" % (
+                ", ".join(columns[i] for i in partition_by),
+                " ORDER BY %s" % ", ".join(order) if order else "",
+                source,
+                partition_limit
+            )
+
+        if with_total:
+            columns.append("COUNT(*) OVER () AS _total")
+
+        ret = "SELECT %s FROM %s" % (", ".join(columns), source)
+        if order_by:
+            ret += " ORDER BY %s" % ", ".join(order_by)
+        if offset > 0 or limit > -1:
+            ret += " LIMIT %s OFFSET %d" % (limit, offset)
+
+        return ret
+
+    def execute_query(self, paths, criteria, distinct, limit, offset, with_total=False, partition_by=(), partition_limit=-1):
+        """
+        Run the query built by build_query() and return its QueryResults.
+
+        With with_total, the total attribute of the result is set to the number
+        of matching rows (or groups). It is computed within the query itself when
+        window functions are available, and by an additional COUNT query otherwise.
+        The queries are sent to a read replica of the database, if any, and
+        interrupted once the time budget of the running query is exhausted.
+        """
+        db = self._db.get_reader()
+        with db.statement_timeout(get_query_timeout()):
+            return self._execute_query(db, paths, criteria, distinct, limit, offset, with_total, partition_by, partition_limit)
+
+    def _execute_query(self, db, paths, criteria, distinct, limit, offset, with_total, partition_by, partition_limit):
+        kwargs = {"partition_by": partition_by, "partition_limit": partition_limit}
+
+        if with_total and self.has_window_functions(paths):
+            rows = db.query(self.build_query(paths, criteria, distinct, limit, offset, with_total=True, **kwargs))
+            if rows:
+                return QueryResults([row[:-1] for row in rows], total=int(rows[0][-1]))
+
+            if not offset:
+                return QueryResults(rows, total=0)
+        else:
+            rows = db.query(self.build_query(paths, criteria, distinct, limit, offset, **kwargs))
+            if not with_total:
+                return QueryResults(rows)
+
+        # Either window functions are not available or the page is past the last row
+        total = db.query("SELECT COUNT(*) FROM (%s) AS _q" % self.build_query(paths, criteria, distinct, -1, 0, **kwargs))
+        return QueryResults(rows, total=int(total[0][0]))
+
+    def _prepare_cte_query(self, paths, criteria, distinct, limit, offset):
         step = None
         start, end = self._get_time_bounds(criteria)
         inner_paths = [SelectionObject(_Path(p)) for p in self._time_paths]
@@ -476,33 +846,97 @@ class SQLBuilder(object):
 
         inner_query = SQLQuery(self._base_table, distinct=distinct, limit=limit, offset=offset)
         self._process_selection(inner_paths, inner_query)
-        inner_query.where = self._process_criteria(criteria, inner_query)
+        inner_query.where = self._process_where(criteria, inner_query)
 
         outer_query = SQLQuery(self._base_table)
         self._process_selection(outer_paths, outer_query, with_aliases=False)
 
-        dbtype = self._db.get_type()
+        functions = _FUNCTIONS_MAP[self._db.get_type()]
+        unit = _TIME_UNITS[step][1]
+        values = {
+            "start": functions["date"].format(start),
+            "value_incr": functions["add_date"].format("value", "1 %s" % unit),
+            "end": functions["sub_date"].format(functions["date"].format(end), "1 %s" % unit),
+            "selection": ", ".join(outer_query.select),
+            "ctes": "",
+            "main": text_type(inner_query),
+            "join": "",
+            "group_by": ", ".join(outer_query.group_by),
+            "order": ", ".join(outer_query.order_by)
+        }
+
+        return values, functions, start, end, _UNIT_SECONDS.get(unit)
+
+    def _build_cte_query(self, paths, criteria, distinct, limit, offset):
+        values, functions, start, end, seconds = self._prepare_cte_query(paths, criteria, distinct, limit, offset)
+        if seconds:
+            self._set_bucket_plan(values, functions, start, end, seconds)
 
         return """
             WITH RECURSIVE nums AS (
-                SELECT %(start)s AS value UNION ALL SELECT %(value_incr)s FROM nums WHERE value < %(end)s
-            )
+                SELECT 0 AS k, %(start)s AS value UNION ALL SELECT k + 1, %(value_incr)s FROM nums WHERE value < %(end)s
+            )%(ctes)s
             SELECT %(selection)s FROM (
-                SELECT value AS start, %(value_incr)s AS end FROM nums
+                SELECT k, value AS start, %(value_incr)s AS end FROM nums
             ) AS _intervals JOIN (
-                %(inner_query)s
-            ) AS _main ON c0 < _intervals.end AND c1 >= _intervals.start
+                %(main)s
+            ) AS _main ON %(join)sc0 < _intervals.end AND c1 >= _intervals.start
             GROUP BY %(group_by)s
             ORDER BY %(order)s
-        """ % {
-            "start": _FUNCTIONS_MAP[dbtype]["date"].format(start),
-            "value_incr": _FUNCTIONS_MAP[dbtype]["add_date"].format("value", "1 %s" % _TIME_UNITS[step][1]),
-            "end": _FUNCTIONS_MAP[dbtype]["sub_date"].format("TIMESTAMP '%s'" % end, "1 %s" % _TIME_UNITS[step][1]),
-            "selection": ", ".join(outer_query.select),
-            "inner_query": text_type(inner_query),
-            "group_by": ", ".join(outer_query.group_by),
-            "order": ", ".join(outer_query.order_by)
-        }
+        """ % values
+
+    def _get_bucket_bounds(self, values, functions, start, end, seconds):
+        """Return the index of the last interval, and the range of intervals a row may belong to"""
+        def bucket(column):
+            return functions["floor"].format("%s / %s" % (functions["seconds_diff"].format(column, values["start"]), seconds))
+
+        last = max(0, int(math.ceil((end - start).total_seconds() / seconds)))
+
+        # Widened by one interval on both sides for rounding
+        kstart = functions["greatest"].format(0, "%s - 1" % bucket("c0"))
+        kend = functions["least"].format(last, "%s + 1" % bucket("c1"))
+
+        return last, kstart, kend
+
+    def _set_bucket_plan(self, values, functions, start, end, seconds):
+        """
+        Avoid matching every row against every interval of a composite time query.
+
+        Intervals having a fixed length, the range of intervals a row may belong to
+        is computed from its start and end times. The rows are then expanded into
+        these candidate intervals, and joined with the intervals on their index, the
+        original overlap condition being kept so that the results are identical.
+
+        The expansion relies on generate_series() on PostgreSQL. Elsewhere, it relies
+        on a join with a table of offsets, as wide as the range of a row lasting the
+        builder max_duration: the few rows lasting longer are joined with the
+        intervals past this range. The intervals join is kept as is when the number
+        of intervals is low, or when the duration of the rows is unknown or spans
+        most of them.
+        """
+        last, kstart, kend = self._get_bucket_bounds(values, functions, start, end, seconds)
+        if last + 1 <= _CTE_MAX_INTERVALS:
+            return
+
+        inner_query = values["main"]
+        if self._db.get_type() == "pgsql":
+            values["main"] = "SELECT _m.*, generate_series(%s, %s) AS _k FROM (%s) AS _m" % (kstart, kend, inner_query)
+        else:
+            if not self._max_duration:
+                return
+
+            # Compare the cost of the expansion to the intervals join
+            span = int(math.ceil(self._max_duration / seconds)) + 2
+            if (span + 1) * 2 > last + 1:
+                return
+
+            values["ctes"] = (", offsets AS (SELECT 0 AS value UNION ALL SELECT value + 1 FROM offsets WHERE value < %d)"
+                              ", _bounds AS (SELECT _m.*, %s AS _kstart, %s AS _kend FROM (%s) AS _m)") % (span, kstart, kend, inner_query)
+            values["main"] = ("SELECT _b.*, _b._kstart + offsets.value AS _k FROM _bounds AS _b JOIN offsets ON offsets.value <= _b._kend - _b._kstart "
+                              "UNION ALL SELECT _b.*, nums.k AS _k FROM _bounds AS _b JOIN nums ON nums.k > _b._kstart + %d AND nums.k <= _b._kend "
+                              "WHERE _b._kend - _b._kstart > %d") % (span, span)
+
+        values["join"] = "_intervals.k = _main._k AND "
 
     def _get_time_bounds(self, criteria):
         # Try finding the mainmenu criteria
@@ -532,8 +966,16 @@ class SQLBuilder(object):
 
         return zip(*sorted(paths.items(), key=lambda x: self._tables.index(x[0])))
 
-    def execute_delete(self, criteria, paths):
-        """Delete objects from the database based on the provided criteria."""
+    def execute_delete(self, criteria, paths, limit=-1):
+        """
+        Delete objects from the database based on the provided criteria.
+
+        If limit is given, at most limit objects are deleted, oldest first,
+        and the number of deleted objects is returned.
+        """
+        if limit > 0:
+            return self._execute_delete_batch(criteria, paths, limit)
+
         query = SQLQuery(self._get_base_table(paths))
         query.where = self._process_criteria(criteria, query, with_aliases=False)
 
@@ -550,6 +992,27 @@ class SQLBuilder(object):
         self._db.query("DELETE FROM %s WHERE (%s) IN (SELECT * FROM (%s) AS dummy)" %
                        (query.base_table, ", ".join(query.base_table.pkey), select_query))
 
+    def _execute_delete_batch(self, criteria, paths, limit):
+        table = self._get_base_table(paths)
+        pkey_paths = [SelectionObject(_Path(self._reverse_paths_map[(table, p)])) for p in table.pkey]
+
+        # Select the primary keys of the oldest objects first: this keeps each
+        # DELETE statement short and works on every database (including SQLite)
+        order_path = self._time_paths[0] if self._time_paths else pkey_paths[0].get_path().path
+        select_query = self.build_query(pkey_paths + [SelectionObject(_Path(order_path), commands=["order_asc"])], criteria, False, limit, 0)
+
+        rows = self._db.query(select_query)
+        if not rows:
+            return 0
+
+        if len(table.pkey) == 1:
+            self._db.query("DELETE FROM %s WHERE %s IN %%s" % (table, table.pkey[0]), [row[0] for row in rows])
+        else:
+            self._db.query("DELETE FROM %s WHERE (%s) IN (%%s)" % (table, ", ".join(table.pkey)),
+                           [tuple(row[:len(table.pkey)]) for row in rows])
+
+        return len(rows)
+
     def _browse_data(self, data):
         tables = {}
         for path, value in data:
@@ -23,7 +23,7 @@ import datetime
 import prelude
 
 from prewikka import crontab, hookmanager, renderer, utils, version
-from prewikka.dataprovider import DataProviderBase, Criterion, CriterionOperator, ParserError, PathValue, InvalidPathError
+from prewikka.dataprovider import DataProviderBase, Criterion, CriterionOperator, ParserError, PathValue, InvalidPathError, to_datetime
 
 
 class _IDMEFPath(prelude.IDMEFPath):
@@ -119,6 +119,16 @@ class _IDMEFProvider(DataProviderBase):
         return ".".join(fields)
 
     def compile_criterion(self, criterion):
+        if criterion.operator.is_set:
+            # libpreludedb has no set operator, the values are expanded
+            # into a flat chain of (in)equalities by Criterion.to_string()
+            if criterion.operator.negated:
+                paths = criterion.left if isinstance(criterion.left, tuple) else (criterion.left,)
+                paths = tuple(self._path_adjust(p) if _IDMEFPath(p).isAmbiguous() else p for p in paths)
+                criterion.left = paths if isinstance(criterion.left, tuple) else paths[0]
+
+            return DataProviderBase.compile_criterion(self, criterion)
+
         if criterion.right:
             criterion.right = self._value_adjust(criterion.operator, criterion.right)
 
@@ -136,6 +146,23 @@ class _IDMEFProvider(DataProviderBase):
         if criteria:
             return _IDMEFCriterion(criteria.to_string())
 
+    @staticmethod
+    def _get_cron_time(job):
+        # An interrupted deletion job resumes with its original time reference
+        if job.progress and job.progress.get("time"):
+            return to_datetime(job.progress["time"])
+
+        return utils.timeutil.utcnow()
+
+    def _cron_delete(self, job, config, criteria, now):
+        deleted = job.progress.get("deleted", 0) if job.progress else 0
+        job.set_progress(time=now, deleted=deleted)
+
+        env.dataprovider.delete(criteria, type=self.dataprovider_type,
+                                batch_size=int(config.get("batch_size", 10000)),
+                                batch_delay=float(config.get("batch_delay", 1)),
+                                progress=lambda count: job.set_progress(time=now, deleted=deleted + count))
+
     def _get_path_values(self, path):
         klass = prelude.IDMEFClass(path)
 
@@ -178,7 +205,7 @@ class IDMEFAlertProvider(_IDMEFProvider):
 
         criteria = Criterion()
         age = int(config.get("age", 0))
-        now = utils.timeutil.utcnow()
+        now = self._get_cron_time(job)
         for severity in (None, "info", "low", "medium", "high"):
             days = int(config.get(severity, age))
             if days < 1:
@@ -191,7 +218,7 @@ class IDMEFAlertProvider(_IDMEFProvider):
             return
 
         if not list(hookmanager.trigger("HOOK_CRON_DELETE", criteria, "alert")):
-            env.dataprovider.delete(criteria, type="alert")
+            self._cron_delete(job, config, criteria, now)
 
 
 class IDMEFHeartbeatProvider(_IDMEFProvider):
@@ -212,7 +239,8 @@ class IDMEFHeartbeatProvider(_IDMEFProvider):
         if days < 1:
             return
 
-        criteria = Criterion("heartbeat.create_time", "<", utils.timeutil.utcnow() - datetime.timedelta(days=days))
+        now = self._get_cron_time(job)
+        criteria = Criterion("heartbeat.create_time", "<", now - datetime.timedelta(days=days))
 
         if not list(hookmanager.trigger("HOOK_CRON_DELETE", criteria, "heartbeat")):
-            env.dataprovider.delete(criteria, type="heartbeat")
+            self._cron_delete(job, config, criteria, now)
@@ -256,8 +256,9 @@ class PathParser(DataProviderBase):
         return parsed_paths, types
 
     def compile_criterion(self, criterion):
-        left_path, key = criterion.left.rsplit('.', 1)
-        self._check_path(left_path, key)
+        for path in criterion.left if isinstance(criterion.left, tuple) else (criterion.left,):
+            left_path, key = path.rsplit('.', 1)
+            self._check_path(left_path, key)
 
         return criterion
 
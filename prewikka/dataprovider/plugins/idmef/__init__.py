@@ -23,8 +23,8 @@ from datetime import datetime
 
 import prelude
 from prelude import IDMEFTime, IDMEFValue
-from prewikka import error, idmefdatabase, usergroup, utils, version
-from prewikka.dataprovider import DataProviderBackend, QueryResults, QueryResultsRow, ResultObject
+from prewikka import database, error, idmefdatabase, usergroup, utils, version
+from prewikka.dataprovider import DataProviderBackend, QueryResults, ResultObject, get_query_timeout
 
 
 class IDMEFResultObject(ResultObject, utils.json.JSONObject):
@@ -42,21 +42,19 @@ class IDMEFResultObject(ResultObject, utils.json.JSONObject):
         return {"idmef_json": self._obj.toJSON()}
 
 
-class IDMEFQueryResultsRow(QueryResultsRow):
+class IDMEFQueryResults(QueryResults):
     __slots__ = ()
 
-    def preprocess_value(self, value):
-        if isinstance(value, IDMEFTime):
-            return datetime.fromtimestamp(value, utils.timeutil.tzoffset(None, value.getGmtOffset()))
-
-        return QueryResultsRow.preprocess_value(self, value)
+    def _make_converter(self, path, type, read_hook):
+        convert = QueryResults._make_converter(self, path, type, read_hook)
 
+        def idmef_convert(value):
+            if isinstance(value, IDMEFTime):
+                value = datetime.fromtimestamp(value, utils.timeutil.tzoffset(None, value.getGmtOffset()))
 
-class IDMEFQueryResults(QueryResults):
-    __slots__ = ()
+            return convert(value) if convert else value
 
-    def preprocess_value(self, value):
-        return IDMEFQueryResultsRow(self, value)
+        return idmef_convert
 
 
 class _IDMEFPlugin(DataProviderBackend):
@@ -68,16 +66,30 @@ class _IDMEFPlugin(DataProviderBackend):
     def __init__(self):
         DataProviderBackend.__init__(self)
         try:
-            self._db = idmefdatabase.IDMEFDatabase(env.config.idmef_database)
+            self._shared_db = idmefdatabase.IDMEFDatabase(env.config.idmef_database)
         except Exception as e:
             raise error.PrewikkaUserError(N_("Initialization error"), e)
 
+        self._shared_router = database.ReplicaRouter.from_config(self._shared_db, dict(env.config.idmef_database),
+                                                                 env.config.idmef_database_replica, idmefdatabase.IDMEFDatabase)
+
+    # Threads may use their own connections, see database.thread_connections()
+    @property
+    def _db(self):
+        return database.get_connection(self._shared_db)
+
+    @property
+    def _router(self):
+        return database.get_connection(self._shared_router)
+
     def get_properties(self):
         return utils.AttrObj(format=self._db.getFormatName())
 
-    def _iterate_object(self, results):
+    def _iterate_object(self, db, results):
+        get_object = self._get_object(db)
+
         for ident in results:
-            res = IDMEFResultObject(self._get_object(ident))
+            res = IDMEFResultObject(get_object(ident))
             res.ident = ident
 
             yield res
@@ -85,10 +97,16 @@ class _IDMEFPlugin(DataProviderBackend):
     def update(self, data, criteria):
         paths, values = zip(*data)
         self._db.update(list(paths), [IDMEFValue(v) for v in values], criteria)
+        database.mark_written(self._db)
 
     def get(self, criteria, order_by, limit, offset):
-        results = self._get_idents(criteria, limit, offset, order_by)
-        return utils.CachingIterator(self._iterate_object(results))
+        # The objects are fetched lazily, from the database the idents come from
+        def _get(db):
+            with db.statement_timeout(get_query_timeout()):
+                return db, self._get_idents(db)(criteria, limit, offset, order_by)
+
+        db, results = self._router.run(_get)
+        return utils.CachingIterator(self._iterate_object(db, results))
 
     @usergroup.permissions_required(["IDMEF_VIEW"])
     def get_values(self, paths, criteria, distinct, limit, offset):
@@ -100,11 +118,27 @@ class _IDMEFPlugin(DataProviderBackend):
         if not criteria and not env.dataprovider.guess_datatype(paths, default=None):
             criteria = "%s.messageid" % self.type
 
-        return IDMEFQueryResults(self._db.getValues(paths, criteria, distinct, limit, offset))
+        def _get_values(db):
+            with db.statement_timeout(get_query_timeout()):
+                return db.getValues(paths, criteria, distinct, limit, offset)
+
+        return IDMEFQueryResults(self._router.run(_get_values))
 
     @usergroup.permissions_required(["IDMEF_ALTER"])
     def delete(self, criteria, paths):
         self._db.remove(criteria)
+        database.mark_written(self._db)
+
+    @usergroup.permissions_required(["IDMEF_ALTER"])
+    def delete_batch(self, criteria, paths, limit):
+        idents = self._get_idents(self._db)(criteria, limit, 0, ["%s.create_time/order_asc" % self.type])
+
+        count = len(idents)
+        if count:
+            self._db.remove(idents)
+            database.mark_written(self._db)
+
+        return count
 
 
 class IDMEFAlertPlugin(_IDMEFPlugin):
@@ -112,13 +146,11 @@ class IDMEFAlertPlugin(_IDMEFPlugin):
     plugin_name = "IDMEF Alert Plugin"
     plugin_description = N_("Plugin for fetching IDMEF alerts from the Prelude database")
 
-    @property
-    def _get_object(self):
-        return self._db.getAlert
+    def _get_object(self, db):
+        return db.getAlert
 
-    @property
-    def _get_idents(self):
-        return self._db.getAlertIdents
+    def _get_idents(self, db):
+        return db.getAlertIdents
 
 
 class IDMEFHeartbeatPlugin(_IDMEFPlugin):
@@ -126,10 +158,8 @@ class IDMEFHeartbeatPlugin(_IDMEFPlugin):
     plugin_name = "IDMEF Heartbeat Plugin"
     plugin_description = N_("Plugin for fetching IDMEF heartbeats from the Prelude database")
 
-    @property
-    def _get_object(self):
-        return self._db.getHeartbeat
+    def _get_object(self, db):
+        return db.getHeartbeat
 
-    @property
-    def _get_idents(self):
-        return self._db.getHeartbeatIdents
+    def _get_idents(self, db):
+        return db.getHeartbeatIdents
@@ -19,44 +19,118 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import collections
 import operator
-from prewikka import registrar
+import time
+
+from prewikka import profiling, registrar
 
 _sentinel = object()
 
 
+class _HookStats(object):
+    __slots__ = ("triggers", "handler_calls", "duration")
+
+    def __init__(self):
+        self.triggers = self.handler_calls = 0
+        self.duration = 0.
+
+
 class HookManager(object):
     def __init__(self):
         self._hooks = {}
+        self._handlers = {}
+        self._stats = collections.defaultdict(_HookStats)
 
     def __contains__(self, hook):
         return hook in self._hooks
 
-    def unregister(self, hook=None, method=None, exclude=[]):
-        if hook and method:
-            self._hooks[hook] = [(order, func) for order, func in self._hooks[hook] if func != method]
+    def has_handlers(self, hook):
+        """Return whether at least one handler is registered for hook"""
+        return bool(self._handlers.get(hook))
+
+    def _update(self, hook):
+        # Handlers are sorted once here rather than on every trigger() call
+        self._handlers[hook] = tuple((func, batch) for order, func, batch in sorted(self._hooks[hook], key=operator.itemgetter(0)))
+
+    @staticmethod
+    def _is_owned_by(func, owner):
+        return getattr(func, "__self__", None) is owner
+
+    def unregister(self, hook=None, method=None, exclude=[], owner=None):
+        if owner is not None:
+            for i in set(self._hooks) - set(exclude):
+                self._hooks[i] = [h for h in self._hooks[i] if not self._is_owned_by(h[1], owner)]
+                self._update(i)
+        elif hook and method:
+            self._hooks[hook] = [h for h in self._hooks.get(hook, []) if h[1] != method]
+            self._update(hook)
         elif hook:
             self._hooks[hook] = []
+            self._update(hook)
         else:
             for i in set(self._hooks) - set(exclude):
                 self._hooks[i] = []
+                self._update(i)
 
-    def register(self, hook, _regfunc=_sentinel, _order=2**16):
+    def register(self, hook, _regfunc=_sentinel, _order=2**16, _batch=False):
+        """
+        Register a handler for hook.
+
+        Handlers registered with _batch=True receive a list of items rather than a single
+        argument, see trigger_batch(). Such handlers are only supported for hooks taking
+        a single argument.
+        """
         if _regfunc is not _sentinel:
-            self._hooks.setdefault(hook, []).append((_order, _regfunc))
+            self._hooks.setdefault(hook, []).append((_order, _regfunc, _batch))
+            self._update(hook)
         else:
-            return registrar.DelayedRegistrar.make_decorator("hook", self.register, hook, _order=_order)
+            return registrar.DelayedRegistrar.make_decorator("hook", self.register, hook, _order=_order, _batch=_batch)
+
+    def _profiled_call(self, hook, cb, *args, **kwargs):
+        start = time.time()
+
+        try:
+            with profiling.span("hook", hook=hook):
+                return cb(*args, **kwargs)
+        finally:
+            stats = self._stats[hook]
+            stats.handler_calls += 1
+            stats.duration += time.time() - start
+
+    def _call(self, hook, cb, *args, **kwargs):
+        if profiling.profiler.enabled:
+            return self._profiled_call(hook, cb, *args, **kwargs)
+
+        return cb(*args, **kwargs)
 
     def trigger(self, hook, *args, **kwargs):
+        if profiling.profiler.enabled:
+            self._stats[hook].triggers += 1
+
+        handlers = self._handlers.get(hook)
+        if not handlers:
+            return iter(())
+
+        return self._trigger(hook, handlers, args, kwargs)
+
+    def _trigger(self, hook, handlers, args, kwargs):
         wtype = kwargs.pop("type", None)
         _except = kwargs.pop("_except", None)
+        _owner = kwargs.pop("_owner", None)
+
+        for cb, batch in handlers:
+            if _owner is not None and not self._is_owned_by(cb, _owner):
+                continue
 
-        for order, cb in sorted(self._hooks.setdefault(hook, []), key=operator.itemgetter(0)):
             if not callable(cb):
                 result = cb
             else:
                 try:
-                    result = cb(*args, **kwargs)
+                    if batch:
+                        result = self._call(hook, cb, list(args[:1]), *args[1:], **kwargs)
+                    else:
+                        result = self._call(hook, cb, *args, **kwargs)
                 except Exception as e:
                     if _except:
                         _except(e)
@@ -69,8 +143,64 @@ class HookManager(object):
 
             yield result
 
+    def trigger_batch(self, hook, items, **kwargs):
+        """
+        Trigger hook once for a whole batch of items (eg. all the values of a column).
+
+        Handlers registered with _batch=True are called once with the list of items,
+        the other handlers are called once per item. Results are discarded: this is meant
+        for hooks modifying their argument in place, like HOOK_DATAPROVIDER_VALUE_READ.
+        """
+        if profiling.profiler.enabled:
+            self._stats[hook].triggers += 1
+
+        handlers = self._handlers.get(hook)
+        if not handlers or not items:
+            return
+
+        for cb, batch in handlers:
+            if not callable(cb):
+                continue
+
+            if batch:
+                self._call(hook, cb, items, **kwargs)
+            else:
+                for item in items:
+                    self._call(hook, cb, item, **kwargs)
+
+    def get_stats(self):
+        """
+        Return a dict of hook -> (triggers, handler calls, handler duration).
+
+        The statistics are only collected when profiling is enabled, so that triggering
+        a hook without any handler stays cheap.
+        """
+        return dict((hook, (stats.triggers, stats.handler_calls, stats.duration)) for hook, stats in self._stats.items())
+
+    def reset_stats(self):
+        self._stats.clear()
+
+    def format_metrics(self):
+        """Return the hooks counters using the Prometheus text exposition format"""
+
+        out = ["# TYPE prewikka_hook_triggers_total counter"]
+        stats = sorted(self.get_stats().items())
+
+        for hook, (triggers, calls, duration) in stats:
+            out.append('prewikka_hook_triggers_total{hook="%s"} %d' % (hook, triggers))
+
+        out.append("# TYPE prewikka_hook_handler_seconds summary")
+        for hook, (triggers, calls, duration) in stats:
+            if calls:
+                out.append('prewikka_hook_handler_seconds_sum{hook="%s"} %f' % (hook, duration))
+                out.append('prewikka_hook_handler_seconds_count{hook="%s"} %d' % (hook, calls))
+
+        return "\n".join(out) + "\n"
+
 
 hookmgr = HookManager()
 trigger = hookmgr.trigger
+trigger_batch = hookmgr.trigger_batch
 register = hookmgr.register
 unregister = hookmgr.unregister
+has_handlers = hookmgr.has_handlers
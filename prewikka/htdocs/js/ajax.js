@@ -345,12 +345,45 @@ function _process_ajax_response(settings, data, xhr)
         $.each(data._extensions.html_content, function(_, value) {
             $(value.target || default_target).append(value.html);
         });
+
+        if ( data._extensions.profiling )
+            _profiling_panel_update(data._extensions.profiling);
     }
 
     return result;
 }
 
 
+function _profiling_panel_update(profile)
+{
+    var panel = $("#prewikka-profiling-panel");
+
+    if ( ! panel.length ) {
+        panel = $("<div>", { "id": "prewikka-profiling-panel", "class": "panel panel-default" })
+                .css({"position": "fixed", "bottom": 0, "right": 0, "z-index": 10000, "max-height": "40%", "overflow": "auto", "font-size": "11px"});
+        $("body").append(panel);
+    }
+
+    var table = $("<table>", { "class": "table table-condensed" });
+    table.append($("<tr>").append($("<th>", { "colspan": 3, "text": profile.path })));
+
+    $.each(profile.spans, function(_, span) {
+        var details = $.map(span, function(value, key) {
+            return (key == "category" || key == "start" || key == "duration") ? null : key + "=" + JSON.stringify(value);
+        });
+
+        table.append($("<tr>").append($("<td>", { "text": span.category }),
+                                      $("<td>", { "text": (span.duration * 1000).toFixed(1) + " ms" }),
+                                      $("<td>", { "text": details.join(" ") })));
+    });
+
+    if ( profile.dropped )
+        table.append($("<tr>").append($("<td>", { "colspan": 3, "text": profile.dropped + " more spans not recorded" })));
+
+    panel.html(table);
+}
+
+
 function prewikka_process_ajax_response(settings, data, xhr)
 {
     if ( ! data )
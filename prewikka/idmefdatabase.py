@@ -20,8 +20,24 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import preludedb
+from prewikka import database
 
 
 class IDMEFDatabase(preludedb.DB):
     def __init__(self, config):
-        preludedb.DB.__init__(self, preludedb.SQL(dict(config)))
+        settings = dict(config)
+
+        self._settings = settings
+        self._sql = preludedb.SQL(settings)
+        self._type = settings.get("type")
+        preludedb.DB.__init__(self, self._sql)
+
+    def clone(self):
+        """Return a new connection to the same database"""
+        return IDMEFDatabase(self._settings)
+
+    def get_replication_lag(self):
+        return database.get_replication_lag(self._sql, self._type)
+
+    def statement_timeout(self, timeout):
+        return database.statement_timeout(self._sql, self._type, timeout)
@@ -19,11 +19,20 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import atexit
+import collections
+import copy
+import email.utils
 import logging
 import logging.handlers
 import os
+import smtplib
 import stat
 import sys
+import threading
+import time
+
+from email.mime.text import MIMEText
 
 DEBUG = logging.DEBUG
 INFO = logging.INFO
@@ -31,15 +40,264 @@ ERROR = logging.ERROR
 WARNING = logging.WARNING
 CRITICAL = logging.CRITICAL
 
+# Maximum number of records waiting to be handled, the oldest ones are dropped beyond
+_QUEUE_SIZE = 10000
+
+# Maximum time in seconds the listener waits for records before polling the handlers
+_POLL_INTERVAL = 1
+
+# Default minimum time in seconds between two mails, and maximum number of records per mail
+_SMTP_DIGEST_INTERVAL = 60
+_SMTP_DIGEST_SIZE = 100
+_SMTP_TIMEOUT = 10
+
+
+class _RecordQueue(object):
+    """
+    Bounded queue of log records: when it is full, the oldest record is dropped.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+
+        self._records = collections.deque()
+        self._unfinished = 0
+        self._cond = threading.Condition()
+
+    def put(self, record):
+        with self._cond:
+            if len(self._records) >= self.maxsize:
+                self._records.popleft()
+                self._unfinished -= 1
+                self.dropped += 1
+
+            self._records.append(record)
+            self._unfinished += 1
+            self._cond.notify_all()
+
+    def get(self, timeout):
+        """Return all the queued records, waiting at most timeout seconds for one"""
+        with self._cond:
+            if not self._records:
+                self._cond.wait(timeout)
+
+            records = list(self._records)
+            self._records.clear()
+
+            return records
+
+    def task_done(self, count):
+        with self._cond:
+            self._unfinished -= count
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until all the queued records have been handled"""
+        end = time.time() + timeout if timeout is not None else None
+
+        with self._cond:
+            while self._unfinished > 0:
+                remaining = end - time.time() if end is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+
+                self._cond.wait(remaining)
+
+        return True
+
+
+class _QueueHandler(logging.Handler):
+    """
+    Handler queuing the records for the listener thread.
+    """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def prepare(self, record):
+        # Merge the arguments and the exception into the message,
+        # since they might not be usable once the caller returns
+        msg = self.format(record)
+
+        record = copy.copy(record)
+        record.msg = record.message = msg
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+class _QueueListener(object):
+    """
+    Thread passing the queued records to the actual handlers, so that slow
+    handlers (SMTP, syslog over the network...) do not block the logging thread.
+    """
+    def __init__(self, queue, handlers):
+        self.queue = queue
+        self.handlers = handlers
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="prewikka-log")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _poll(self):
+        for handler in self.handlers:
+            poll = getattr(handler, "poll", None)
+            if poll:
+                poll()
+
+    def _run(self):
+        while not self._stopped:
+            records = self.queue.get(_POLL_INTERVAL)
+            for record in records:
+                self._handle(record)
+
+            self._poll()
+            self.queue.task_done(len(records))
+
+    def stop(self, timeout=_POLL_INTERVAL * 5):
+        self.queue.join(timeout)
+        self._stopped = True
+        self._thread.join(timeout)
+
+
+class _SMTPDigestHandler(logging.Handler):
+    """
+    Handler sending the records by mail, gathered into digests: at most one
+    mail is sent every interval seconds, holding at most size records.
+    """
+    def __init__(self, host, fromaddr, toaddrs, subject, interval=_SMTP_DIGEST_INTERVAL, size=_SMTP_DIGEST_SIZE):
+        logging.Handler.__init__(self)
+
+        self.host = host
+        self.fromaddr = fromaddr
+        self.toaddrs = toaddrs
+        self.subject = subject
+        self.interval = interval
+        self.size = size
+
+        self._records = []
+        self._skipped = 0
+        self._next_time = 0
+
+    def emit(self, record):
+        if len(self._records) < self.size:
+            self._records.append(record)
+        else:
+            self._skipped += 1
+
+        self.poll()
+
+    def poll(self):
+        if self._records and time.time() >= self._next_time:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            records, skipped = self._records, self._skipped
+            self._records, self._skipped = [], 0
+        finally:
+            self.release()
+
+        if not records:
+            return
+
+        self._next_time = time.time() + self.interval
+        try:
+            self._send(records, skipped)
+        except Exception:
+            self.handleError(records[-1])
+
+    def _send(self, records, skipped):
+        body = [self.format(record) for record in records]
+        if skipped:
+            body.append("(%d more records were not sent)" % skipped)
+
+        subject = self.subject
+        if len(records) + skipped > 1:
+            subject = "%s (%d records)" % (subject, len(records) + skipped)
+
+        msg = MIMEText("\n".join(body), "plain", "utf-8")
+        msg["From"] = self.fromaddr
+        msg["To"] = ", ".join(self.toaddrs)
+        msg["Subject"] = subject
+        msg["Date"] = email.utils.formatdate()
+
+        smtp = smtplib.SMTP(self.host, timeout=_SMTP_TIMEOUT)
+        try:
+            smtp.sendmail(self.fromaddr, self.toaddrs, msg.as_string())
+        finally:
+            smtp.quit()
+
 
 class Log(object):
-    def __init__(self, conf):
+    def __init__(self, conf, queue_size=_QUEUE_SIZE):
         self._logger = None
+        self._queue = _RecordQueue(queue_size)
+        self._listener = None
+        self._handler = None
+
+        handlers = [self._get_handler(instance) for instance in conf]
+        if not handlers:
+            return
+
+        # The records are handled by a background thread
+        self._listener = _QueueListener(self._queue, handlers)
+        atexit.register(self.close)
+
+        self._handler = _QueueHandler(self._queue)
+        self._handler.setLevel(min(handler.level for handler in handlers))
+
+        self._logger = logging.getLogger()
+        self._logger.setLevel(logging.NOTSET)
+        self._logger.addHandler(self._handler)
+
+    @property
+    def dropped(self):
+        """Number of records dropped because the queue was full"""
+        return self._queue.dropped
+
+    def flush(self, timeout=None):
+        """Wait until the pending records have been handled"""
+        if self._listener:
+            return self._queue.join(timeout)
+
+        return True
+
+    def close(self):
+        """Stop handling the records once the pending ones are handled, and remove the handlers"""
+        if not self._listener:
+            return
+
+        self._logger.removeHandler(self._handler)
+        self._listener.stop()
+
+        for handler in self._listener.handlers:
+            handler.close()
+
+        self._logger = self._listener = self._handler = None
+
+    def format_metrics(self):
+        """Return the logging counters using the Prometheus text exposition format"""
+
+        out = ["# TYPE prewikka_log_dropped_records_total counter"]
+        out.append("prewikka_log_dropped_records_total %d" % self.dropped)
 
-        for instance in conf:
-            self._logger = logging.getLogger()
-            self._logger.setLevel(logging.NOTSET)
-            self._logger.addHandler(self._get_handler(instance))
+        return "\n".join(out) + "\n"
 
     def _get_syslog_handler_address(self):
         for f in ("/dev/log", "/var/run/log", "/var/run/syslog"):
@@ -65,7 +323,9 @@ class Log(object):
             hdlr = logging.handlers.SysLogHandler(self._get_syslog_handler_address(), facility=logging.handlers.SysLogHandler.LOG_DAEMON)
 
         elif logtype == 'smtp':
-            hdlr = logging.handlers.SMTPHandler(config.host, getattr(config, "from"), config.to.split(", "), config.subject)
+            hdlr = _SMTPDigestHandler(config.host, getattr(config, "from"), config.to.split(", "), config.subject,
+                                      interval=config.get_int("digest_interval", _SMTP_DIGEST_INTERVAL),
+                                      size=config.get_int("digest_size", _SMTP_DIGEST_SIZE))
 
         elif logtype == 'stderr':
             hdlr = logging.StreamHandler(sys.stderr)
@@ -29,7 +29,8 @@ import pkg_resources
 import prelude
 import preludedb
 from prewikka import (auth, cli, config, database, dataprovider, error, history, hookmanager, link, localization,
-                      log, menu, pluginmanager, renderer, resolve, response, siteconfig, usergroup, version, view)
+                      log, menu, pluginmanager, profiling, renderer, resolve, response, siteconfig, usergroup, version, view)
+from prewikka.utils import cache
 
 try:
     from threading import Lock
@@ -42,6 +43,8 @@ _core_cache_lock = Lock()
 
 
 class Core(object):
+    _INCREMENTAL_RELOAD_ENTRYPOINTS = ("prewikka.plugins", "prewikka.views")
+
     def __init__(self, filename=None, autoupdate=False):
         self.autoupdate = autoupdate
         env.auth = None  # In case of database error
@@ -56,6 +59,9 @@ class Core(object):
         env.log = log.Log(env.config.log)
         env.log.info("Starting Prewikka")
 
+        profiling.profiler.configure(env.config.profiling)
+        response.compression.configure(env.config.compression)
+
         env.dns_max_delay = env.config.general.get_float("dns_max_delay", 0.)
 
         if env.config.general.get_bool("external_link_new_window", True):
@@ -160,7 +166,7 @@ class Core(object):
 
     def _unregister_plugin_data(self):
         list(hookmanager.trigger("HOOK_PLUGINS_RELOAD"))
-        hookmanager.unregister(exclude=["HOOK_PLUGINS_RELOAD"])
+        hookmanager.unregister(exclude=["HOOK_PLUGINS_RELOAD", "HOOK_PLUGIN_UNLOAD"])
         cli.unregister()
         usergroup.ACTIVE_PERMISSIONS = usergroup.Permissions()
 
@@ -207,9 +213,70 @@ class Core(object):
         env.renderer.load()
         list(hookmanager.trigger("HOOK_PLUGINS_LOAD"))
 
+        env.db.refresh_plugin_state()
+
+    def _unload_plugin(self, plugin):
+        list(hookmanager.trigger("HOOK_PLUGIN_UNLOAD", plugin))
+        hookmanager.unregister(owner=plugin)
+        cli.unregister(owner=plugin)
+        env.viewmanager.unload_views(plugin)
+
+    @staticmethod
+    def _get_plugin_entrypoint(mname):
+        for entrypoint, plugins in env.all_plugins.items():
+            if mname in plugins:
+                return entrypoint
+
+    def _reload_plugins_incremental(self, changes):
+        """
+        Only reload the plugins whose registry entry changed.
+
+        Return False if the changes cannot be applied incrementally, in which
+        case a full reload is required.
+        """
+        plist = []
+        for mname in changes:
+            entrypoint = self._get_plugin_entrypoint(mname)
+            if entrypoint not in self._INCREMENTAL_RELOAD_ENTRYPOINTS:
+                return False
+
+            if issubclass(env.all_plugins[entrypoint][mname], pluginmanager.PluginPreload):
+                return False
+
+            plist.append((entrypoint, mname))
+
+        # Plugins depending on a modified plugin would have to be reloaded as well
+        modules = set(changes) | set(mname.split(":", 1)[0] for mname in changes)
+        for plugins in env.all_plugins.values():
+            for name, plugin_class in plugins.items():
+                if name not in changes and modules.intersection(plugin_class.plugin_require + plugin_class.plugin_after):
+                    return False
+
+        for entrypoint, mname in plist:
+            plugin = env.pluginmanager[entrypoint].remove_plugin(mname)
+            if plugin:
+                env.log.info("%s: unloading plugin" % mname)
+                self._unload_plugin(plugin)
+
+            # Disabled plugins will fail with a database activation error, as on a full reload
+            plugin = env.pluginmanager[entrypoint].add_plugin(mname, autoupdate=self.autoupdate)
+            if plugin:
+                env.log.info("%s: plugin loaded" % mname)
+                list(hookmanager.trigger("HOOK_PLUGINS_LOAD", _owner=plugin))
+
+        return True
+
     def reload_plugin_if_needed(self):
-        if env.db.has_plugin_changed():
+        changes = env.db.get_plugin_changes()
+        if changes is not None:
+            if not changes:
+                return
+
             # Some changes happened, and every process has to reload the plugin configuration
+            env.log.warning("plugins were modified: %s" % ", ".join(sorted(changes)))
+            if self._reload_plugins_incremental(changes):
+                return
+
             env.log.warning("plugins were activated: triggering reload")
             self._unregister_plugin_data()
             try:
@@ -259,6 +326,18 @@ class Core(object):
         except OSError:
             return response.PrewikkaResponse(code=404, status_text="File not found")
 
+    def _process_metrics(self, webreq):
+        if not (profiling.profiler.metrics and webreq.path == "/metrics"):
+            return
+
+        if webreq.get_remote_addr() not in profiling.profiler.metrics_allow:
+            return response.PrewikkaResponse(code=403, status_text="Request Forbidden")
+
+        resp = response.PrewikkaResponse(profiling.profiler.format_metrics() + hookmanager.hookmgr.format_metrics() + cache.format_metrics() + env.log.format_metrics())
+        resp.headers["Content-Type"] = "text/plain; version=0.0.4"
+
+        return resp
+
     def _process_dynamic(self, webreq):
         self._prewikka_init_if_needed()
 
@@ -287,7 +366,13 @@ class Core(object):
         if view_object.view_require_session and autherr:
             view_object = autherr
 
-        resolve.process(env.dns_max_delay)
+        env.request.query_budget = dataprovider.QueryBudget.from_config(env.config.query_timeout,
+                                                                        getattr(view_object, "view_endpoint", None),
+                                                                        env.request.user, webreq.is_connected)
+
+        with profiling.span("dns"):
+            resolve.process(env.dns_max_delay)
+
         ret = view_object.respond()
         if env.request.user:
             env.request.user.sync_properties()
@@ -296,9 +381,10 @@ class Core(object):
 
     def process(self, webreq):
         env.request.init(webreq)
+        profiling.profiler.start_request(webreq.path)
 
         try:
-            response = self._process_static(webreq) or self._process_dynamic(webreq)
+            response = self._process_static(webreq) or self._process_metrics(webreq) or self._process_dynamic(webreq)
 
         except error.PrewikkaException as err:
             response = err.respond()
@@ -309,10 +395,16 @@ class Core(object):
                 details=err
             ).respond()
 
+        profiling.profiler.end_request(response)
+
         try:
             webreq.send_response(response)
         except socket.error as e:
             if e.errno != errno.EPIPE:
                 raise
+
+            # The client is gone, do not run any more query on its behalf
+            if env.request.query_budget:
+                env.request.query_budget.cancel()
         finally:
             env.request.cleanup()
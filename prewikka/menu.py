@@ -127,3 +127,12 @@ class MenuManager(object):
 
         if (section, tab) == self._default_view:
             self.default_endpoint = endpoint
+
+    def remove_section_info(self, endpoint):
+        for section, tabs in self._loaded_sections.items():
+            for tab, (tab_endpoint, kwargs) in list(tabs.items()):
+                if tab_endpoint == endpoint:
+                    tabs.pop(tab)
+
+        if self.default_endpoint == endpoint:
+            self.default_endpoint = None
@@ -72,12 +72,10 @@ class PluginManager(object):
     def __init__(self, entrypoint, autoupdate=False):
         self.__instances = []
         self.__dinstances = {}
+        self.__objects = {}
+        self._entrypoint = entrypoint
 
-        loaded = collections.OrderedDict()
-        for value in env.all_plugins.values():
-            for name, plugin in value.items():
-                loaded[name] = not(plugin.error)
-
+        loaded = self._get_loaded_plugins()
         plugins = self.iter_plugins(entrypoint)
         plist = [(p, False) for p in plugins]
         self._load_plugin_list(plist, plugins, autoupdate, loaded, [])
@@ -85,6 +83,16 @@ class PluginManager(object):
 
         env.pluginmanager[entrypoint] = self
 
+    @staticmethod
+    def _get_loaded_plugins():
+        # Plugins of all the entrypoints, mapped to whether they were loaded successfully
+        loaded = collections.OrderedDict()
+        for value in env.all_plugins.values():
+            for name, plugin in value.items():
+                loaded[name] = not plugin.error
+
+        return loaded
+
     def _add_plugin(self, plugin_class, autoupdate, name=None):
         plugin_class._handle_attributes(autoupdate)
         self[name or plugin_class.__name__] = plugin_class
@@ -108,16 +116,56 @@ class PluginManager(object):
             if reloading and not plugin_class.error:
                 continue
 
-            try:
-                p = self.initialize_plugin(plugin_class)
-            except Exception:
-                pass
-            else:
-                self._init_callback(p)
+            self._load_instance(plugin_class)
+
+    def _load_instance(self, plugin_class):
+        try:
+            p = self.initialize_plugin(plugin_class)
+        except Exception:
+            return None
+
+        self.__objects[plugin_class.full_module_name] = p
+        self._init_callback(p)
+        return p
+
+    def add_plugin(self, mname, autoupdate=False):
+        """Load and initialize a single plugin from this entrypoint, returning its instance on success"""
+
+        loaded = self._get_loaded_plugins()
+        loaded.pop(mname, None)
+
+        plugin_class = env.all_plugins[self._entrypoint][mname]
+        plugin_class.error = None
+
+        if not self._load_plugin_with_dependencies(mname, env.all_plugins[self._entrypoint], autoupdate, loaded, []):
+            return None
+
+        return self._load_instance(plugin_class)
+
+    def remove_plugin(self, mname):
+        """Remove a plugin from this manager, returning its instance if it was initialized"""
+
+        plugin_class = env.all_plugins[self._entrypoint].get(mname)
+
+        for key, value in list(self.__dinstances.items()):
+            if value is plugin_class:
+                del self.__dinstances[key]
+
+        if plugin_class in self.__instances:
+            self.__instances.remove(plugin_class)
+
+        plugin = self.__objects.pop(mname, None)
+        if plugin:
+            self._remove_callback(plugin)
+
+        return plugin
 
     def _init_callback(self, plugin):
         pass
 
+    def _remove_callback(self, plugin):
+        pass
+
     @staticmethod
     def iter_plugins(entrypoint):
         plist = {}
@@ -253,3 +301,6 @@ class PluginManager(object):
 class SimplePluginManager(PluginManager):
     def _init_callback(self, plugin):
         env.plugins[type(plugin).__name__] = plugin
+
+    def _remove_callback(self, plugin):
+        env.plugins.pop(type(plugin).__name__, None)
@@ -0,0 +1,241 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Per-request profiling of the application hot paths.
+
+Profiling is configured through the [profiling] section of prewikka.conf:
+
+[profiling]
+enable: yes
+server_timing: yes
+debug_panel: no
+metrics: yes
+metrics_allow: 127.0.0.1, ::1
+max_spans: 1000
+
+When disabled, span() returns a shared no-op context manager, so that
+instrumented code paths only pay for one attribute lookup and call.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import time
+
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
+
+# Histogram buckets (in seconds) used for the aggregated metrics
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set(self, **kwargs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    __slots__ = ("_profiler", "category", "start", "duration", "attrs")
+
+    def __init__(self, profiler, category, attrs):
+        self._profiler = profiler
+        self.category = category
+        self.attrs = attrs
+        self.start = self.duration = None
+
+    def set(self, **kwargs):
+        """Add attributes to the span (eg. a row count known at the end of the operation)"""
+        self.attrs.update(kwargs)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.duration = time.time() - self.start
+        self._profiler.add_span(self)
+        return False
+
+    def __json__(self):
+        return dict(self.attrs, category=self.category, start=self.start, duration=self.duration)
+
+
+class _Histogram(object):
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RequestProfile(object):
+    """
+    Spans recorded while processing a single request.
+
+    Requests running many small operations (like the hooks called for each
+    value of a table) would record an unbounded number of spans: only the
+    first max_spans ones are kept, the summary accounting for all of them.
+    """
+
+    def __init__(self, path=None, max_spans=1000):
+        self.path = path
+        self.start = time.time()
+        self.spans = []
+        self.dropped = 0
+
+        self._max_spans = max_spans
+        self._summary = collections.OrderedDict()
+
+    def add(self, span):
+        count, total = self._summary.get(span.category, (0, 0.))
+        self._summary[span.category] = (count + 1, total + span.duration)
+
+        if len(self.spans) < self._max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def summary(self):
+        """Return an ordered mapping of category -> (count, total duration)"""
+
+        return collections.OrderedDict(self._summary)
+
+    def server_timing(self):
+        """Format the profile as a Server-Timing header value (durations in milliseconds)"""
+
+        out = ["total;dur=%.1f" % ((time.time() - self.start) * 1000)]
+        for category, (count, total) in self.summary().items():
+            out.append('%s;dur=%.1f;desc="%d"' % (category, total * 1000, count))
+
+        return ", ".join(out)
+
+    def __json__(self):
+        return {"path": self.path, "start": self.start, "spans": self.spans, "dropped": self.dropped}
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self.server_timing = False
+        self.debug_panel = False
+        self.metrics = False
+        self.metrics_allow = set()
+        self.max_spans = 1000
+
+        self._lock = Lock()
+        self._histograms = {}
+
+    def configure(self, config):
+        self.enabled = config.get_bool("enable", False)
+        self.server_timing = config.get_bool("server_timing", True)
+        self.debug_panel = config.get_bool("debug_panel", False)
+        self.metrics = config.get_bool("metrics", False)
+        self.metrics_allow = set(i.strip() for i in config.get("metrics_allow", "127.0.0.1, ::1").split(","))
+        self.max_spans = config.get_int("max_spans", 1000)
+
+    def span(self, category, **attrs):
+        """
+        Return a context manager timing the enclosed block.
+
+        Usage :
+
+        with profiling.span("sql", statement=sql):
+            ... time consuming stuff ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return Span(self, category, attrs)
+
+    def add_span(self, span):
+        profile = getattr(env.request, "profile", None)
+        if profile is not None:
+            profile.add(span)
+
+        self.observe(span.category, span.duration)
+
+    def observe(self, category, duration):
+        with self._lock:
+            histogram = self._histograms.get(category)
+            if not histogram:
+                histogram = self._histograms[category] = _Histogram()
+
+            histogram.observe(duration)
+
+    def start_request(self, path):
+        if self.enabled:
+            env.request.profile = RequestProfile(path, self.max_spans)
+
+    def end_request(self, response):
+        profile = env.request.profile
+        if profile is None:
+            return
+
+        self.observe("request", time.time() - profile.start)
+
+        if self.server_timing and response.headers is not None:
+            response.headers["Server-Timing"] = profile.server_timing()
+
+        if self.debug_panel and env.request.web.is_xhr:
+            response.add_ext_content("profiling", profile)
+
+    def format_metrics(self):
+        """Return the aggregated histograms using the Prometheus text exposition format"""
+
+        out = ["# TYPE prewikka_duration_seconds histogram"]
+
+        with self._lock:
+            for category, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    out.append('prewikka_duration_seconds_bucket{category="%s",le="%g"} %d' % (category, bound, count))
+
+                out.append('prewikka_duration_seconds_bucket{category="%s",le="+Inf"} %d' % (category, histogram.count))
+                out.append('prewikka_duration_seconds_sum{category="%s"} %f' % (category, histogram.sum))
+                out.append('prewikka_duration_seconds_count{category="%s"} %d' % (category, histogram.count))
+
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+profiler = Profiler()
+span = profiler.span
@@ -21,6 +21,7 @@
 from __future__ import absolute_import, division, print_function
 
 import collections
+import hashlib
 import mimetypes
 import os
 import time
@@ -29,13 +30,23 @@ import dateutil.parser
 import stat
 import string
 import unicodedata
+import zlib
 
 from prewikka import compat, utils
 from prewikka.utils import json
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 _sentinel = object()
 
+# Content types which are worth compressing, other types (images, archives...) are usually compressed already
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-javascript",
+                       "application/xml", "image/svg+xml")
+
 _ADDITIONAL_MIME_TYPES = [("application/vnd.oasis.opendocument.formula-template", ".otf"),
                           ("application/vnd.ms-fontobject", ".eot"),
                           ("image/vnd.microsoft.icon", ".ico"),
@@ -49,6 +60,193 @@ for mtype, extension in _ADDITIONAL_MIME_TYPES:
     mimetypes.add_type(mtype, extension)
 
 
+class _BrotliCompressor(object):
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class Compression(object):
+    """
+        Response compression negotiated from the Accept-Encoding request header.
+
+        Compression is configured through the [compression] section of prewikka.conf.
+    """
+    ENCODINGS = ("br", "gzip", "deflate")
+
+    def __init__(self):
+        self.enabled = False
+        self.level = 6
+        self.min_size = 1024
+        self.encodings = []
+
+    def configure(self, config):
+        self.enabled = config.get_bool("enable", False)
+        self.level = config.get_int("level", 6)
+        self.min_size = config.get_int("min_size", 1024)
+
+        encodings = (i.strip().lower() for i in config.get("encodings", ", ".join(self.ENCODINGS)).split(","))
+        self.encodings = [i for i in encodings if i in self.ENCODINGS and (i != "br" or brotli)]
+
+    @staticmethod
+    def _parse_accept_encoding(value):
+        accepted = {}
+
+        for item in value.split(","):
+            params = item.split(";")
+            quality = 1.
+
+            for param in params[1:]:
+                key, sep, val = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(val)
+                    except ValueError:
+                        quality = 0.
+
+            accepted[params[0].strip().lower()] = quality
+
+        return accepted
+
+    def negotiate(self, request, headers, size=None):
+        """Return the encoding to use for the response, or None if it should not be compressed"""
+
+        if not self.enabled or headers is None or "Content-Encoding" in headers:
+            return None
+
+        if size is not None and size < self.min_size:
+            return None
+
+        if not headers.get("Content-Type", "").startswith(_COMPRESSIBLE_TYPES):
+            return None
+
+        value = getattr(request, "headers", {}).get("accept-encoding")
+        if not value:
+            return None
+
+        accepted = self._parse_accept_encoding(value)
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+
+        return None
+
+    def compressor(self, encoding):
+        if encoding == "br":
+            return _BrotliCompressor(self.level)
+
+        elif encoding == "gzip":
+            return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        return zlib.compressobj(self.level)
+
+
+compression = Compression()
+
+
+def make_etag(*version):
+    """
+        Return a strong ETag for the given data version (e.g. the identifier of the last alert,
+        a configuration revision...). The ETag also depends on the current user and language.
+    """
+    user = env.request.user
+    version = [user.name if user else None, user.get_property("language") if user else None] + list(version)
+
+    return '"%s"' % hashlib.sha1(text_type(version).encode("utf8")).hexdigest()
+
+
+def _strip_etag_encoding(etag):
+    """Return the ETag of the uncompressed representation of the response (see PrewikkaResponse._prepare())"""
+    for encoding in Compression.ENCODINGS:
+        suffix = '-%s"' % encoding
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+
+    return etag
+
+
+def _match_etag(request, etag):
+    value = getattr(request, "headers", {}).get("if-none-match")
+    if not value:
+        return False
+
+    # If-None-Match uses the weak comparison, the encodings being representations of the same content
+    etags = [i.strip() for i in value.split(",")]
+    etag = _strip_etag_encoding(etag)
+    return "*" in etags or etag in (_strip_etag_encoding(i[2:] if i.startswith("W/") else i) for i in etags)
+
+
+def _file_etag(fst):
+    return '"%x-%x-%x"' % (fst.st_ino, int(fst.st_mtime * 1000000), fst.st_size)
+
+
+def _parse_range(value, size):
+    """
+        Return the (first, last) bytes positions of the Range header value, None if the
+        whole content should be sent, or False if the range cannot be satisfied.
+    """
+    if not value or not value.startswith("bytes="):
+        return None
+
+    ranges = value[6:].split(",")
+    if len(ranges) != 1:
+        # Multiple ranges are not supported, the whole content is sent
+        return None
+
+    start, sep, end = ranges[0].strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if not start:
+            # Suffix range: the last bytes of the content
+            start, end = max(size - int(end), 0), size - 1
+            if start > end:
+                return False
+        else:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        return False
+
+    if end < start:
+        return None
+
+    return start, end
+
+
+def check_etag(etag, max_age=0):
+    """
+        Return a 304 (Not Modified) response if the client already holds the given version
+        of the response, None otherwise. This allows views to skip computing the response
+        when a cheap data version is available:
+
+        etag = response.make_etag(last_alert_id)
+        resp = response.check_etag(etag)
+        if resp:
+            return resp
+
+        resp = PrewikkaResponse(... expensive computation ...)
+        resp.set_cache(etag)
+    """
+    if not _match_etag(env.request.web, etag):
+        return None
+
+    resp = PrewikkaResponse(code=304)
+    resp.set_cache(etag, max_age)
+    resp.headers["ETag"] = etag
+
+    return resp
+
+
 class PrewikkaResponse(object):
     """
         HTML response
@@ -67,6 +265,9 @@ class PrewikkaResponse(object):
         self.code = code
         self.status_text = status_text
         self.ext_content = {}
+        self.cache = False
+        self.etag = None
+        self.max_age = 0
 
         if headers is not _sentinel:
             self.headers = headers
@@ -82,6 +283,25 @@ class PrewikkaResponse(object):
                 )
             )
 
+    def set_cache(self, etag=None, max_age=0):
+        """
+            Allow the client to cache the response and to revalidate it using If-None-Match.
+
+            :param str etag: ETag of the response (see make_etag()), computed from the body if None
+            :param int max_age: Number of seconds during which the client may use the response without revalidating it
+        """
+        self.cache = True
+        self.etag = etag
+        self.max_age = max_age
+
+        if self.headers is not None:
+            for header in ("Expires", "Cache-control", "Cache-Control", "Pragma"):
+                self.headers.pop(header, None)
+
+            self.headers["Cache-Control"] = "private, max-age=%d" % max_age if max_age else "private, no-cache"
+
+        return self
+
     def add_ext_content(self, key, value):
         """Add an extra content to the response (add in XHR request)."""
 
@@ -124,14 +344,146 @@ class PrewikkaResponse(object):
     def _encode_response(self, res):
         return res.encode(env.config.general.get("encoding", "utf8"), "xmlcharrefreplace")
 
+    def _get_encoding(self, request, size=None):
+        if self.code not in (None, 200):
+            return None
+
+        encoding = compression.negotiate(request, self.headers, size)
+        if encoding:
+            self.headers.pop("Content-Length", None)
+            self.headers["Content-Encoding"] = encoding
+            self.headers["Vary"] = "Accept-Encoding"
+
+        return encoding
+
+    def _get_etag(self, request, body=None):
+        if self.headers is None or self.code not in (None, 200) or getattr(request, "method", "GET") != "GET":
+            return None
+
+        # JSON responses to XHR requests are usually polled with the same parameters
+        if not self.cache and request.is_xhr and body is not None and self.headers.get("Content-Type") == "application/json":
+            self.set_cache()
+
+        if not self.cache:
+            return None
+
+        if self.etag:
+            return self.etag
+
+        if body is not None:
+            return '"%s"' % hashlib.sha1(body).hexdigest()
+
+        return None
+
+    def _prepare(self, request, size=None, body=None):
+        """Negotiate the encoding and validate the ETag, return the compressor to use or None, and whether the body should be sent"""
+
+        encoding = self._get_encoding(request, size)
+
+        etag = self._get_etag(request, body)
+        if etag:
+            # Each encoding is a different representation of the response
+            if encoding:
+                etag = '%s-%s"' % (etag[:-1], encoding)
+
+            self.headers["ETag"] = etag
+            if _match_etag(request, etag):
+                self.code = 304
+                for header in ("Content-Encoding", "Content-Length"):
+                    self.headers.pop(header, None)
+
+                return None, False
+
+        return compression.compressor(encoding) if encoding else None, True
+
+    def _write_chunks(self, request, chunks, size=None, body=None):
+        """Send the headers and the chunks of the body, compressed if the client supports it"""
+
+        compressor, send_body = self._prepare(request, size, body)
+        request.send_headers(self.headers.items(), self.code or 200, self.status_text)
+
+        if not send_body:
+            return
+
+        if not compressor:
+            for chunk in chunks:
+                request.write(chunk)
+
+            return
+
+        writer = request.compressed_writer(compressor)
+        for chunk in chunks:
+            writer.write(chunk)
+
+        writer.close()
+
+    def _set_range(self, request, fd, size):
+        """Handle the Range request header, return the number of bytes of the file to send"""
+
+        self.headers["Accept-Ranges"] = "bytes"
+
+        headers = getattr(request, "headers", {})
+        byte_range = _parse_range(headers.get("range"), size)
+
+        if_range = headers.get("if-range")
+        if byte_range is None or (if_range and if_range not in (self.etag, self.headers.get("Last-Modified"))):
+            return size
+
+        if byte_range is False:
+            self.code = 416
+            self.headers["Content-Range"] = "bytes */%d" % size
+            self.headers["Content-Length"] = "0"
+            return 0
+
+        start, end = byte_range
+        fd.seek(start, os.SEEK_CUR)
+
+        self.code = 206
+        self.headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+        self.headers["Content-Length"] = str(end - start + 1)
+
+        return end - start + 1
+
+    def _write_file(self, request, fd, size):
+        """Send the headers and size bytes of the fd file, which is closed once sent"""
+
+        try:
+            compressor, send_body = self._prepare(request, size)
+
+            length = size
+            if send_body and not compressor:
+                length = self._set_range(request, fd, size)
+
+            request.send_headers(self.headers.items(), self.code or 200, self.status_text)
+            if not send_body or not length:
+                return
+
+            if compressor:
+                writer = request.compressed_writer(compressor)
+                for chunk in iter(lambda: fd.read(8192), b''):
+                    writer.write(chunk)
+
+                return writer.close()
+
+            # The request now owns the file
+            fd, fd_ = None, fd
+            request.send_file(fd_, length)
+
+        finally:
+            if fd:
+                fd.close()
+
     def write(self, request):
         content = self.content()
-        if content is None and self.code is None:
-            self.code = 204
+        if content is None:
+            if self.code is None:
+                self.code = 204
 
-        request.send_headers(self.headers.items(), self.code or 200, self.status_text)
-        if content is not None:
-            request.write(self._encode_response(content))
+            request.send_headers(self.headers.items(), self.code or 200, self.status_text)
+            return
+
+        content = self._encode_response(content)
+        self._write_chunks(request, [content], len(content), content)
 
 
 class PrewikkaDownloadResponse(PrewikkaResponse):
@@ -169,11 +521,21 @@ class PrewikkaDownloadResponse(PrewikkaResponse):
             )
 
         self._is_file = not(isinstance(self.data, text_type))
-        if not size:
-            if self._is_file:
-                size = os.fstat(self.data.fileno()).st_size
+        if not self._is_file:
+            size = size or len(data)
+
+        else:
+            try:
+                fst = os.fstat(self.data.fileno())
+            except (AttributeError, OSError, ValueError):
+                # File object without a descriptor, its size must be provided
+                pass
             else:
-                size = len(data)
+                self.etag = _file_etag(fst)
+                self.cache = True
+                size = size or fst.st_size
+
+        self._size = size
 
         self.headers.update((
             ("Content-Type", type),
@@ -184,13 +546,10 @@ class PrewikkaDownloadResponse(PrewikkaResponse):
         ))
 
     def write(self, request):
-        request.send_headers(self.headers.items(), self.code or 200, self.status_text)
-
         if not self._is_file:
-            request.write(self.data)
+            self._write_chunks(request, [self.data], self._size)
         else:
-            for i in iter(lambda: self.data.read(8192), b''):
-                request.write(i)
+            self._write_file(request, self.data, self._size)
 
 
 class PrewikkaFileResponse(PrewikkaResponse):
@@ -208,13 +567,18 @@ class PrewikkaFileResponse(PrewikkaResponse):
         content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
         mtime = datetime.datetime.utcfromtimestamp(fst.st_mtime).replace(tzinfo=utils.timeutil.tzutc())
 
+        self.etag = _file_etag(fst)
+        self.cache = True
+
+        # If-None-Match takes precedence over If-Modified-Since
         ims = env.request.web.headers.get("if-modified-since")
-        if ims is not None:
+        if ims is not None and not env.request.web.headers.get("if-none-match"):
             ims = dateutil.parser.parse(ims.split(";")[0])  # Edge includes the length in this header
             if mtime <= ims:
                 self.code = 304
 
         self.headers = collections.OrderedDict((('Content-Type', content_type),))
+        self._size = fst.st_size
 
         if self.code != 304:
             self.headers["Content-Length"] = str(fst.st_size)
@@ -222,13 +586,11 @@ class PrewikkaFileResponse(PrewikkaResponse):
             self.headers["Last-Modified"] = mtime.strftime("%a, %d %b %Y %H:%M:%S GMT")
 
     def write(self, request):
-        request.send_headers(self.headers.items(), self.code or 200, self.status_text)
         if self.code == 304:
+            request.send_headers(self.headers.items(), self.code, self.status_text)
             return
 
-        with open(self._path, 'rb') as fd:
-            for i in iter(lambda: fd.read(8192), b''):
-                request.write(i)
+        self._write_file(request, open(self._path, 'rb'), self._size)
 
 
 class PrewikkaRedirectResponse(PrewikkaResponse):
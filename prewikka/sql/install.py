@@ -7,7 +7,7 @@ from prewikka.database import SQLScript
 class SQLUpdate(SQLScript):
     type = "install"
     branch = version.__branch__
-    version = "0"
+    version = "3"
 
     def run(self):
         self.query("""
@@ -100,6 +100,9 @@ CREATE TABLE Prewikka_Crontab (
     enabled TINYINT DEFAULT 1,
     runcnt  INTEGER DEFAULT 0,
     error TEXT NULL,
+    progress TEXT NULL,
+    duration FLOAT NULL,
+    revision INTEGER DEFAULT 0,
     FOREIGN KEY (userid) REFERENCES Prewikka_User(userid) ON DELETE CASCADE
 ) ENGINE=InnoDB;
 
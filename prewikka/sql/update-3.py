@@ -0,0 +1,15 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka import version
+from prewikka.database import SQLScript
+
+
+class SQLUpdate(SQLScript):
+    type = "update"
+    branch = version.__branch__
+    version = "3"
+
+    def run(self):
+        self.query("""
+ALTER TABLE Prewikka_Crontab ADD COLUMN revision INTEGER DEFAULT 0;
+""")
@@ -20,6 +20,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import collections
+import copy
 import functools
 
 from prewikka import dataprovider, hookmanager, mainmenu, usergroup, utils
@@ -61,8 +62,12 @@ class GenericChart(object):
         self._link_params = options.pop("linkparams", {})
 
     def _make_link(self, force_default=False, **params):
+        return self._get_link_template(force_default)(**params)
+
+    def _get_link_template(self, force_default=False, **params):
+        """Return a function building the links with the given parameters and the ones it is called with"""
         if self._link_mode is None:
-            return None
+            return lambda **kwargs: None
 
         elif self._link_mode == "immediate":
             linkview = self._link_view or self._default_view
@@ -71,13 +76,17 @@ class GenericChart(object):
             linkview = (self._link_view or env.request.view) if not(force_default) else self._default_view
 
         if not linkview:
-            return None
+            return lambda **kwargs: None
 
         if self._link_view and self._link_params:
-            params.pop("criteria")  # Since the calling view provides its own parameters, we should not pass criteria
+            # Since the calling view provides its own parameters, we should not pass criteria
+            params.pop("criteria", None)
             params.update(self._link_params)
 
-        return linkview.make_url(**params)
+            template = env.viewmanager.url_template(linkview.view_endpoint, **params)
+            return lambda criteria=None, **kwargs: template(**kwargs)
+
+        return env.viewmanager.url_template(linkview.view_endpoint, **params)
 
     def _set_menu(self):
         period = self.options.get("period")
@@ -137,14 +146,21 @@ class DiagramChart(GenericChart):
     default_aggregation = "count(1)"
 
     def _get_series(self, query):
-        for count, category, crit in self._get_categories(query):
-            link = self._make_link(criteria=crit & query.criteria, **self._menu.get_parameters())
-            yield RendererItem(count, category, link)
+        # The query is issued right away, its results are read when iterating
+        return self._iterate_series(query, self._get_categories(query))
+
+    def _iterate_series(self, query, categories):
+        make_link = self._get_link_template(**self._menu.get_parameters())
+        for count, category, crit in categories:
+            yield RendererItem(count, category, make_link(criteria=crit & query.criteria))
 
     def _get_categories(self, query):
         all_paths, all_criteria = self._prepare_query(query)
+        return self._iterate_categories(query, self._query(all_paths, all_criteria, limit=query.limit, type=query.datatype))
 
-        for row in self._query(all_paths, all_criteria, limit=query.limit, type=query.datatype):
+    @staticmethod
+    def _iterate_categories(query, rows):
+        for row in rows:
             count = row[0]
             category = tuple(row[1:])
             crit = functools.reduce(lambda x, y: x & y, (Criterion(path, '=', row[i + 1])
@@ -155,17 +171,20 @@ class DiagramChart(GenericChart):
         if len(self.query) == 1:
             return [list(self._get_series(self.query[0]))]
 
-        data = []
+        series = []
         subquery = self.query[1]
-        base_criteria = subquery.criteria
         self.options["subtitle"] = []
-        for count, category, crit in self._get_categories(self.query[0]):
-            subquery.criteria = crit & base_criteria
-            subchart = DiagramChart(self.chart_type, category, [subquery], period=self.options.get("period"))
-            data.append(subchart.get_data()[0])
-            self.options["subtitle"].append(category)
 
-        return data
+        # All the subqueries are issued before reading their results, so that backends can batch them
+        with env.dataprovider.batch():
+            for count, category, crit in self._get_categories(self.query[0]):
+                query = copy.copy(subquery)
+                query.criteria = crit & subquery.criteria
+                subchart = DiagramChart(self.chart_type, category, [query], period=self.options.get("period"))
+                series.append(subchart._get_series(query))
+                self.options["subtitle"].append(category)
+
+        return [list(items) for items in series]
 
 
 class ChronologyChart(GenericChart):
@@ -175,20 +194,31 @@ class ChronologyChart(GenericChart):
     _number_of_points = 100
 
     def _get_series(self, query, selection, date_precision):
-        selection_index = len(query.paths) + 1
+        return self._read_series(query, date_precision, *self._query_series(query, selection))
+
+    def _query_series(self, query, selection):
         all_paths, all_criteria = self._prepare_query(query)
         series_order = []
 
         crit = Criterion()
         if query.limit > 0 and query.paths:
             for values in self._query(all_paths, all_criteria, limit=query.limit, type=query.datatype):
-                crit |= functools.reduce(lambda x, y: x & y, (Criterion(query.paths[i], "=", value) for i, value in enumerate(values[1:])))
                 series_order.append(tuple(values[1:]))
 
+            if len(query.paths) == 1:
+                crit = Criterion(query.paths[0], "in", [values[0] for values in series_order])
+            else:
+                crit = Criterion(tuple(query.paths), "in", series_order)
+
         res = []
         if query.limit != 0:
             res = self._query(all_paths + selection, all_criteria + crit, type=query.datatype)
 
+        return series_order, res
+
+    def _read_series(self, query, date_precision, series_order, res):
+        selection_index = len(query.paths) + 1
+
         out = {}
         for i in res:
             key = tuple(i[1:selection_index]) or (self.title,)
@@ -236,18 +266,20 @@ class ChronologyChart(GenericChart):
         else:
             default_values = {key: self._get_default_value(self.query[i].datatype) for i, key in enumerate(data)}
 
+        if base_parameters:
+            make_link = self._get_link_template(force_default=not(can_zoom), criteria=self.query[0].criteria, **base_parameters)
+
         start = self._menu.start
         while start < self._menu.end:
             next = utils.timeutil.truncate(start + step.timedelta, step.unit)
             next = min(next, self._menu.end)
 
             if base_parameters:
-                base_parameters["timeline_start"] = self._menu.mktime_param(start)
-                base_parameters["timeline_end"] = self._menu.mktime_param(next)
+                timeline_end = self._menu.mktime_param(next)
                 if next != self._menu.end:
-                    base_parameters["timeline_end"] -= 1
+                    timeline_end -= 1
 
-                ret = self._make_link(force_default=not(can_zoom), criteria=self.query[0].criteria, **base_parameters)
+                ret = make_link(timeline_start=self._menu.mktime_param(start), timeline_end=timeline_end)
                 if ret:
                     links.append(ret)
 
@@ -269,9 +301,13 @@ class ChronologyChart(GenericChart):
         if len(self.query) == 1:
             data = self._get_series(self.query[0], selection, date_precision)
         else:
+            # All the queries are issued before reading their results, so that backends can batch them
+            with env.dataprovider.batch():
+                results = [self._query_series(query, selection) for query in self.query]
+
             data = collections.OrderedDict()
-            for query in self.query:
-                series = self._get_series(query, selection, date_precision).get((self.title,), {})
+            for query, result in zip(self.query, results):
+                series = self._read_series(query, date_precision, *result).get((self.title,), {})
                 legend = query.aggregation.replace("(1)", "(%s)" % query.datatype)
                 data[(legend,)] = series
 
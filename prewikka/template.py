@@ -26,7 +26,7 @@ import mako.lookup
 import mako.template
 import pkg_resources
 
-from prewikka import siteconfig
+from prewikka import profiling, siteconfig
 from prewikka.utils import cache
 
 
@@ -100,11 +100,12 @@ class _PrewikkaTemplate(object):
         if self._error:
             raise self._error
 
-        return self._template.render(**kwargs)
+        with profiling.span("template", template=self._name):
+            return self._template.render(**kwargs)
 
 
 class _PrewikkaTemplateProxy(object):
-    @cache.memoize("cache")
+    @cache.memoize("template_cache", maxsize=512)
     def __call__(self, *args):
         return _PrewikkaTemplate(*args)
 
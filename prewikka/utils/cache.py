@@ -21,31 +21,76 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import collections
 import functools
+import time
+import weakref
 
-_CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "size"])
+try:
+    from threading import Lock
+except ImportError:
+    from dummy_threading import Lock
+
+_CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "size", "evictions", "maxsize"])
+
+# Every live cache object, see get_infos()
+_REGISTRY = weakref.WeakSet()
 
 
 class _Cache(object):
     _missing = object()
 
-    def __init__(self, func):
-        self._cache = {}
+    def __init__(self, func, name=None, maxsize=None, ttl=None):
+        self._cache = collections.OrderedDict()
         self._cached_func = func
-        self._hits = self._misses = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = Lock()
+
+        self.name = name or func.__name__
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        _REGISTRY.add(self)
+
+    @staticmethod
+    def _make_key(args, kwargs):
+        return (args, tuple(kwargs.items()))
 
     def _set(self, key, value):
-        self._cache[key] = value
+        expire = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (value, expire)
+
+            while self.maxsize and len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+
         return value
 
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._cache.pop(key, self._missing)
+            if entry is self._missing:
+                self._misses += 1
+                return entry
+
+            value, expire = entry
+            if expire and expire <= time.time():
+                self._misses += 1
+                return self._missing
+
+            # Move the entry to the most recently used end
+            self._cache[key] = entry
+            self._hits += 1
+            return value
+
     def _get(self, *args, **kwargs):
-        key = (args, tuple(kwargs.items()))
+        key = self._make_key(args, kwargs)
         try:
-            value = self._cache.get(key, self._missing)
+            value = self._lookup(key)
             if value is not self._missing:
-                self._hits = self._hits + 1
                 return value
 
-            self._misses = self._misses + 1
             return self._set(key, self._cached_func(*args, **kwargs))
 
         except TypeError as e:
@@ -55,16 +100,54 @@ class _Cache(object):
             return self._cached_func(*args, **kwargs)
 
     def clear(self):
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
 
     def infos(self):
-        return _CacheInfo(self._hits, self._misses, len(self._cache))
+        return _CacheInfo(self._hits, self._misses, len(self._cache), self._evictions, self.maxsize)
+
+
+def get_infos():
+    """
+        Return the statistics of the live caches as a list of (name, CacheInfo) tuples sorted by name.
+
+        The statistics of the caches sharing the same name (e.g. one cache per instance of
+        a class using @memoize) are summed.
+    """
+    out = {}
+
+    for cache in list(_REGISTRY):
+        infos = cache.infos()
+        prev = out.get(cache.name)
+        if prev:
+            infos = _CacheInfo(*(a + b for a, b in zip(prev[:4], infos[:4])), maxsize=infos.maxsize)
+
+        out[cache.name] = infos
+
+    return sorted(out.items())
+
+
+def format_metrics():
+    """Return the caches statistics using the Prometheus text exposition format"""
+
+    out = []
+    infos = get_infos()
+
+    for metric, field, _type in (("hits_total", "hits", "counter"), ("misses_total", "misses", "counter"),
+                                 ("evictions_total", "evictions", "counter"), ("entries", "size", "gauge")):
+        out.append("# TYPE prewikka_cache_%s %s" % (metric, _type))
+        for name, info in infos:
+            out.append('prewikka_cache_%s{cache="%s"} %d' % (metric, name, getattr(info, field)))
+
+    return "\n".join(out) + "\n"
 
 
 class _memoize(object):
-    def __init__(self, func, name):
+    def __init__(self, func, name, maxsize=None, ttl=None):
         self.func = func
         self.cache_objname = name
+        self.maxsize = maxsize
+        self.ttl = ttl
 
     def __call__(self, obj, *args, **kwargs):
         return self._setup_cache(obj)._get(obj, *args, **kwargs)
@@ -72,7 +155,7 @@ class _memoize(object):
     def _setup_cache(self, obj):
         cache = getattr(obj, self.cache_objname, None)
         if not cache:
-            cache = _Cache(self.func)
+            cache = _Cache(self.func, self.cache_objname, self.maxsize, self.ttl)
             setattr(obj, self.cache_objname, cache)
 
         return cache
@@ -82,9 +165,9 @@ class _memoize(object):
 
 
 class _memoize_property(_memoize):
-    def __init__(self, func, name):
+    def __init__(self, func, name, maxsize=None, ttl=None):
         self._set_func = None
-        _memoize.__init__(self, func, name)
+        _memoize.__init__(self, func, name, maxsize, ttl)
 
     def setter(self, func):
         self._set_func = func
@@ -95,7 +178,8 @@ class _memoize_property(_memoize):
             return
 
         self._set_func(obj, value)
-        self._setup_cache(obj)._set((obj,), value)
+        cache = self._setup_cache(obj)
+        cache._set(cache._make_key((obj,), {}), value)
 
     def __get__(self, obj, objtype):
         return _memoize.__get__(self, obj, objtype)()
@@ -118,25 +202,31 @@ class memoize(object):
         Note that calling the cached function with different arguments result in different cache
         entry.
 
+        The optional maxsize argument bounds the number of entries, the least recently used entry
+        being evicted when it is reached. The optional ttl argument is the number of seconds after
+        which an entry is computed again.
+
         Usage :
 
-        @memoize("expensive_cache")
+        @memoize("expensive_cache", maxsize=128, ttl=3600)
         def get_expensive_stuff(self, arg1, argN):
             ... time consuming stuff ...
 
         The created cache object provide the following API:
-        - Cache hits/misses/size statistics:
+        - Cache hits/misses/size/evictions statistics:
           self.expensive_cache.infos()
 
         - Clearing the cache:
           self.expensive_cache.clear()
     """
 
-    def __init__(self, name):
+    def __init__(self, name, maxsize=None, ttl=None):
         self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
 
     def __call__(self, func):
-        return _memoize(func, self.name)
+        return _memoize(func, self.name, self.maxsize, self.ttl)
 
 
 class memoize_property(object):
@@ -157,11 +247,13 @@ class memoize_property(object):
         - Clearing the cache:
           self.my_property_cache.clear()
     """
-    def __init__(self, name):
+    def __init__(self, name, maxsize=None, ttl=None):
         self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
 
     def __call__(self, func):
-        return _memoize_property(func, self.name)
+        return _memoize_property(func, self.name, self.maxsize, self.ttl)
 
 
 class request_memoize(object):
@@ -185,11 +277,13 @@ class request_memoize(object):
         - Clearing the cache:
           env.request.cache.expensive_cache.clear()
     """
-    def __init__(self, name):
+    def __init__(self, name, maxsize=None, ttl=None):
         self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
 
     def __call__(self, func):
-        return _request_memoize(func, self.name)
+        return _request_memoize(func, self.name, self.maxsize, self.ttl)
 
 
 class request_memoize_property(object):
@@ -211,8 +305,10 @@ class request_memoize_property(object):
         - Clearing the cache:
           env.request.cache.my_property_cache.clear()
     """
-    def __init__(self, name):
+    def __init__(self, name, maxsize=None, ttl=None):
         self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
 
     def __call__(self, func):
-        return _request_memoize_property(func, self.name)
+        return _request_memoize_property(func, self.name, self.maxsize, self.ttl)
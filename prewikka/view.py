@@ -20,6 +20,7 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import re
 import sys
 
 from copy import copy
@@ -508,6 +509,95 @@ def route(path, method=_SENTINEL, methods=["GET"], permissions=[], menu=None, la
     return ret
 
 
+class URLTemplate(object):
+    """
+    URLs of an endpoint sharing a fixed set of parameters.
+
+    Calling the template with the varying parameters returns the URL url_for()
+    would return given both the fixed and varying parameters. The URL is only
+    built once for each set of varying parameter names, the values of these
+    parameters are then percent-encoded and substituted into it.
+    """
+
+    _MARKER = "prewikka-url-template-%d-"
+    _MARKER_REGEX = re.compile(r"prewikka-url-template-(\d+)-")
+    _VALUE_TYPES = (text_type, int, float)
+
+    def __init__(self, endpoint, _default=_SENTINEL, **kwargs):
+        self.endpoint = endpoint
+        self._default = _default
+        self._kwargs = kwargs
+
+        # Templates are shared by the concurrent requests: the URL adapter and the
+        # templates built with it are replaced together, so that a request never
+        # uses the templates built with the adapter of another one
+        self._cache = (None, {})
+
+    def _compile(self, adapter, view, names):
+        values = view.make_parameters(**self._kwargs)
+        values.update((name, self._MARKER % i) for i, name in enumerate(names))
+
+        try:
+            url = adapter.build(view.view_endpoint, values=values)
+        except Exception:
+            return None
+
+        # The varying parameters must each appear once in the query string
+        path, sep, query = url.partition("?")
+        parts = self._MARKER_REGEX.split(query)
+        indexes = [int(i) for i in parts[1::2]]
+        if sorted(indexes) != list(range(len(names))) or self._MARKER_REGEX.search(path):
+            return None
+
+        parts[0] = path + sep + parts[0]
+        return parts[0::2], [names[i] for i in indexes]
+
+    @staticmethod
+    def _quote(value):
+        # Same encoding as werkzeug for the query string values
+        return text_type(utils.url.quote_plus(text_type(value).encode("utf8")))
+
+    def _get_parameters(self, view, kwargs):
+        if not view or any(view.view_endpoint in env.viewmanager._route_override[i] for i in ("make_url", "make_parameters")):
+            return None
+
+        values = view.make_parameters(**kwargs)
+        if not all(isinstance(value, self._VALUE_TYPES) for value in values.values()):
+            return None
+
+        return values
+
+    def __call__(self, **kwargs):
+        view = env.viewmanager.get_view(self.endpoint)
+        values = self._get_parameters(view, kwargs)
+
+        template = None
+        if values is not None:
+            adapter = env.viewmanager.url_adapter
+            cached_adapter, templates = self._cache
+            if adapter is not cached_adapter:
+                templates = {}
+                self._cache = (adapter, templates)
+
+            key = (view, tuple(values))
+            template = templates.get(key, _SENTINEL)
+            if template is _SENTINEL:
+                template = self._compile(adapter, view, key[1])
+                templates[key] = template
+
+        if not template:
+            # Values werkzeug would encode differently (None, lists...), or URL built by the view itself
+            kwargs = dict(self._kwargs, **kwargs)
+            return env.viewmanager.url_for(self.endpoint, _default=self._default, **kwargs)
+
+        literals, names = template
+        url = [literals[0]]
+        for name, literal in zip(names, literals[1:]):
+            url += [self._quote(values[name]), literal]
+
+        return "".join(url)
+
+
 class ViewManager(registrar.DelayedRegistrar):
     def __init__(self):
         registrar.DelayedRegistrar.__init__(self)
@@ -623,6 +713,37 @@ class ViewManager(registrar.DelayedRegistrar):
 
         self._generic_add_view(v, path, methods=methods, defaults=defaults)
 
+    def unload_views(self, owner):
+        """Remove every route provided by the view plugin instance `owner`"""
+
+        rules = []
+        for rule in self._rule_map.iter_rules():
+            view = rule._prewikka_view
+            if getattr(view, "view_base", view) is not owner:
+                rules.append(rule)
+                continue
+
+            self._views_endpoints.pop(view.view_endpoint, None)
+            for views in self._references.values():
+                if view in views:
+                    views.remove(view)
+
+            if env.menumanager:
+                env.menumanager.remove_section_info(view.view_endpoint)
+
+        # werkzeug does not support rule removal: rebuild the map from the remaining rules
+        self._rule_map = Map(converters={'list': ListConverter})
+        for rule in rules:
+            new = rule.empty()
+            new._prewikka_view = rule._prewikka_view
+            self._rule_map.add(new)
+
+        _URL_ADAPTER_CACHE.clear()
+
+        usergroup.ACTIVE_PERMISSIONS.clear()
+        for view in self._views_endpoints.values():
+            usergroup.ACTIVE_PERMISSIONS.declare(view.view_permissions)
+
     def load_views(self, autoupdate=False):
         self._init()
         self.get_baseview()
@@ -641,6 +762,13 @@ class ViewManager(registrar.DelayedRegistrar):
 
         return ad
 
+    def url_template(self, endpoint, _default=_SENTINEL, **kwargs):
+        """
+        Return a URLTemplate building the URLs of endpoint with the kwargs parameters,
+        for links generated in bulk (e.g. for each row or bucket).
+        """
+        return URLTemplate(endpoint, _default, **kwargs)
+
     def url_for(self, endpoint, _default=_SENTINEL, **kwargs):
         view = self.get_view(endpoint=endpoint)
         if not view:
@@ -36,9 +36,7 @@ class Agents(view.View):
         if not results:
             return
 
-        c = Criterion()
-        for create_time, analyzerid in results:
-            c |= Criterion("heartbeat.create_time", "==", create_time) & Criterion("heartbeat.analyzer(-1).analyzerid", "==", analyzerid)
+        c = Criterion(("heartbeat.create_time", "heartbeat.analyzer(-1).analyzerid"), "in", [tuple(row) for row in results])
 
         agents = {
             "up": utils.AttrObj(count=0, title=_("Online"), label="label-success", status=["online"]),
@@ -86,9 +84,7 @@ class Agents(view.View):
         if not results:
             return
 
-        c = Criterion()
-        for create_time, analyzerid in results:
-            c |= Criterion("heartbeat.create_time", "==", create_time) & Criterion("heartbeat.analyzer(-1).analyzerid", "==", analyzerid)
+        c = Criterion(("heartbeat.create_time", "heartbeat.analyzer(-1).analyzerid"), "in", [tuple(row) for row in results])
 
         for heartbeat in env.dataprovider.get(c):
             heartbeat = heartbeat["heartbeat"]
@@ -145,11 +141,7 @@ class Agents(view.View):
             if i not in ("alert", "heartbeat"):
                 continue
 
-            c = Criterion()
-
-            for analyzerid in env.request.parameters.getlist("id"):
-                c |= Criterion("%s.analyzer.analyzerid" % i, "=", analyzerid)
-
+            c = Criterion("%s.analyzer.analyzerid" % i, "in", env.request.parameters.getlist("id"))
             env.dataprovider.delete(c)
 
         return response.PrewikkaRedirectResponse(url_for(".agents"))
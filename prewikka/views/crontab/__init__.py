@@ -74,6 +74,7 @@ class CrontabView(view.View):
             "name": lambda x: _(crontab.format(x.ext_type, x.name)).lower(),
             "user": lambda x: text_type(x.user) if x.user else _("SYSTEM"),
             "last": lambda x: x.base,
+            "duration": lambda x: x.duration or 0,
             "next": lambda x: x.next_schedule - now if x.enabled else datetime.timedelta.max,
         }
         sort_key = sort_func.get(sort_index, sort_func["name"])
@@ -94,6 +95,11 @@ class CrontabView(view.View):
             else:
                 last = _("n/a")
 
+            if i.duration is not None:
+                duration = localization.format_timedelta(datetime.timedelta(seconds=i.duration), granularity="second")
+            else:
+                duration = _("n/a")
+
             if i.error:
                 last = resource.HTMLNode("a", _("Error"), _class="cronjob-error")
 
@@ -103,6 +109,7 @@ class CrontabView(view.View):
                 "schedule": crontab.format_schedule(i.schedule),
                 "user": text_type(i.user) if i.user else _("SYSTEM"),
                 "last": last,
+                "duration": duration,
                 "next": next,
                 "error": i.error
             })
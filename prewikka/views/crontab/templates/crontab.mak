@@ -18,6 +18,7 @@ from prewikka.utils import html
             {name: 'schedule', label: "${ _('Schedule') }", width: 8, sortable: false},
             {name: 'user', label: "${ _('User') }", width: 10},
             {name: 'last', label: "${ _('Last execution') }", width: 10},
+            {name: 'duration', label: "${ _('Duration') }", width: 8},
             {name: 'next', label: "${ _('Next execution') }", width: 10},
         ],
         datatype: "json",
@@ -30,6 +30,7 @@ import itertools
 import operator
 import pkg_resources
 import re
+import time
 
 from prewikka.utils import json
 from prewikka import error, history, hookmanager, mainmenu, resource, response, template, utils, view
@@ -40,6 +41,8 @@ from prewikka.localization import format_datetime, format_timedelta
 from prewikka.renderer import RendererItem
 from prewikka.statistics import ChronologyChart, DiagramChart, Query
 
+from . import livetail
+
 
 COLUMN_PROPERTIES = functools.partial(utils.AttrObj, hidden=False, align="center", cellattr="default_cellattr")
 
@@ -61,6 +64,7 @@ class DataSearchParameters(view.Parameters):
         self.optional("query_mode", text_type, save=True)
         self.optional("editable", int, save=True)
         self.optional("condensed", int, save=True)
+        self.optional("live", int, save=True)
         self.optional("expert", int, save=True)
         self.optional("jqgrid_params_datasearch_table", json.loads, default={}, persist=True)
 
@@ -151,6 +155,7 @@ class QueryParser(object):
         self._result = None
         self._parent = parent
         self._date_selection_index = None
+        self._link_templates = {}
 
         self.criteria = self.get_criteria(query)
         self.all_criteria = self.criteria + env.request.menu.get_criteria()
@@ -233,8 +238,17 @@ class QueryParser(object):
 
         return text_type(Criterion(path, "==", value))
 
+    def _get_link_template(self, cview, query_mode):
+        template = self._link_templates.get((cview, query_mode))
+        if not template:
+            url_param = env.request.menu.get_parameters()
+            url_param["limit"] = env.request.parameters["limit"]
+            template = self._link_templates[(cview, query_mode)] = env.viewmanager.url_template(cview, query_mode=query_mode, **url_param)
+
+        return template
+
     def get_groupby_link(self, groups, values, step, cview):
-        url_param = env.request.menu.get_parameters()
+        url_param = {}
         query_mode = env.request.parameters.get("query_mode", self._parent.criterion_config_default)
 
         query = []
@@ -250,12 +264,8 @@ class QueryParser(object):
                 url_param["timeline_start"] = mainmenu.TimePeriod.mktime_param(value, precision)
                 url_param["timeline_end"] = mainmenu.TimePeriod.mktime_param((value + step.timedelta), precision) - 1
 
-        url_param.update({
-            "limit": env.request.parameters["limit"]
-        })
-
         query_str = (" %s " % self._parent.criterion_config[query_mode]["operators"]["AND"][0]).replace("  ", " ").join(query)
-        return url_for(cview, query=query_str, query_mode=query_mode, **url_param)
+        return self._get_link_template(cview, query_mode)(query=query_str, **url_param)
 
     def get_step(self):
         if self._time_group:
@@ -366,7 +376,17 @@ class QueryParser(object):
         return env.dataprovider.query(self.get_paths(), self.all_criteria, limit=self.limit, offset=self.offset, type=self.type)
 
     def _groupby_query(self):
-        return self._query()
+        return env.dataprovider.query(self.get_paths(), self.all_criteria, limit=self.limit, offset=self.offset, type=self.type, with_total=True)
+
+    def get_tail_result(self, criteria, offset=0):
+        """Return the rows matching criteria, ordered by time, ignoring the time period of the menu"""
+        return env.dataprovider.query(self.get_paths(), criteria, limit=self.limit, offset=offset, type=self.type)
+
+    def get_tail_time(self, row):
+        return row[self.get_index(self._parent.sort_path_default)]
+
+    def get_tail_key(self, row):
+        return tuple(text_type(value) for value in row)
 
 
 class DataSearch(view.View):
@@ -387,6 +407,13 @@ class DataSearch(view.View):
     expert_enabled = False
     _extra_resources = []
 
+    # Live tail settings: interval between two backend polls, maximum number of rows
+    # per poll, interval between two keepalive messages and connection lifetime (seconds)
+    tail_interval = 5
+    tail_limit = 100
+    tail_keepalive = 15
+    tail_duration = 600
+
     criterion_config["lucene"] = {
         "format": '{operator}{path}:{value}',
         "operators": {
@@ -433,6 +460,7 @@ class DataSearch(view.View):
         view.route("/%s/forensic/ajax_details" % self.name, self.ajax_details)
         view.route("/%s/forensic/ajax_infos" % self.name, self.ajax_infos)
         view.route("/%s/forensic/ajax_groupby" % self.name, self.ajax_groupby)
+        view.route("/%s/forensic/ajax_tail" % self.name, self.ajax_tail)
         view.route("/%s/forensic/csv_download" % self.name, self.csv_download, methods=["POST"])
         view.route("/%s/forensic" % self.name, self.forensic, menu=(section, tabs[0]), keywords=["listing", "inheritable"],
                    datatype=self.type, priority=1, help="#%sforensic" % self.type, methods=["POST", "GET"])
@@ -603,9 +631,7 @@ class DataSearch(view.View):
 
         return r
 
-    def ajax_table(self):
-        search = self._prepare(int(env.request.parameters.get("page", 1)), int(env.request.parameters.get("rows", 30)))
-        results = search.get_result()
+    def _get_rows(self, search, results):
         resrows = []
 
         extradata = list(self._trigger_datasearch_hook("EXTRA_DATA", results))
@@ -626,7 +652,59 @@ class DataSearch(view.View):
 
             resrows.append({"id": text_type(i), "cell": cells})
 
-        return utils.viewhelpers.GridAjaxResponse(resrows, results.total, criteria=search.all_criteria).add_html_content(mainmenu.HTMLMainMenu(update=True))
+        return resrows
+
+    def ajax_table(self):
+        search = self._prepare(int(env.request.parameters.get("page", 1)), int(env.request.parameters.get("rows", 30)))
+        results = search.get_result()
+        resrows = self._get_rows(search, results)
+
+        resp = utils.viewhelpers.GridAjaxResponse(resrows, results.total, criteria=search.all_criteria).add_html_content(mainmenu.HTMLMainMenu(update=True))
+        return self._add_partial_notification(resp, results)
+
+    @staticmethod
+    def _add_partial_notification(resp, results):
+        # Only the results of dataprovider queries may be partial
+        if getattr(results, "partial", False):
+            resp.add_notification(_("The query timed out: only part of the results are displayed."), classname="warning")
+
+        return resp
+
+    def _tail_fetch(self, search, criteria, since, offset):
+        criteria = criteria + Criterion("%s.%s" % (self.type, self.sort_path_default), ">=", since)
+        return [(search.get_tail_time(row), search.get_tail_key(row), row) for row in search.get_tail_result(criteria, offset)]
+
+    def ajax_tail(self):
+        """
+        Stream the rows matching the search as they arrive, using Server-Sent Events.
+
+        The backend is only queried for rows newer than the last seen one, by a
+        single poller shared by all the clients following the same criteria.
+        """
+        search = self.query_parser(env.request.parameters.get("query"), parent=self,
+                                   orderby=[(self.sort_path_default, "asc")], limit=self.tail_limit)
+
+        # The filter criteria are normally added by the dataprovider: include them
+        # so that clients using different filters do not share the same source
+        criteria = search.criteria
+        for c in filter(None, hookmanager.trigger("HOOK_DATAPROVIDER_CRITERIA_PREPARE", self.type)):
+            criteria = criteria + c
+
+        send_stream = env.request.web.send_stream
+        send_stream(json.dumps({"interval": self.tail_interval}), event="begin", sync=True)
+
+        end = time.time() + self.tail_duration
+        fetch = functools.partial(self._tail_fetch, search, criteria)
+
+        with livetail.follow((self.type, json.dumps(criteria)), fetch, self.tail_interval) as source:
+            seq = source.seq
+            while time.time() < end:
+                seq, results = source.get(seq, min(self.tail_keepalive, end - time.time()))
+
+                # Empty messages are sent as keepalive
+                send_stream(json.dumps({"rows": self._get_rows(search, results) if results else []}), sync=True)
+
+        send_stream("close", event="close")
 
     def ajax_details(self):
         tmpl = template.PrewikkaTemplate(__name__, "templates/details.mak")
@@ -686,8 +764,13 @@ class DataSearch(view.View):
             cells["_aggregation"] = resource.HTMLNode("a", values[0], href=link)
             resrows.append({"id": text_type(i), "cell": cells})
 
-        total = (page if len(resrows) < limit else page + 1) * limit
-        return utils.viewhelpers.GridAjaxResponse(resrows, total).add_html_content(mainmenu.HTMLMainMenu(update=True))
+        total = results.total
+        if total is None:
+            # The number of groups is unknown, let the grid offer one more page as long as it is full
+            total = (page if len(resrows) < limit else page + 1) * limit
+
+        resp = utils.viewhelpers.GridAjaxResponse(resrows, total).add_html_content(mainmenu.HTMLMainMenu(update=True))
+        return self._add_partial_notification(resp, results)
 
 
 class ResultDatetimeIterator(object):
@@ -536,7 +536,60 @@ function DataSearchPage(backend, criterion_config, criterion_config_default, sep
         return pdata;
     }
 
-    page.listing = function(elem, columns, url, jqgrid_params) {
+    var live = {stream: null};
+
+    /* Prepend the rows pushed by the server to the listing while the live mode is enabled */
+    function live_tail(elem, url) {
+        if ( live.stream ) {
+            live.stream.close();
+            $.eventSourcePool.done(live.stream);
+            live.stream = null;
+        }
+
+        if ( ! url || ! $("#view-config-live").prop("checked") )
+            return;
+
+        var rowid = 0;
+
+        live.stream = prewikka_EventSource({
+            url: url + "?" + $.param(set_postdata(elem, false)),
+            events: {
+                "begin": function(data) {}
+            },
+            message: function(data) {
+                if ( ! data.rows.length )
+                    return;
+
+                var grid = $(elem);
+                var userdata = grid.jqGrid('getGridParam', 'userData');
+
+                $.each(data.rows, function(_, row) {
+                    var id = "live-" + rowid++;
+
+                    userdata[id] = row;
+                    grid.jqGrid("addRowData", id, row.cell, "first");
+                });
+
+                var ids = grid.jqGrid("getDataIDs");
+                for ( var i = grid.jqGrid("getGridParam", "rowNum"); i < ids.length; i++ )
+                    grid.jqGrid("delRowData", ids[i]);
+
+                _initialize_components(elem);
+            },
+            close: function() {
+                /* The server closes the connection periodically, follow again */
+                live.stream = null;
+                live_tail(elem, url);
+            }
+        });
+    }
+
+    page.listing = function(elem, columns, url, jqgrid_params, tail_url) {
+        $("#view-config-live").change(function() {
+            $("#form_search :input[name=live]").val($(this).prop("checked") ? 1 : 0);
+            live_tail(elem, tail_url);
+        });
+
         CommonListing(elem, {}, {
             datatype: "json",
             url: url,
@@ -556,6 +609,7 @@ function DataSearchPage(backend, criterion_config, criterion_config_default, sep
             loadComplete: function() {
                 _resizeGrid($(elem));
                 _initialize_components(elem);
+                live_tail(elem, tail_url);
                 $("span.selectable", elem).on("mousemove", "span", update_selection)
                                           .on("mouseleave", "span", remove_selection)
                                           .on("mousedown", "span", prepare_popover);
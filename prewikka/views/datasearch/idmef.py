@@ -24,6 +24,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from prewikka import dataprovider, resource, response, template, utils, view
 from prewikka.localization import format_datetime
+from prewikka.utils import cache
 
 from . import datasearch
 
@@ -38,10 +39,14 @@ class IDMEFHighLighter(datasearch.HighLighter):
 class IDMEFFormatter(datasearch.Formatter):
     highlighter = IDMEFHighLighter
 
+    @cache.request_memoize("summary_link_template")
+    def _get_summary_link_template(self):
+        return env.viewmanager.url_template("%ssummary.render" % self.type, _default=None, **env.request.menu.get_parameters())
+
     def _format_time(self, finfo, root, obj):
         href = None
         if root["%s.messageid" % self.type]:
-            href = url_for("%ssummary.render" % self.type, messageid=root["%s.messageid" % self.type], _default=None, **env.request.menu.get_parameters())
+            href = self._get_summary_link_template()(messageid=root["%s.messageid" % self.type])
 
         return resource.HTMLNode("a", format_datetime(obj), href=href, title=_("See IDMEF details"), **{"data-toggle": "tooltip", "data-container": "#main"})
 
@@ -155,6 +160,15 @@ class IDMEFQueryParser(datasearch.QueryParser):
 
         return ret
 
+    def get_tail_result(self, criteria, offset=0):
+        return list(env.dataprovider.get(criteria, limit=self.limit, offset=offset, type=self.type, order_by=self._sort_order))
+
+    def get_tail_time(self, row):
+        return row["%s.create_time" % self.type]
+
+    def get_tail_key(self, row):
+        return row["%s.messageid" % self.type]
+
 
 class IDMEFDataSearch(datasearch.DataSearch):
     view_permissions = [N_("IDMEF_VIEW")]
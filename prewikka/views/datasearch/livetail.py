@@ -0,0 +1,143 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Live tail of the newest rows of a datasearch, shared between clients."""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import contextlib
+import threading
+import time
+
+from prewikka import utils
+
+
+class TailSource(object):
+    """
+    Newest rows for a given datatype and criteria.
+
+    The fetch callable is given the time of the last seen row and the number
+    of rows to skip, and returns a list of (time, key, row) tuples, oldest
+    first. The backend is polled by one of the waiting clients at most every
+    interval seconds, and the resulting rows are shared by all the clients.
+    """
+
+    def __init__(self, fetch, interval, backlog=1000):
+        self._fetch = fetch
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._rows = collections.deque(maxlen=backlog)
+        self._polling = False
+        self._next_poll = 0
+
+        # Rows are fetched starting from the time of the last seen row, skipping the
+        # rows already fetched at this exact time so that the tail goes on when more
+        # rows than a single fetch returns share it. Their keys are kept to filter
+        # them out in case the backend returns them in a different order.
+        self._since = utils.timeutil.utcnow()
+        self._seen = set()
+        self._offset = 0
+
+        self.seq = 0
+        self.clients = 0
+
+    def _poll(self):
+        rows = []
+
+        for rtime, key, row in self._fetch(self._since, self._offset):
+            if rtime > self._since:
+                self._since = rtime
+                self._seen = set()
+                self._offset = 0
+
+            self._offset += 1
+            if key in self._seen:
+                continue
+
+            self._seen.add(key)
+            rows.append(row)
+
+        return rows
+
+    def get(self, seq, timeout):
+        """
+        Return the last sequence number and the rows added after sequence seq,
+        waiting at most timeout seconds for new rows.
+        """
+        end = time.time() + timeout
+
+        while True:
+            with self._cond:
+                if self.seq > seq:
+                    return self.seq, [row for rseq, row in self._rows if rseq > seq]
+
+                now = time.time()
+                if now >= end:
+                    return seq, []
+
+                if self._polling:
+                    self._cond.wait(end - now)
+                    continue
+
+                if now < self._next_poll:
+                    self._cond.wait(min(end, self._next_poll) - now)
+                    continue
+
+                self._polling = True
+
+            rows = []
+            try:
+                rows = self._poll()
+            finally:
+                with self._cond:
+                    for row in rows:
+                        self.seq += 1
+                        self._rows.append((self.seq, row))
+
+                    self._polling = False
+                    self._next_poll = time.time() + self._interval
+                    self._cond.notify_all()
+
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def follow(key, fetch, interval):
+    """
+    Context manager returning the TailSource shared by all the clients following key.
+
+    The source is created with fetch and interval for the first client, and
+    destroyed once the last client stops following it.
+    """
+    with _sources_lock:
+        source = _sources.get(key)
+        if not source:
+            source = _sources[key] = TailSource(fetch, interval)
+
+        source.clients += 1
+
+    try:
+        yield source
+    finally:
+        with _sources_lock:
+            source.clients -= 1
+            if not source.clients:
+                _sources.pop(key, None)
@@ -73,8 +73,9 @@ class LogDataSearch(datasearch.DataSearch):
             "alert.target.node.name",
             "host"
         ]
-        env.linkmanager.add_link(N_("Search in logs"), paths, lambda x: url_for("LogDataSearch.forensic", query='"%s"' % x, query_mode="lucene"))
-        env.linkmanager.add_link(N_("View logs"), paths, lambda x: url_for("LogDataSearch.forensic", query="host:%s" % x, query_mode="lucene"))
+        search = env.viewmanager.url_template("LogDataSearch.forensic", query_mode="lucene")
+        env.linkmanager.add_link(N_("Search in logs"), paths, lambda x: search(query='"%s"' % x))
+        env.linkmanager.add_link(N_("View logs"), paths, lambda x: search(query="host:%s" % x))
 
     @hookmanager.register("HOOK_RISKOVERVIEW_DATA", _order=2)
     def _set_logs_summary(self):
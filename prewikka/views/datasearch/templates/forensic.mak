@@ -54,7 +54,7 @@ $LAB.script("datasearch/js/datasearch.js").wait(function() {
     };
 
     $(document).ready(function() {
-        page.listing('#datasearch_table', columns, "${url_for('.ajax_table')}", ${html.escapejs(env.request.parameters['jqgrid_params_datasearch_table'])});
+        page.listing('#datasearch_table', columns, "${url_for('.ajax_table')}", ${html.escapejs(env.request.parameters['jqgrid_params_datasearch_table'])}, "${url_for('.ajax_tail')}");
         $("#datasearch_table").jqGrid($("#view-config-editable").prop("checked") ? 'showCol' : 'hideCol', 'cb');
     });
   % endif
@@ -112,6 +112,13 @@ $LAB.script("datasearch/js/datasearch.js").wait(function() {
               ${ _("Condensed mode") }
             </label>
           </div>
+          <div>
+            <label for="view-config-live">
+              <input type="checkbox" id="view-config-live" ${ checked(env.request.parameters.get("live")) } />
+              <input type="hidden" name="live" value="${env.request.parameters.get('live')}" />
+              ${ _("Live mode") }
+            </label>
+          </div>
           % if expert_enabled:
           <div>
             <label for="view-config-expert">
@@ -20,7 +20,6 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import hashlib
-import itertools
 import re
 import string
 import struct
@@ -642,21 +641,13 @@ class AlertSummary(TcpIpOptions, MessageSummary):
 
         for idx, (analyzerid, idents) in enumerate(calist.items()):
             content = ""
-            results = []
             total = 0
-            step = 50
             limit = min(len(idents), 500)
 
-            for i in range(0, limit, step):
-                # FIXME #3250, #3251
-                # We execute several queries to avoid recursion errors
-                criteria = Criterion()
-                for ident in idents[i:i+step]:
-                    criteria |= self._get_alert_ident_criterion(analyzerid, ident)
+            criteria = Criterion("alert.analyzer.analyzerid", "=", analyzerid) & Criterion("alert.messageid", "in", idents[:limit])
+            results = env.dataprovider.query(["alert.messageid", "alert.classification.text"], criteria)
 
-                results.append(env.dataprovider.query(["alert.messageid", "alert.classification.text"], criteria))
-
-            for ident, classif in itertools.chain(*results):
+            for ident, classif in results:
                 link = url_for(".render", analyzerid=analyzerid, messageid=ident)
                 content += '<li><a title="%s" href="%s">%s</a></li>' % (_("Alert details"), link, html.escape(classif))
                 total += 1
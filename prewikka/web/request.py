@@ -52,6 +52,24 @@ class BufferedWriter(object):
             self.flush()
 
 
+class CompressedWriter(BufferedWriter):
+    """
+    Buffered writer compressing the data with a zlib.compressobj() like compressor.
+    """
+    def __init__(self, wcb, compressor, buffersize=8192):
+        BufferedWriter.__init__(self, wcb, buffersize)
+        self._compressor = compressor
+
+    def write(self, data):
+        data = self._compressor.compress(data)
+        if data:
+            BufferedWriter.write(self, data)
+
+    def close(self):
+        BufferedWriter.write(self, self._compressor.flush())
+        self.flush()
+
+
 class Request(object):
     def __init__(self, path):
         self.path = path
@@ -140,6 +158,27 @@ class Request(object):
 
             error.make(err).respond().write(self)
 
+    def send_file(self, fd, length):
+        """Send length bytes of the fd file from its current position, then close it."""
+        try:
+            while length > 0:
+                data = fd.read(min(length, 65536))
+                if not data:
+                    break
+
+                self.write(data)
+                length -= len(data)
+        finally:
+            fd.close()
+
+    def compressed_writer(self, compressor):
+        """Return a CompressedWriter sending the compressed data to the client."""
+        return CompressedWriter(self.write, compressor)
+
+    def is_connected(self):
+        """Return False if the client is known to have closed the connection."""
+        return True
+
     @abc.abstractmethod
     def headers_sent(self):
         pass
@@ -19,6 +19,9 @@
 
 from __future__ import absolute_import, division, print_function
 
+import os
+import select
+import socket
 import sys
 import werkzeug.wsgi
 import wsgiref.headers
@@ -38,6 +41,7 @@ else:
 
 defined_status = {
     200: 'Ok',
+    206: 'Partial Content',
     302: 'Found',
     303: 'See Other',
     304: 'Not Modified',
@@ -46,6 +50,7 @@ defined_status = {
     403: 'Forbidden',
     404: 'Not Found',
     405: 'Method Not Allowed',
+    416: 'Range Not Satisfiable',
     500: 'Internal Server Error',
 }
 
@@ -53,6 +58,7 @@ defined_status = {
 class WSGIRequest(request.Request):
     def __init__(self, environ, start_response):
         self._write = None
+        self._result = []
         self._environ = environ
         self._headers = None
         self._start_response = start_response
@@ -115,6 +121,34 @@ class WSGIRequest(request.Request):
     def write(self, data):
         self._write(data)
 
+    def send_file(self, fd, length):
+        # The server file wrapper sends the file up to its end, usually using sendfile()
+        file_wrapper = self._environ.get("wsgi.file_wrapper")
+        if not file_wrapper or not hasattr(fd, "fileno") or fd.tell() + length != os.fstat(fd.fileno()).st_size:
+            return request.Request.send_file(self, fd, length)
+
+        self._result = file_wrapper(fd, 65536)
+
+    @property
+    def result(self):
+        """Iterable to be returned by the WSGI application"""
+        return self._result
+
+    def is_connected(self):
+        # Only possible when the server exposes the client socket
+        sock = self._environ.get("gunicorn.socket")
+        if sock is None:
+            return True
+
+        try:
+            if not select.select([sock], [], [], 0)[0]:
+                return True
+
+            # Readable with no pending data means the connection was closed
+            return bool(sock.recv(1, socket.MSG_PEEK))
+        except (socket.error, ValueError):
+            return False
+
     @property
     def headers_sent(self):
         return bool(self._write)
@@ -174,6 +208,8 @@ class WSGIRequest(request.Request):
 
 def application(environ, start_response):
     core = main.Core.from_config(environ.get("PREWIKKA_CONFIG", None))
-    core.process(WSGIRequest(environ, start_response))
 
-    return []
+    req = WSGIRequest(environ, start_response)
+    core.process(req)
+
+    return req.result
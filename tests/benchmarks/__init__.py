@@ -0,0 +1,181 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Benchmark suite for the dataprovider, SQL builder and rendering hot paths.
+
+The benchmarks run offline: SQL queries are executed against a SQLite
+database filled with synthetic data, and Elasticsearch requests are
+answered by a local stub HTTP server.
+
+Usage:
+
+    python -m tests.benchmarks list
+    python -m tests.benchmarks run --max-size 100000 --output new.json
+    python -m tests.benchmarks compare old.json new.json --threshold 0.1
+
+The benchmark modules are named bench_*.py so that they are not collected
+by pytest.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import collections
+import json
+import platform
+import sys
+import time
+import timeit
+
+
+SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+DEFAULT_MAX_SIZE = 10**5
+
+_BENCHMARKS = collections.OrderedDict()
+
+
+class Benchmark(object):
+    def __init__(self, name, setup, sizes, description=None):
+        self.name = name
+        self.setup = setup
+        self.sizes = sizes
+        self.description = description or (setup.__doc__ or "").strip()
+
+    def run(self, size, repeat, max_time):
+        """Time the callable returned by setup() and return the timing statistics"""
+
+        func = self.setup(size)
+        timings = []
+
+        while len(timings) < repeat:
+            start = timeit.default_timer()
+            func()
+            timings.append(timeit.default_timer() - start)
+
+            if sum(timings) > max_time:
+                break
+
+        timings.sort()
+        return {
+            "name": self.name,
+            "size": size,
+            "rounds": len(timings),
+            "min": timings[0],
+            "median": _median(timings),
+            "mean": sum(timings) / len(timings),
+            "rate": size / timings[0] if timings[0] else None,
+        }
+
+
+def _median(values):
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def benchmark(name, sizes=SIZES):
+    """
+    Register a benchmark.
+
+    The decorated function is called once per dataset size, outside of the
+    timed section, and must return the callable to be timed.
+    """
+    def decorator(func):
+        _BENCHMARKS[name] = Benchmark(name, func, sizes)
+        return func
+
+    return decorator
+
+
+def load_benchmarks():
+    from tests.benchmarks import bench_dataprovider, bench_elasticsearch, bench_hookmanager, bench_rendering, bench_sql  # noqa: registration only
+
+    return _BENCHMARKS
+
+
+def run(patterns=None, max_size=DEFAULT_MAX_SIZE, repeat=5, max_time=10., out=sys.stdout):
+    results = []
+
+    for bench in load_benchmarks().values():
+        if patterns and not any(p in bench.name for p in patterns):
+            continue
+
+        for size in bench.sizes:
+            if size > max_size:
+                continue
+
+            result = bench.run(size, repeat, max_time)
+            results.append(result)
+            out.write("%-40s %10d %12.6fs %8d rounds\n" % (bench.name, size, result["median"], result["rounds"]))
+            out.flush()
+
+    return {
+        "version": 1,
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def save(report, filename):
+    with open(filename, "w") as fd:
+        json.dump(report, fd, indent=2, sort_keys=True)
+
+
+def load(filename):
+    with open(filename) as fd:
+        return json.load(fd)
+
+
+def compare(old, new, threshold=0.1):
+    """
+    Compare two reports and return a list of (name, size, old median, new median, ratio, status) tuples.
+
+    The status is "regression" when the new median is more than `threshold` slower than the old one,
+    "improvement" when it is faster by the same margin, and "ok" otherwise.
+    """
+    previous = dict(((r["name"], r["size"]), r) for r in old["results"])
+    ret = []
+
+    for result in new["results"]:
+        key = (result["name"], result["size"])
+        if key not in previous:
+            continue
+
+        before, after = previous[key]["median"], result["median"]
+        ratio = after / before if before else float("inf")
+
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "ok"
+
+        ret.append((result["name"], result["size"], before, after, ratio, status))
+
+    return ret
+
+
+def format_comparison(rows, out=sys.stdout):
+    out.write("%-40s %10s %12s %12s %8s  %s\n" % ("benchmark", "size", "old", "new", "ratio", "status"))
+    for name, size, before, after, ratio, status in rows:
+        out.write("%-40s %10d %11.6fs %11.6fs %7.2fx  %s\n" % (name, size, before, after, ratio, status))
@@ -0,0 +1,86 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import sys
+
+import tests.benchmarks as benchmarks
+
+
+def _list(args):
+    for bench in benchmarks.load_benchmarks().values():
+        print("%-40s %s" % (bench.name, bench.description))
+
+
+def _run(args):
+    from tests.benchmarks import environment
+
+    environment.setup()
+    try:
+        report = benchmarks.run(args.filter, args.max_size, args.repeat, args.max_time)
+    finally:
+        environment.teardown()
+
+    if args.output:
+        benchmarks.save(report, args.output)
+
+    if args.baseline:
+        rows = benchmarks.compare(benchmarks.load(args.baseline), report, args.threshold)
+        benchmarks.format_comparison(rows)
+        return any(row[-1] == "regression" for row in rows)
+
+
+def _compare(args):
+    rows = benchmarks.compare(benchmarks.load(args.old), benchmarks.load(args.new), args.threshold)
+    benchmarks.format_comparison(rows)
+
+    return any(row[-1] == "regression" for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description="Prewikka benchmark suite")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    p = subparsers.add_parser("list", help="list the available benchmarks")
+    p.set_defaults(func=_list)
+
+    p = subparsers.add_parser("run", help="run the benchmarks")
+    p.add_argument("filter", nargs="*", help="only run the benchmarks whose name contains one of these strings")
+    p.add_argument("--max-size", type=int, default=benchmarks.DEFAULT_MAX_SIZE, help="largest dataset size to run (up to 10000000)")
+    p.add_argument("--repeat", type=int, default=5, help="maximum number of rounds per benchmark and size")
+    p.add_argument("--max-time", type=float, default=10., help="stop repeating a benchmark once it ran for this many seconds")
+    p.add_argument("--output", help="write the results to this JSON file")
+    p.add_argument("--baseline", help="compare the results against this JSON file")
+    p.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    p.set_defaults(func=_run)
+
+    p = subparsers.add_parser("compare", help="compare two result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    p.set_defaults(func=_compare)
+
+    args = parser.parse_args()
+    return 1 if args.func(args) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Dataprovider benchmarks: path parsing, criteria compilation and results iteration.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime
+import functools
+
+from prewikka.dataprovider import Criterion, QueryResults
+from prewikka.utils import CachingIterator
+from tests.benchmarks import benchmark, environment as e
+
+
+_PATHS = [
+    "bench.messageid",
+    "bench.severity/group_by",
+    "bench.classification/order_asc",
+    "count(1)/order_desc",
+    "count(distinct(bench.source))",
+    "bench.start_time:mday/group_by",
+    "bench.start_time:hour/group_by",
+    "timezone(bench.start_time, 'Europe/Paris')",
+    "max(bench.end_time)",
+    "bench.target/order_desc",
+]
+
+
+@benchmark("pathparser.parse_paths", sizes=(10**3, 10**4, 10**5))
+def parse_paths(size):
+    """Parse `size` paths, clearing the request cache between each batch of 10"""
+
+    parser = env.dataprovider._type_handlers["bench"]
+
+    def run():
+        for i in range(size // len(_PATHS)):
+            env.request.cache.pathparser.clear()
+            parser.parse_paths(_PATHS)
+
+    # Create the request cache
+    parser.parse_paths(_PATHS)
+    return run
+
+
+@benchmark("pathparser.parse_paths_cached", sizes=(10**3, 10**4, 10**5))
+def parse_paths_cached(size):
+    """Parse `size` paths already present in the request cache"""
+
+    parser = env.dataprovider._type_handlers["bench"]
+    parser.parse_paths(_PATHS)
+
+    def run():
+        for i in range(size // len(_PATHS)):
+            parser.parse_paths(_PATHS)
+
+    return run
+
+
+@benchmark("criterion.compile", sizes=(10**3, 10**4, 10**5))
+def criterion_compile(size):
+    """Compile `size` times the usual alert listing criteria"""
+
+    criteria = Criterion("{backend}.{end_time_field}", ">=", e.END - e.PERIOD)
+    criteria &= Criterion("{backend}.{start_time_field}", "<=", e.END)
+    criteria &= Criterion("bench.severity", "=", "high") | Criterion("bench.severity", "=", "medium")
+    criteria &= Criterion("bench.classification", "<>*", "scan")
+    criteria &= Criterion("bench.source", "!=", "10.0.0.1")
+
+    def run():
+        for i in range(size):
+            criteria.compile("bench")
+
+    return run
+
+
+@benchmark("criterion.compile_or_chain", sizes=(10, 100, 500))
+def criterion_compile_or_chain(size):
+    """Compile a criterion made of `size` OR-ed equality tests"""
+
+    criteria = functools.reduce(lambda x, y: x | y, (Criterion("bench.classification", "=", "Classification %d" % i) for i in range(size)))
+
+    return lambda: criteria.compile("bench")
+
+
+@benchmark("criterion.compile_in", sizes=(10, 100, 500, 10**4))
+def criterion_compile_in(size):
+    """Compile a criterion testing the membership of a path in a list of `size` values"""
+
+    criteria = Criterion("bench.classification", "in", ["Classification %d" % i for i in range(size)])
+
+    return lambda: criteria.compile("bench")
+
+
+@benchmark("caching_iterator.iterate", sizes=(10**3, 10**4, 10**5, 10**6))
+def caching_iterator(size):
+    """Iterate twice over a CachingIterator of `size` items"""
+
+    items = list(range(size))
+
+    def run():
+        it = CachingIterator(items)
+        for i in it:
+            pass
+
+        for i in it:
+            pass
+
+    return run
+
+
+def _raw_rows(size):
+    return [(
+        "message-%d" % i,
+        "2020-01-%02d %02d:00:00.000000" % (i % 28 + 1, i % 24),
+        text_type(i),
+        "Classification %d" % (i % 200),
+    ) for i in range(size)]
+
+
+def _query_results(rows):
+    results = QueryResults(rows)
+    results._paths = ["bench.messageid", "bench.start_time", "count(1)", "bench.classification"]
+    results._paths_types = [text_type, datetime.datetime, int, text_type]
+
+    return results
+
+
+@benchmark("query_results.iterate", sizes=(10**3, 10**4, 10**5, 10**6))
+def query_results(size):
+    """Iterate over every cell of `size` QueryResults rows, with type casting"""
+
+    rows = _raw_rows(size)
+
+    def run():
+        for row in _query_results(rows):
+            for cell in row:
+                pass
+
+    return run
+
+
+@benchmark("query_results.convert", sizes=(10**3, 10**4, 10**5, 10**6))
+def query_results_convert(size):
+    """Convert `size` QueryResults rows at once, column by column"""
+
+    rows = _raw_rows(size)
+
+    return lambda: _query_results(rows).convert()
+
+
+@benchmark("dataprovider.query_sqlite")
+def dataprovider_query(size):
+    """Full DataProviderManager.query() of the top classifications over `size` alerts, on SQLite"""
+
+    e.use_sqlite_backend(size)
+    criteria = Criterion("{backend}.{start_time_field}", ">=", e.END - e.PERIOD)
+
+    def run():
+        for row in env.dataprovider.query(["count(1)/order_desc", "bench.classification/group_by"], criteria, limit=100, type="bench"):
+            list(row)
+
+    return run
@@ -0,0 +1,133 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Elasticsearch query building and result decoding benchmarks.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+
+from prewikka.dataprovider import Criterion
+from prewikka.dataprovider.helpers.elasticsearch import ElasticsearchQuery, ElasticsearchResult
+from tests.benchmarks import benchmark, environment as e
+
+
+_LISTING_PATHS = ["log.timestamp/order_desc", "log.host", "log.program", "log.message"]
+_GROUPBY_PATHS = ["count(1)/order_desc", "log.host/group_by", "log.program/group_by"]
+
+
+def _parse_paths(paths):
+    return env.dataprovider._type_handlers["log"].parse_paths(paths)[0]
+
+
+def _criteria():
+    criteria = Criterion("log.timestamp", ">=", e.END - e.PERIOD) & Criterion("log.timestamp", "<=", e.END)
+    return criteria & (Criterion("log.host", "=", "host-1") | Criterion("log.program", "<>", "program-"))
+
+
+def _decode(mapping, search, body, limit):
+    results = ElasticsearchResult(mapping, json.loads(body.decode("utf8")), search, limit).api_results
+    for row in results:
+        list(row)
+
+
+@benchmark("elasticsearch.build_query", sizes=(10**3, 10**4, 10**5))
+def build_query(size):
+    """Build and serialize `size` grouped Elasticsearch queries"""
+
+    mapping = e.elasticsearch_mapping()
+    paths = _parse_paths(_GROUPBY_PATHS)
+    criteria = _criteria()
+
+    def run():
+        for i in range(size):
+            ElasticsearchQuery("log", mapping, paths, criteria, 50, 0).get_json_query()
+
+    return run
+
+
+@benchmark("elasticsearch.decode_hits", sizes=(10**3, 10**4, 10**5, 10**6))
+def decode_hits(size):
+    """Decode a search response holding `size` hits"""
+
+    mapping = e.elasticsearch_mapping()
+    search = ElasticsearchQuery("log", mapping, _parse_paths(_LISTING_PATHS), _criteria(), size, 0)
+    body = e.search_response(list(e.logs(size)))
+
+    return lambda: _decode(mapping, search, body, size)
+
+
+@benchmark("elasticsearch.decode_aggregations", sizes=(10**3, 10**4, 10**5, 10**6))
+def decode_aggregations(size):
+    """Decode a two-level terms aggregation response holding `size` leaf buckets"""
+
+    mapping = e.elasticsearch_mapping()
+    search = ElasticsearchQuery("log", mapping, _parse_paths(_GROUPBY_PATHS), _criteria(), size, 0)
+    body = e.search_response(aggregations=e.log_buckets(size), total=size)
+
+    return lambda: _decode(mapping, search, body, size)
+
+
+@benchmark("elasticsearch.query_http", sizes=(10**3, 10**4, 10**5))
+def query_http(size):
+    """Full DataProviderManager.query() returning `size` hits from the stub Elasticsearch server"""
+
+    e.set_search_response(e.search_response(list(e.logs(size))))
+
+    def run():
+        for row in env.dataprovider.query(_LISTING_PATHS, _criteria(), limit=size, type="log"):
+            list(row)
+
+    return run
+
+
+def _query_groups(size):
+    return [env.dataprovider.query(_GROUPBY_PATHS, _criteria(), limit=10, type="log") for i in range(size)]
+
+
+@benchmark("elasticsearch.query_fanout", sizes=(10, 100))
+def query_fanout(size):
+    """`size` grouped DataProviderManager.query() sent one by one to the stub Elasticsearch server"""
+
+    e.set_search_response(e.search_response(aggregations=e.log_buckets(100), total=100))
+
+    def run():
+        for results in _query_groups(size):
+            for row in results:
+                list(row)
+
+    return run
+
+
+@benchmark("elasticsearch.query_batch", sizes=(10, 100))
+def query_batch(size):
+    """`size` grouped DataProviderManager.query() batched into one multi-search request"""
+
+    e.set_search_response(e.search_response(aggregations=e.log_buckets(100), total=100))
+
+    def run():
+        with env.dataprovider.batch():
+            batch = _query_groups(size)
+
+        for results in batch:
+            for row in results:
+                list(row)
+
+    return run
@@ -0,0 +1,67 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Hook dispatch benchmarks.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka.hookmanager import HookManager
+from tests.benchmarks import benchmark
+
+
+@benchmark("hookmanager.trigger_empty", sizes=(10**4, 10**5, 10**6))
+def trigger_empty(size):
+    """Trigger `size` times a hook without any handler"""
+
+    hookmgr = HookManager()
+
+    def run():
+        for i in range(size):
+            for result in hookmgr.trigger("HOOK_BENCH", i):
+                pass
+
+    return run
+
+
+@benchmark("hookmanager.trigger", sizes=(10**4, 10**5, 10**6))
+def trigger(size):
+    """Trigger `size` times a hook with 5 ordered handlers"""
+
+    hookmgr = HookManager()
+    for i in range(5):
+        hookmgr.register("HOOK_BENCH", lambda x: x, _order=5 - i)
+
+    def run():
+        for i in range(size):
+            for result in hookmgr.trigger("HOOK_BENCH", i):
+                pass
+
+    return run
+
+
+@benchmark("hookmanager.trigger_batch", sizes=(10**4, 10**5, 10**6))
+def trigger_batch(size):
+    """Trigger a hook once for `size` items with a batch handler"""
+
+    hookmgr = HookManager()
+    hookmgr.register("HOOK_BENCH", lambda items: None, _batch=True)
+    items = list(range(size))
+
+    return lambda: hookmgr.trigger_batch("HOOK_BENCH", items)
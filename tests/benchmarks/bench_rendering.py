@@ -0,0 +1,77 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Rendering benchmarks: JSON encoding, Mako templates and chart data.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import itertools
+
+from prewikka import template
+from prewikka.statistics import ChronologyChart, Query
+from prewikka.utils import json
+from tests.benchmarks import benchmark, environment as e
+
+
+def _rows(size):
+    for ident, messageid, severity, start, end, classification, source, target in e.alerts(size):
+        yield {
+            "id": ident,
+            "url": "alerts/%s" % messageid,
+            "classification": classification,
+            "severity": severity,
+            "source": source,
+            "time": start,
+        }
+
+
+@benchmark("json.dumps", sizes=(10**3, 10**4, 10**5, 10**6))
+def json_dumps(size):
+    """Encode `size` listing rows, with datetime values, using the Prewikka JSON encoder"""
+
+    data = {"rows": list(_rows(size)), "total": size}
+
+    return lambda: json.dumps(data)
+
+
+@benchmark("mako.render_table", sizes=(10**3, 10**4, 10**5))
+def mako_render(size):
+    """Render a `size` rows HTML table with a Mako template"""
+
+    tmpl = template.PrewikkaTemplate(__name__, "templates/table.mak")
+    rows = list(_rows(size))
+    selection = set(itertools.islice((row["id"] for row in rows), 0, None, 7))
+    columns = ["", "Classification", "Severity", "Source", "Time"]
+
+    return lambda: tmpl.render(rows=rows, columns=columns, selection=selection)
+
+
+@benchmark("statistics.chronology", sizes=(10**3, 10**4, 10**5, 10**6))
+def chronology(size):
+    """ChronologyChart.get_data() for the top 10 classifications of the last month, over `size` alerts on SQLite"""
+
+    e.use_sqlite_backend(size)
+
+    def run():
+        query = Query(datatype="bench", path="bench.classification", limit=10)
+        chart = ChronologyChart("timebar", "Alerts", [query], period={"value": 1, "unit": "month"})
+        return chart.get_data()
+
+    return run
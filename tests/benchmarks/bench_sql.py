@@ -0,0 +1,128 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+SQLBuilder benchmarks.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka.dataprovider import COMPOSITE_TIME_FIELD, Criterion
+from prewikka.dataprovider.helpers.sql import SQLBuilder
+from tests.benchmarks import benchmark, environment as e
+
+
+_GROUPBY_PATHS = ["count(1)/order_desc", "bench.classification/group_by", "bench.severity/group_by"]
+_LISTING_PATHS = ["bench.messageid", "bench.severity", "bench.classification", "bench.source", "bench.start_time/order_desc"]
+
+
+def _time_criteria():
+    return Criterion("bench.start_time", ">=", e.END - e.PERIOD) & Criterion("bench.start_time", "<=", e.END)
+
+
+def _builder(dialect="pgsql"):
+    return SQLBuilder(e.PATHS_MAP, e.TABLES, e.JOINS, db=e.BenchDatabase(dialect), time_paths=("bench.start_time", "bench.end_time"))
+
+
+@benchmark("sql.build_query", sizes=(10**3, 10**4, 10**5))
+def build_query(size):
+    """Build `size` GROUP BY queries with the PostgreSQL dialect"""
+
+    builder = _builder()
+    paths, _ = e.BenchAPI().parse_paths(_GROUPBY_PATHS)
+    criteria = _time_criteria() & Criterion("bench.severity", "!=", "info") & Criterion("bench.source", "<>", "10.1.")
+
+    def run():
+        for i in range(size):
+            builder.build_query(paths, criteria, False, 10, 0)
+
+    return run
+
+
+@benchmark("sql.build_cte_query", sizes=(10**3, 10**4, 10**5))
+def build_cte_query(size):
+    """Build `size` timeline queries on a composite time field (recursive CTE)"""
+
+    parser = e.BenchAPI(time_field=("start_time", "end_time"))
+    parser.dataprovider_type = "bench"
+    parser.post_load()
+
+    builder = _builder()
+    paths, _ = parser.parse_paths([
+        "count(1)",
+        "bench.classification/group_by",
+        "bench.%s:mday/order_asc,group_by" % COMPOSITE_TIME_FIELD,
+    ])
+    criteria = Criterion("bench.end_time", ">=", e.END - e.PERIOD) & Criterion("bench.start_time", "<=", e.END)
+
+    def run():
+        for i in range(size):
+            builder.build_query(paths, criteria, False, -1, 0)
+
+    return run
+
+
+@benchmark("sql.execute_cte_query")
+def execute_cte_query(size):
+    """Hourly timeline of `size` alerts on a composite time field, on SQLite"""
+
+    parser = e.BenchAPI(time_field=("start_time", "end_time"))
+    parser.dataprovider_type = "bench"
+    parser.post_load()
+
+    db = e.sqlite_database(size)
+    builder = e.BenchSQLBackend(db).builder
+    paths, _ = parser.parse_paths(["count(1)", "bench.%s:hour/order_asc,group_by" % COMPOSITE_TIME_FIELD])
+    criteria = Criterion("bench.end_time", ">=", e.END - e.PERIOD) & Criterion("bench.start_time", "<=", e.END)
+
+    return lambda: builder.execute_query(paths, criteria, False, -1, 0)
+
+
+@benchmark("sql.execute_groupby")
+def execute_groupby(size):
+    """Top 10 classifications/severities over `size` alerts, on SQLite"""
+
+    db = e.sqlite_database(size)
+    builder = _builder("sqlite")
+    paths, _ = e.BenchAPI().parse_paths(_GROUPBY_PATHS)
+    query = builder.build_query(paths, _time_criteria() & Criterion("bench.severity", "!=", "info"), False, 10, 0)
+
+    return lambda: db.query(query)
+
+
+@benchmark("sql.execute_listing")
+def execute_listing(size):
+    """Last 100 alerts out of `size`, joined with their classification and source, on SQLite"""
+
+    db = e.sqlite_database(size)
+    builder = _builder("sqlite")
+    paths, _ = e.BenchAPI().parse_paths(_LISTING_PATHS)
+    query = builder.build_query(paths, _time_criteria(), False, 100, 0)
+
+    return lambda: db.query(query)
+
+
+@benchmark("sql.execute_groupby_total")
+def execute_groupby_total(size):
+    """Top 10 classifications/severities over `size` alerts along with the number of groups, on SQLite"""
+
+    db = e.sqlite_database(size)
+    builder = e.BenchSQLBackend(db).builder
+    paths, _ = e.BenchAPI().parse_paths(_GROUPBY_PATHS)
+
+    return lambda: builder.execute_query(paths, _time_criteria() & Criterion("bench.severity", "!=", "info"), False, 10, 0, with_total=True)
@@ -0,0 +1,499 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Offline environment for the benchmark suite: synthetic datasets, a SQLite
+backed dataprovider and a stub Elasticsearch HTTP server.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import contextlib
+import datetime
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from prewikka import compat, config, dataprovider
+from prewikka.dataprovider.helpers.elasticsearch import ElasticsearchInstance, ElasticsearchMap
+from prewikka.dataprovider.helpers.sql import SQLBuilder, SQLTable
+from prewikka.dataprovider.log import LogAPI
+from prewikka.dataprovider.pathparser import PathParser
+from prewikka.utils import AttrObj
+from prewikka.utils.timeutil import timezone
+
+
+UTC = timezone("UTC")
+
+# Synthetic data spans the 30 days preceding this date, so that relative
+# time periods (eg. "last month") match the generated rows.
+END = datetime.datetime.now(UTC).replace(minute=0, second=0, microsecond=0)
+PERIOD = datetime.timedelta(days=30)
+
+SEVERITIES = ("info", "low", "medium", "high")
+HOSTS = ["host-%d" % i for i in range(100)]
+PROGRAMS = ["program-%d" % i for i in range(50)]
+
+_LOG_FIELDS = {
+    "timestamp": "date",
+    "message": "text",
+    "raw_message": "text",
+    "host": "keyword",
+    "program": "keyword",
+    "pid": "long",
+}
+
+_BENCH_PATHS = {
+    "bench": {
+        "_ident": int,
+        "messageid": text_type,
+        "severity": text_type,
+        "classification": text_type,
+        "source": text_type,
+        "target": text_type,
+        "start_time": datetime.datetime,
+        "end_time": datetime.datetime,
+    }
+}
+
+ALERT_TABLE = SQLTable("Bench_Alert", pkey=("_ident",))
+CLASSIFICATION_TABLE = SQLTable("Bench_Classification")
+SOURCE_TABLE = SQLTable("Bench_Source")
+TARGET_TABLE = SQLTable("Bench_Target")
+
+TABLES = [ALERT_TABLE, CLASSIFICATION_TABLE, SOURCE_TABLE, TARGET_TABLE]
+
+JOINS = [
+    ((ALERT_TABLE, "_ident"), (CLASSIFICATION_TABLE, "_message_ident")),
+    ((ALERT_TABLE, "_ident"), (SOURCE_TABLE, "_message_ident")),
+    ((ALERT_TABLE, "_ident"), (TARGET_TABLE, "_message_ident")),
+]
+
+PATHS_MAP = {
+    "bench._ident": (ALERT_TABLE, "_ident"),
+    "bench.messageid": (ALERT_TABLE, "messageid"),
+    "bench.severity": (ALERT_TABLE, "severity"),
+    "bench.start_time": (ALERT_TABLE, "start_time"),
+    "bench.end_time": (ALERT_TABLE, "end_time"),
+    "bench.classification": (CLASSIFICATION_TABLE, "text"),
+    "bench.source": (SOURCE_TABLE, "address"),
+    "bench.target": (TARGET_TABLE, "address"),
+}
+
+_SCHEMA = """
+CREATE TABLE Bench_Alert (_ident INTEGER PRIMARY KEY, messageid TEXT, severity TEXT, start_time TEXT, end_time TEXT);
+CREATE TABLE Bench_Classification (_message_ident INTEGER, text TEXT);
+CREATE TABLE Bench_Source (_message_ident INTEGER, address TEXT);
+CREATE TABLE Bench_Target (_message_ident INTEGER, address TEXT);
+CREATE INDEX Bench_Alert_start_time ON Bench_Alert (start_time);
+CREATE INDEX Bench_Classification_ident ON Bench_Classification (_message_ident);
+CREATE INDEX Bench_Source_ident ON Bench_Source (_message_ident);
+CREATE INDEX Bench_Target_ident ON Bench_Target (_message_ident);
+"""
+
+_state = AttrObj(tmpdir=None, databases={}, server=None, mapping=None)
+
+
+class BenchAPI(PathParser):
+    """Alert-like datatype used by the SQL benchmarks"""
+
+    dataprovider_label = "Benchmark"
+
+    def __init__(self, time_field="start_time"):
+        PathParser.__init__(self, _BENCH_PATHS, time_field)
+
+
+class BenchDatabase(object):
+    """
+    Minimal stand-in for prewikka.database.DatabaseCommon.
+
+    The "sqlite" dialect executes queries on a SQLite database, other
+    dialects are only used to build SQL statements.
+    """
+
+    def __init__(self, dialect="sqlite", filename=":memory:"):
+        self._dialect = dialect
+        self._conn = sqlite3.connect(filename, check_same_thread=False) if dialect == "sqlite" else None
+
+    def get_type(self):
+        return self._dialect
+
+    def has_window_functions(self):
+        return self._dialect != "sqlite" or sqlite3.sqlite_version_info >= (3, 25)
+
+    def get_reader(self):
+        return self
+
+    @contextlib.contextmanager
+    def statement_timeout(self, timeout):
+        yield
+
+    @staticmethod
+    def datetime(t):
+        return t.astimezone(UTC).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    def escape(self, data):
+        if data is None:
+            return "NULL"
+
+        if isinstance(data, datetime.datetime):
+            data = self.datetime(data)
+
+        if isinstance(data, (list, tuple)):
+            fmt = "%s" if data and isinstance(data[0], (list, tuple)) else "(%s)"
+            return fmt % ", ".join(text_type(self.escape(value)) for value in data)
+
+        if not isinstance(data, compat.STRING_TYPES):
+            return data
+
+        return "'%s'" % data.replace("'", "''")
+
+    def query(self, sql, *args):
+        if args:
+            sql = sql % tuple(self.escape(value) for value in args)
+
+        return self._conn.execute(sql).fetchall()
+
+    def executescript(self, sql):
+        self._conn.executescript(sql)
+
+    def executemany(self, sql, rows):
+        self._conn.executemany(sql, rows)
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+
+
+class BenchSQLBackend(object):
+    """Dataprovider backend running SQLBuilder queries on a BenchDatabase"""
+
+    type = "bench"
+
+    def __init__(self, db):
+        self.db = db
+        self.builder = SQLBuilder(PATHS_MAP, TABLES, JOINS, db=db, time_paths=("bench.start_time", "bench.end_time"), max_duration=60)
+
+    def get_values(self, paths, criteria, distinct, limit, offset):
+        return self.builder.execute_query(paths, criteria, distinct, limit, offset)
+
+    def get_values_total(self, paths, criteria, distinct, limit, offset):
+        return self.builder.execute_query(paths, criteria, distinct, limit, offset, with_total=True)
+
+    def delete(self, criteria, paths):
+        self.builder.execute_delete(criteria, paths)
+
+    def delete_batch(self, criteria, paths, limit):
+        return self.builder.execute_delete(criteria, paths, limit)
+
+
+class BenchDataProviderManager(dataprovider.DataProviderManager):
+    """DataProviderManager with explicitly registered types and backends instead of entrypoints"""
+
+    def __init__(self):
+        self._type_handlers = {}
+        self._backends = {}
+
+    def add_type(self, type, handler):
+        handler.dataprovider_type = type
+        handler.post_load()
+        self._type_handlers[type] = handler
+
+    def set_backend(self, type, backend):
+        self._backends[type] = backend
+
+
+class _ElasticsearchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.strip("/"):
+            self._send(self.server.mapping)
+        else:
+            self._send(self.server.version)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        self.server.requests.append(self.path)
+        self.server.last_request = (self.headers, body)
+
+        if self.path.endswith("/_search") and self.server.composite_buckets is not None:
+            return self._send(self._composite_response(json.loads(body.decode("utf8"))))
+
+        if not self.path.endswith("/_msearch"):
+            return self._send(self.server.search_response)
+
+        # One header line and one query line per search
+        count = len(body.splitlines()) // 2
+        responses = [json.loads(self.server.search_response.decode("utf8"))] * count
+        for i in self.server.msearch_errors:
+            responses[i] = {"error": {"type": "search_phase_execution_exception"}, "status": 400}
+
+        self._send(json.dumps({"responses": responses}).encode("utf8"))
+
+    def _composite_response(self, query):
+        composite = query["aggs"]["internal_1"]["composite"]
+        buckets = self.server.composite_buckets
+
+        start = 0
+        if "after" in composite:
+            start = [bucket["key"] for bucket in buckets].index(composite["after"]) + 1
+
+        page = buckets[start:start + composite["size"]]
+        aggregation = {"buckets": page}
+        if page:
+            aggregation["after_key"] = page[-1]["key"]
+
+        return search_response(aggregations={"internal_1": aggregation}, total=len(buckets))
+
+    def log_message(self, *args):
+        pass
+
+
+class ElasticsearchServer(ThreadingMixIn, HTTPServer):
+    """
+    Stub Elasticsearch server answering every search with a preset response.
+
+    The paths of the POST requests are recorded in requests, and the headers and
+    body of the last one in last_request. The searches of a multi-search request
+    whose index is in msearch_errors fail. When set, composite_buckets are paged
+    through by composite aggregation searches.
+    """
+
+    index = "bench-logs"
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), _ElasticsearchHandler)
+
+        self.version = json.dumps({"version": {"number": "7.10.0"}}).encode("utf8")
+        properties = dict((field, {"type": type}) for field, type in _LOG_FIELDS.items())
+        self.mapping = json.dumps({self.index: {"mappings": {"properties": properties}}}).encode("utf8")
+        self.search_response = search_response([])
+        self.requests = []
+        self.last_request = None
+        self.msearch_errors = set()
+        self.composite_buckets = None
+
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://%s:%d/%s" % (self.server_address[0], self.server_address[1], self.index)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def search_response(hits=None, aggregations=None, total=None):
+    ret = {
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {"total": {"value": total if total is not None else len(hits or []), "relation": "eq"}, "hits": hits or []},
+    }
+
+    if aggregations is not None:
+        ret["aggregations"] = aggregations
+
+    return json.dumps(ret).encode("utf8")
+
+
+def alerts(size, seed=0):
+    """Yield (ident, messageid, severity, start_time, end_time, classification, source, target) tuples"""
+
+    rnd = random.Random(seed)
+    seconds = int(PERIOD.total_seconds())
+
+    for i in range(size):
+        start = END - datetime.timedelta(seconds=rnd.randrange(seconds))
+        yield (
+            i,
+            "message-%d" % i,
+            rnd.choice(SEVERITIES),
+            start,
+            start + datetime.timedelta(seconds=rnd.randrange(60)),
+            "Classification %d" % (int(rnd.paretovariate(1.2)) % 200),
+            "10.%d.%d.%d" % (rnd.randrange(4), rnd.randrange(256), rnd.randrange(256)),
+            "192.168.%d.%d" % (rnd.randrange(16), rnd.randrange(256)),
+        )
+
+
+def logs(size, seed=0):
+    """Yield Elasticsearch hits for the log datatype"""
+
+    rnd = random.Random(seed)
+    seconds = int(PERIOD.total_seconds())
+
+    for i in range(size):
+        host, program = rnd.choice(HOSTS), rnd.choice(PROGRAMS)
+        timestamp = END - datetime.timedelta(seconds=rnd.randrange(seconds))
+        yield {
+            "_index": ElasticsearchServer.index,
+            "_id": "%016x" % i,
+            "_score": None,
+            "_source": {
+                "timestamp": timestamp.isoformat(),
+                "host": host,
+                "program": program,
+                "pid": rnd.randrange(1, 65536),
+                "message": "%s[%d]: event %d processed" % (program, i % 65536, i),
+            },
+        }
+
+
+def log_buckets(size, seed=0):
+    """Return the aggregations of a count(1) query grouped by host and program, with `size` leaf buckets"""
+
+    rnd = random.Random(seed)
+    hosts = max(1, min(len(HOSTS), size // 10))
+    per_host = size // hosts
+
+    buckets = []
+    for i in range(hosts):
+        programs = []
+        for j in range(per_host):
+            count = rnd.randrange(1, 10000)
+            programs.append({"key": "program-%d" % j, "doc_count": count, "internal_3": {"value": count}})
+
+        buckets.append({
+            "key": HOSTS[i] if i < len(HOSTS) else "host-%d" % i,
+            "doc_count": sum(p["doc_count"] for p in programs),
+            "internal_2": {"buckets": programs},
+        })
+
+    return {"internal_1": {"buckets": buckets}}
+
+
+def sqlite_database(size):
+    """Return a BenchDatabase holding `size` synthetic alerts (created once per size)"""
+
+    db = _state.databases.get(size)
+    if db:
+        return db
+
+    db = BenchDatabase("sqlite", os.path.join(_state.tmpdir, "bench-%d.sqlite" % size))
+    db.executescript(_SCHEMA)
+
+    chunk = []
+    for row in alerts(size):
+        chunk.append(row)
+        if len(chunk) == 10000:
+            _insert_alerts(db, chunk)
+            chunk = []
+
+    _insert_alerts(db, chunk)
+    db.commit()
+
+    _state.databases[size] = db
+    return db
+
+
+def _insert_alerts(db, rows):
+    db.executemany("INSERT INTO Bench_Alert VALUES (?, ?, ?, ?, ?)",
+                   ((r[0], r[1], r[2], db.datetime(r[3]), db.datetime(r[4])) for r in rows))
+    db.executemany("INSERT INTO Bench_Classification VALUES (?, ?)", ((r[0], r[5]) for r in rows))
+    db.executemany("INSERT INTO Bench_Source VALUES (?, ?)", ((r[0], r[6]) for r in rows))
+    db.executemany("INSERT INTO Bench_Target VALUES (?, ?)", ((r[0], r[7]) for r in rows))
+
+
+def use_sqlite_backend(size):
+    env.dataprovider.set_backend("bench", BenchSQLBackend(sqlite_database(size)))
+
+
+def elasticsearch_mapping():
+    return _state.mapping
+
+
+def set_search_response(body):
+    _state.server.search_response = body
+
+
+def elasticsearch_server():
+    return _state.server
+
+
+def setup():
+    _state.tmpdir = tempfile.mkdtemp(prefix="prewikka-bench-")
+
+    env.request.init(None)
+    env.request.user = AttrObj(name="benchmark", timezone=UTC, check=lambda *args, **kwargs: None)
+    env.viewmanager = AttrObj(get=lambda *args, **kwargs: [])
+
+    env.dataprovider = BenchDataProviderManager()
+    env.dataprovider.add_type("bench", BenchAPI())
+    env.dataprovider.add_type("log", LogAPI())
+
+    _state.server = ElasticsearchServer()
+    _state.server.start()
+
+    conf = config.ConfigSection("benchmark")
+    conf.es_type = "log"
+    conf.es_url = _state.server.url
+    conf.es_mapping_ttl = "0"
+    conf.host = "host"
+    conf.program = "program"
+    conf.pid = "pid"
+
+    env.dataprovider.set_backend("log", ElasticsearchInstance("benchmark", conf))
+    _state.mapping = ElasticsearchMap("log", conf, dict((field, AttrObj(type=type)) for field, type in _LOG_FIELDS.items()))
+
+
+def teardown():
+    if _state.server:
+        _state.server.stop()
+        _state.server = None
+
+    for db in _state.databases.values():
+        db.close()
+
+    _state.databases = {}
+
+    if _state.tmpdir:
+        shutil.rmtree(_state.tmpdir, ignore_errors=True)
+        _state.tmpdir = None
@@ -0,0 +1,20 @@
+<table class="table table-striped table-condensed">
+  <thead>
+    <tr>
+    % for column in columns:
+      <th>${column}</th>
+    % endfor
+    </tr>
+  </thead>
+  <tbody>
+  % for row in rows:
+    <tr class="${'selected' if row['severity'] == 'high' else ''}">
+      <td><input type="checkbox" name="id" value="${row['id']}" ${checked(row['id'] in selection)}/></td>
+      <td><a href="${row['url']}" title="${row['classification']}">${row['classification']}</a></td>
+      <td>${row['severity']}</td>
+      <td>${row['source']}</td>
+      <td>${row['time']}</td>
+    </tr>
+  % endfor
+  </tbody>
+</table>
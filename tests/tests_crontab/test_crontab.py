@@ -23,13 +23,14 @@ Tests for `prewikka.crontab`.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import gevent
+import time
 
 from datetime import datetime, timedelta
 from pytz import timezone
 
 import pytest
 
-from prewikka.crontab import CronJob, crontab
+from prewikka.crontab import CronExecutor, CronJob, crontab
 
 
 def cronjob_test_func():
@@ -163,3 +164,159 @@ def test_cronjob():
 
     # clean
     env.db.query('DELETE FROM Prewikka_Crontab')
+
+
+def test_cronjob_progress():
+    """
+    Test `prewikka.crontab.CronJob.set_progress()` method.
+    """
+    cron_id = crontab.add('test_name', '* * * * *', user=env.request.user, ext_type=None, ext_id=None, enabled=True)
+    cronjob = crontab.get(cron_id)
+
+    assert cronjob.progress is None
+
+    cronjob.set_progress(deleted=42)
+
+    assert cronjob.progress == {'deleted': 42}
+    assert crontab.get(cron_id).progress == {'deleted': 42}
+
+    # clean
+    env.db.query('DELETE FROM Prewikka_Crontab')
+
+
+def test_cronjob_coalesce():
+    """
+    Test `prewikka.crontab.CronJob._get_next_schedule()` method.
+    """
+    now = datetime.now(timezone("UTC"))
+    cronjob = CronJob(1, 'test_name', '* * * * *', cronjob_test_func, now - timedelta(minutes=30), 0)
+
+    # the missed runs are skipped
+    next_schedule = cronjob._get_next_schedule(now)
+
+    assert now < next_schedule <= now + timedelta(minutes=1)
+
+
+def test_crontab_update_joblist():
+    """
+    Test `prewikka.crontab.Crontab._update_joblist()` method.
+    """
+    cron_id = crontab.add('test_name', '* * * * *', user=env.request.user, ext_type=None, ext_id=None, enabled=True)
+
+    crontab._update_joblist()
+    job = crontab._jobs[cron_id]
+
+    assert job.schedule == '* * * * *'
+
+    # unmodified jobs are kept as is
+    crontab._update_joblist()
+
+    assert crontab._jobs[cron_id] is job
+
+    # modified jobs are updated
+    crontab.update(cron_id, schedule='*/2 * * * *')
+    crontab._update_joblist()
+
+    assert crontab._jobs[cron_id] is job
+    assert job.schedule == '*/2 * * * *'
+
+    # disabled jobs are removed
+    crontab.update(cron_id, enabled=False)
+    crontab._update_joblist()
+
+    assert cron_id not in crontab._jobs
+
+    # clean
+    env.db.query('DELETE FROM Prewikka_Crontab')
+
+
+def test_cron_executor():
+    """
+    Test `prewikka.crontab.CronExecutor` class.
+    """
+    events = []
+
+    def callback(job):
+        events.append(("start", job.id))
+        gevent.sleep(0.01)
+        events.append(("end", job.id))
+
+    executor = CronExecutor()
+    executor.configure({"workers": 1, "concurrency": 2})
+
+    now = datetime.now(timezone("UTC"))
+    jobs = []
+    for i in range(2):
+        cron_id = crontab.add('test_name', '* * * * *', user=env.request.user, ext_type=None, ext_id=None, enabled=True)
+        jobs.append(CronJob(cron_id, 'test_name', '* * * * *', callback, now, 0))
+
+    completed = []
+    for job in jobs:
+        assert executor.can_run(job)
+        executor.submit(job, completed.append)
+
+    assert not executor.can_run(jobs[0])
+    gevent.wait()
+
+    # The jobs run in greenlets, one at a time with a single worker
+    assert events == [("start", jobs[0].id), ("end", jobs[0].id), ("start", jobs[1].id), ("end", jobs[1].id)]
+    assert completed == jobs
+    assert [crontab.get(job.id).runcnt for job in jobs] == [1, 1]
+    assert executor.can_run(jobs[0])
+
+    # clean
+    env.db.query('DELETE FROM Prewikka_Crontab')
+
+
+def test_cron_executor_blocking():
+    """
+    Test `prewikka.crontab.CronExecutor` class with a job blocking its thread.
+    """
+    events = []
+    ticks = []
+
+    def blocking(job):
+        events.append(("start", job.id))
+        # Not monkey-patched: the whole thread is blocked, as in a libpreludedb call
+        time.sleep(2)
+        events.append(("end", job.id))
+
+    def quick(job):
+        events.append(("quick", job.id))
+
+    def scheduler():
+        for i in range(5):
+            ticks.append(i)
+            gevent.sleep(0.1)
+
+    executor = CronExecutor()
+    executor.configure({"workers": 2, "concurrency": 2, "timeout": 1})
+
+    now = datetime.now(timezone("UTC"))
+    jobs = []
+    for callback in (blocking, quick):
+        cron_id = crontab.add('test_name', '* * * * *', user=env.request.user, ext_type=None, ext_id=None, enabled=True)
+        jobs.append(CronJob(cron_id, 'test_name', '* * * * *', callback, now, 0))
+
+    mark_timeout = jobs[0].mark_timeout
+    jobs[0].mark_timeout = lambda timeout: events.append(("timeout", jobs[0].id)) or mark_timeout(timeout)
+
+    completed = []
+    greenlet = gevent.spawn(scheduler)
+    for job in jobs:
+        executor.submit(job, completed.append)
+
+    # The other greenlets and jobs run while the first job blocks
+    greenlet.join()
+    assert ticks == list(range(5))
+    assert sorted(events) == [("quick", jobs[1].id), ("start", jobs[0].id)]
+    assert completed == [jobs[1]]
+
+    # The timeout is reported while the job is still blocked
+    gevent.wait()
+    assert events[2:] == [("timeout", jobs[0].id), ("end", jobs[0].id)]
+    assert completed == [jobs[1], jobs[0]]
+    assert "timeout" in env.db.query("SELECT error FROM Prewikka_Crontab WHERE id=%d", jobs[0].id)[0][0]
+
+    # clean
+    env.db.query('DELETE FROM Prewikka_Crontab')
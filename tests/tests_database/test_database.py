@@ -24,7 +24,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import pytest
 
-from prewikka.database import DatabaseError, DatabaseSchemaError, DatabaseUpdateHelper
+from prewikka.database import DatabaseError, DatabaseSchemaError, DatabaseTimeoutError, DatabaseUpdateHelper, MySQLDatabase, ReplicaRouter, \
+    mark_written, statement_timeout
 from tests.tests_database.utils import SQLScriptTest, SQLScriptTestWithBranch, SQLScriptTestWithoutVersion, \
     SQLScriptTestWithoutFromBranch, SQLScriptTestInstall
 
@@ -84,3 +85,126 @@ def test_sql_script():
 
     # test __eq__
     assert not sql_script == sql_script_install
+
+
+class _FakeConnection(object):
+    def __init__(self, name, lag=0):
+        self.name = name
+        self.lag = lag
+
+    def get_replication_lag(self):
+        if isinstance(self.lag, Exception):
+            raise self.lag
+
+        return self.lag
+
+
+def test_replica_router():
+    """
+    Test `prewikka.database.ReplicaRouter` class.
+    """
+    primary = _FakeConnection("primary")
+    replicas = [_FakeConnection("replica1"), _FakeConnection("replica2", lag=60), _FakeConnection("replica3")]
+    router = ReplicaRouter(primary, [(r.name, lambda r=r: r, 0, 30) for r in replicas])
+
+    # round-robin, skipping the lagging replica
+    assert [router.get().name for i in range(3)] == ["replica1", "replica3", "replica3"]
+
+    replicas[2].lag = Exception("connection lost")
+    assert router.get().name == "replica1"
+
+    # no usable replica
+    replicas[0].lag = 60
+    assert router.get() is primary
+
+    # failover to the primary
+    replicas[0].lag = 0
+    assert router.run(lambda db: db.name) == "replica1"
+
+    def _query(db):
+        if db is not primary:
+            raise Exception("Connection error: server closed the connection unexpectedly")
+
+        return db.name
+
+    assert router.run(_query) == "primary"
+
+    # query errors are raised, without running the query again on the primary
+    queried = []
+
+    def _invalid_query(db):
+        queried.append(db.name)
+        raise Exception("invalid regular expression: parentheses () not balanced")
+
+    with pytest.raises(Exception, match="invalid regular expression"):
+        router.run(_invalid_query)
+
+    assert queried == ["replica1"]
+
+    # the request reads its own writes
+    mark_written(primary)
+    assert router.get() is primary
+
+    assert ReplicaRouter(primary, []).get() is primary
+
+
+def test_mysql_window_functions():
+    """
+    Test `prewikka.database.MySQLDatabase.has_window_functions()` method.
+    """
+    def _database(version, version_string):
+        db = MySQLDatabase.__new__(MySQLDatabase)
+        db._version = version
+        db._dbhash = hash(version_string)
+        db.query = lambda sql: [[version_string]]
+        return db
+
+    assert not _database(50730, "5.7.30-log").has_window_functions()
+    assert _database(80019, "8.0.19").has_window_functions()
+
+    # MariaDB 10.0 and 10.1 do not support them
+    assert not _database(50564, "5.5.64-MariaDB").has_window_functions()
+    assert not _database(100144, "10.1.44-MariaDB-0ubuntu0.18.04.1").has_window_functions()
+    assert _database(100232, "10.2.32-MariaDB").has_window_functions()
+
+
+class _FakeSQL(object):
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.aborted = False
+
+    def query(self, sql):
+        if self.aborted:
+            raise RuntimeError("current transaction is aborted, commands ignored until end of transaction block")
+
+        if sql.startswith("SELECT"):
+            return [["%d" % self.timeout]]
+
+        self.timeout = int(sql.rsplit(" ", 1)[1])
+
+
+def test_statement_timeout():
+    """
+    Test `prewikka.database.statement_timeout()` function.
+    """
+    sql = _FakeSQL(30000)
+    with statement_timeout(sql, "pgsql", 2.5):
+        assert sql.timeout == 2500
+
+    # the session timeout is restored
+    assert sql.timeout == 30000
+
+    with pytest.raises(DatabaseTimeoutError):
+        with statement_timeout(sql, "mysql", 1):
+            raise RuntimeError("Query execution was interrupted, maximum statement execution time exceeded")
+
+    assert sql.timeout == 30000
+
+    # the original error is raised when the timeout cannot be restored
+    with pytest.raises(DatabaseTimeoutError):
+        with statement_timeout(sql, "pgsql", 1):
+            sql.aborted = True
+            raise RuntimeError("canceling statement due to statement timeout")
+
+    with statement_timeout(sql, "sqlite", 1):
+        pass
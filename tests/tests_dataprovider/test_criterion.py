@@ -200,3 +200,41 @@ def test_criterion_operations():
     criterion_and = criterion_1 & criterion_2
 
     assert criterion_and.to_string() == Criterion(criterion_1, '&&', criterion_2).to_string()
+
+
+def test_criterion_in():
+    """
+    Test `prewikka.dataprovider.Criterion` IN / NOT_IN operators.
+    """
+    criterion = Criterion('alert.messageid', 'in', ('id1', 'id2'))
+
+    assert criterion.operator == CriterionOperator.IN
+    assert criterion.right == ['id1', 'id2']
+    assert criterion.get_paths() == set(['alert.messageid'])
+    assert criterion.to_string() == "alert.messageid = 'id1' || alert.messageid = 'id2'"
+    assert criterion.to_string(noroot=True) == "messageid = 'id1' || messageid = 'id2'"
+
+    criterion = Criterion('alert.messageid', 'NOT_IN', ['id1', None])
+
+    assert criterion.to_string() == "alert.messageid != 'id1' && alert.messageid"
+
+    combined = Criterion('alert.messageid', 'in', ['id1', 'id2']) & Criterion('alert.analyzer.name', '=', 'foo')
+
+    assert combined.to_string() == "(alert.messageid = 'id1' || alert.messageid = 'id2') && alert.analyzer.name = 'foo'"
+
+    # multi-column (tuple) form, as it would be JSON-deserialized
+    criterion = Criterion(['alert.analyzer.analyzerid', 'alert.messageid'], 'in', [['a1', 'id1'], ['a2', 'id2']])
+
+    assert criterion.left == ('alert.analyzer.analyzerid', 'alert.messageid')
+    assert criterion.right == [('a1', 'id1'), ('a2', 'id2')]
+    assert criterion.get_paths() == set(['alert.analyzer.analyzerid', 'alert.messageid'])
+    assert criterion.to_string() == "(alert.analyzer.analyzerid = 'a1' && alert.messageid = 'id1') || " \
+                                    "(alert.analyzer.analyzerid = 'a2' && alert.messageid = 'id2')"
+
+    criterion = Criterion(('alert.analyzer.analyzerid', 'alert.messageid'), '!in', [('a1', 'id1')])
+
+    assert criterion.to_string() == "(alert.analyzer.analyzerid != 'a1' || alert.messageid != 'id1')"
+
+    # empty value list
+    assert Criterion('alert.messageid', 'in', []).to_string() == "alert.messageid && !alert.messageid"
+    assert Criterion('alert.messageid', '!in', []).to_string() == "alert.messageid || !alert.messageid"
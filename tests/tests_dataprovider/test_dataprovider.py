@@ -26,8 +26,11 @@ import datetime
 
 import pytest
 
-from prewikka.dataprovider import to_datetime, ResultObject
+from prewikka import hookmanager
+from prewikka.config import ConfigSection
+from prewikka.dataprovider import to_datetime, QueryBudget, QueryCancelledError, QueryResults, QueryTimeoutError, ResultObject
 from prewikka.error import PrewikkaUserError
+from prewikka.utils import AttrObj
 from prewikka.utils.timeutil import tzutc
 
 
@@ -56,3 +59,101 @@ def test_result_object():
     result = ResultObject({'foo': 'bar', '42': 42})
 
     assert result.preprocess_value('foobar') == 'foobar'
+
+
+def _query_results(rows):
+    results = QueryResults(rows)
+    results._paths = ['alert.messageid', 'alert.create_time', 'count(1)']
+    results._paths_types = [text_type, datetime.datetime, int]
+
+    return results
+
+
+def test_query_results():
+    """
+    Test `prewikka.dataprovider.QueryResults` class.
+    """
+    rows = [('foo', '1973-11-29 21:33:09', '42'), ('bar', None, 10)]
+    correct_datetime = datetime.datetime(1973, 11, 29, 21, 33, 9, tzinfo=tzutc())
+
+    results = _query_results(rows)
+    assert len(results) == 2
+    assert list(results[0]) == ['foo', correct_datetime, 42]
+    assert results[1][1] is None
+    assert results[1][-1] == 10
+    assert results[0][1:] == (correct_datetime, 42)
+    assert len(results[0]) == 3
+    assert results[0].__json__() == ['foo', correct_datetime, 42]
+
+    # bulk conversion
+    results = _query_results(rows).convert()
+    assert results._count == 2
+    assert [list(row) for row in results] == [['foo', correct_datetime, 42], ['bar', None, 10]]
+
+    # conversion error
+    with pytest.raises(PrewikkaUserError):
+        list(_query_results([('foo', None, 'bar')])[0])
+
+
+def test_query_results_read_hook():
+    """
+    Test `prewikka.dataprovider.QueryResults` with HOOK_DATAPROVIDER_VALUE_READ handlers.
+    """
+    def handler(cont):
+        if cont[0] == 'alert.messageid':
+            cont[1] = cont[1].upper()
+
+    hookmanager.register('HOOK_DATAPROVIDER_VALUE_READ', handler)
+    try:
+        results = _query_results([('foo', None, 1)])
+        assert list(results[0]) == ['FOO', None, 1]
+
+        results = _query_results([('foo', None, 1)]).convert()
+        assert list(results[0]) == ['FOO', None, 1]
+    finally:
+        hookmanager.unregister('HOOK_DATAPROVIDER_VALUE_READ', handler)
+
+
+def test_query_budget():
+    """
+    Test `prewikka.dataprovider.QueryBudget` class.
+    """
+    default = ConfigSection("")
+    default.query = "10"
+    default.request = "15"
+    view = ConfigSection("AlertDataSearch")
+    view.query = "20"
+    user = ConfigSection("user:john")
+    user.request = "60"
+
+    budget = QueryBudget.from_config([default, view, user], "AlertDataSearch.ajax_table", AttrObj(name="john"))
+    assert (budget.query_timeout, budget.request_timeout) == (20, 60)
+
+    budget = QueryBudget.from_config([default, view, user], "HeartbeatDataSearch.forensic")
+    assert (budget.query_timeout, budget.request_timeout) == (10, 15)
+
+    with QueryBudget().run() as timeout:
+        assert timeout is None
+
+    # the request budget is shared by its queries
+    with budget.run() as timeout:
+        assert timeout == budget.timeout == 10
+
+    assert budget.timeout is None
+
+    budget.spent = 8
+    with budget.run() as timeout:
+        assert timeout <= 7
+
+    budget.spent = 15
+    with pytest.raises(QueryTimeoutError):
+        with budget.run():
+            pass
+
+    # the client disconnected
+    budget = QueryBudget(is_connected=lambda: False)
+    with pytest.raises(QueryCancelledError):
+        with budget.run():
+            pass
+
+    assert budget.cancelled
@@ -0,0 +1,289 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.dataprovider.helpers.elasticsearch`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import socket
+import time
+
+import pytest
+import requests
+
+from prewikka import config, dataprovider, error
+from prewikka.dataprovider.helpers.elasticsearch import ElasticsearchClient, ElasticsearchQuery, _MappingCache
+from prewikka.utils import AttrObj
+from tests.benchmarks import environment as e
+
+
+_PATHS = ["log.timestamp/order_desc", "log.host", "log.program"]
+
+
+@pytest.fixture
+def elasticsearch_server():
+    """
+    Stub Elasticsearch server backing the log datatype.
+    """
+    backup = env.dataprovider, getattr(env, "viewmanager", None), env.request.user
+
+    e.setup()
+    e.set_search_response(e.search_response(list(e.logs(3))))
+
+    yield e.elasticsearch_server()
+
+    e.teardown()
+    env.dataprovider, env.viewmanager, env.request.user = backup
+
+
+def _rows(results):
+    return [list(row) for row in results]
+
+
+def _query(paths, limit, offset):
+    paths = env.dataprovider._type_handlers["log"].parse_paths(paths)[0]
+    return ElasticsearchQuery("log", e.elasticsearch_mapping(), paths, None, limit, offset)
+
+
+def test_query_batch(elasticsearch_server):
+    """
+    Test `prewikka.dataprovider.DataProviderManager.batch()` with Elasticsearch.
+    """
+    requests = elasticsearch_server.requests
+    expected = _rows(env.dataprovider.query(_PATHS, type="log"))
+    assert requests == ["/%s/_search" % elasticsearch_server.index]
+
+    # The searches are sent once the results of one of them are read
+    del requests[:]
+    with env.dataprovider.batch():
+        batch = [env.dataprovider.query(_PATHS, type="log") for i in range(3)]
+
+    assert requests == []
+    assert [_rows(results) for results in batch] == [expected] * 3
+    assert [results.total for results in batch] == [3] * 3
+    assert requests == ["/%s/_msearch" % elasticsearch_server.index]
+
+    # A failed search is sent again on its own
+    del requests[:]
+    elasticsearch_server.msearch_errors = {1}
+    with env.dataprovider.batch():
+        batch = [env.dataprovider.query(_PATHS, type="log") for i in range(3)]
+
+    assert [_rows(results) for results in batch] == [expected] * 3
+    assert requests == ["/%s/_msearch" % elasticsearch_server.index, "/%s/_search" % elasticsearch_server.index]
+
+    # The deferred searches are accounted for in the time budget of the request
+    budget = env.request.query_budget = dataprovider.QueryBudget()
+    try:
+        with env.dataprovider.batch():
+            batch = [env.dataprovider.query(_PATHS, type="log") for i in range(3)]
+
+        spent = budget.spent
+        assert [_rows(results) for results in batch] == [expected] * 3
+        assert budget.spent > spent
+        assert all(results.duration > 0 for results in batch)
+
+        with env.dataprovider.batch():
+            batch = [env.dataprovider.query(_PATHS, type="log") for i in range(3)]
+
+        budget.cancel()
+        for results in batch:
+            with pytest.raises(dataprovider.QueryCancelledError):
+                _rows(results)
+    finally:
+        env.request.query_budget = None
+
+
+def test_query_aggregation(elasticsearch_server):
+    """
+    Test `prewikka.dataprovider.helpers.elasticsearch.ElasticsearchQuery` terms aggregations.
+    """
+    # Top-N by count
+    search = _query(["count(1)/order_desc", "log.host/group_by"], 5, 10)
+    terms = search.get_query()["aggs"]["internal_1"]
+    assert terms["terms"]["size"] == 15
+    assert terms["terms"]["order"] == [{"internal_2": "desc"}]
+    assert terms["aggs"]["bucket_truncate"] == {"bucket_sort": {"from": 10, "size": 5}}
+    assert search.row_offset == 0
+
+    # Nested buckets sorted by the first group_by
+    search = _query(["count(1)", "log.host/group_by,order_asc", "log.program/group_by"], 20, 5)
+    terms = search.get_query()["aggs"]["internal_1"]
+    assert terms["terms"]["size"] == terms["aggs"]["internal_2"]["terms"]["size"] == 25
+    assert terms["terms"]["order"] == [{"_key": "asc"}]
+    assert "bucket_truncate" not in terms["aggs"]
+    assert search.row_offset == 5
+
+    # Rows sorted by count across nested buckets are sorted once retrieved
+    search = _query(["count(1)/order_desc", "log.host/group_by", "log.program/group_by"], 20, 5)
+    assert search.get_query()["aggs"]["internal_1"]["terms"]["size"] == 10000
+    assert search.row_offset == 5
+    assert not search.composite
+
+    # More buckets than a single response holds
+    elasticsearch_server.composite_buckets = [
+        {"key": {"internal_1": "host-%05d" % i}, "doc_count": i, "internal_2": {"value": i}} for i in range(12000)
+    ]
+    requests = elasticsearch_server.requests
+
+    results = env.dataprovider.query(["count(1)", "log.host/group_by,order_asc"], type="log", limit=3, offset=11000)
+    assert _rows(results) == [[i, "host-%05d" % i] for i in range(11000, 11003)]
+    assert requests == ["/%s/_search" % elasticsearch_server.index] * 2
+
+
+def test_mapping_cache(tmpdir):
+    """
+    Test `prewikka.dataprovider.helpers.elasticsearch._MappingCache`.
+    """
+    path = os.path.join(str(tmpdir), "elasticsearch", "mapping.json")
+    downloads = []
+    updates = []
+
+    def fetch():
+        downloads.append(path)
+        return {"host": AttrObj(type="keyword", keyword=True), "pid": AttrObj(type="long", keyword=False)}
+
+    fields = _MappingCache(path, fetch, 60).load()
+    assert fields["host"].type == "keyword" and fields["host"].keyword
+    assert fields["pid"].type == "long" and not fields["pid"].keyword
+    assert len(downloads) == 1
+
+    # Another process reads the stored mapping
+    cache = _MappingCache(path, fetch, 60, on_update=updates.append)
+    assert cache.load()["pid"].type == "long"
+    assert len(downloads) == 1
+
+    # A stale mapping is used while it is downloaded again in the background
+    mtime = time.time() - 120
+    os.utime(path, (mtime, mtime))
+
+    assert cache.load()["pid"].type == "long"
+    cache._thread.join()
+
+    assert len(downloads) == 2
+    assert [fields["pid"].type for fields in updates] == ["long"]
+    assert os.path.getmtime(path) > mtime
+
+    cache.refresh()
+    assert len(downloads) == 2
+
+
+def _unreachable_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    return "http://127.0.0.1:%d" % port
+
+
+def test_client_nodes(elasticsearch_server):
+    """
+    Test `prewikka.dataprovider.helpers.elasticsearch.ElasticsearchClient` with several nodes.
+    """
+    conf = config.ConfigSection("test")
+    conf.es_type = "log"
+    conf.es_url = elasticsearch_server.url
+    conf.es_nodes = "%s, %s" % (_unreachable_url(), elasticsearch_server.url.rsplit("/", 1)[0])
+    conf.es_mapping_ttl = "0"
+    conf.es_pool_size = "32"
+    conf.es_request_compression = "yes"
+
+    client = ElasticsearchClient("test", conf)
+    assert client._session.get_adapter(elasticsearch_server.url)._pool_maxsize == 32
+
+    # The unreachable node is skipped
+    nodes = client._nodes._nodes
+    assert nodes[0].failures == 1 and nodes[0].retry_at > time.time()
+
+    paths = env.dataprovider._type_handlers["log"].parse_paths(_PATHS)[0]
+    requests = elasticsearch_server.requests
+    for i in range(3):
+        assert len(_rows(client.query(paths, None).api_results)) == 3
+
+    assert len(requests) == 3
+    assert nodes[0].failures == 1
+
+    headers, body = elasticsearch_server.last_request
+    assert headers["Content-Encoding"] == "gzip"
+    assert headers["Accept-Encoding"] == "gzip"
+    assert json.loads(body.decode("utf8"))["size"] == 50
+
+    # Once the backoff is over, the node is tried again
+    nodes[0].retry_at = 0
+    for i in range(2):
+        client.query(paths, None)
+
+    assert nodes[0].failures == 2
+    assert len(requests) == 5
+
+
+def test_client_nodes_urls(elasticsearch_server):
+    """
+    Test `prewikka.dataprovider.helpers.elasticsearch.ElasticsearchClient` node URLs.
+    """
+    conf = config.ConfigSection("test")
+    conf.es_type = "log"
+    conf.es_url = "%s,logs-b" % elasticsearch_server.url
+    conf.es_mapping_ttl = "0"
+
+    # Commas in es_url separate indices, not nodes
+    client = ElasticsearchClient("test", conf)
+    assert [node.url for node in client._nodes._nodes] == [conf.es_url]
+
+    base = elasticsearch_server.url.rsplit("/", 1)[0]
+    unreachable = _unreachable_url()
+    conf.es_nodes = "%s/, %s" % (unreachable, base)
+    client = ElasticsearchClient("test", conf)
+    assert [node.url for node in client._nodes._nodes] == ["%s/%s,logs-b" % (unreachable, elasticsearch_server.index), conf.es_url]
+
+
+def test_client_nodes_retry(elasticsearch_server, monkeypatch):
+    """
+    Test `prewikka.dataprovider.helpers.elasticsearch.ElasticsearchClient` retries on another node.
+    """
+    conf = config.ConfigSection("test")
+    conf.es_type = "log"
+    conf.es_url = elasticsearch_server.url
+    conf.es_nodes = "%s, %s" % ((elasticsearch_server.url.rsplit("/", 1)[0],) * 2)
+    conf.es_mapping_ttl = "0"
+
+    client = ElasticsearchClient("test", conf)
+    sent = []
+
+    def request(method, url, **kwargs):
+        sent.append(method)
+        raise requests.exceptions.ConnectionError("Connection aborted")
+
+    monkeypatch.setattr(client._session, "request", request)
+
+    # The connection was lost once the request was sent, it may have been processed
+    with pytest.raises(error.PrewikkaUserError):
+        client.request("/_search", "{}")
+
+    assert sent == ["POST"]
+
+    # Requests without side effect are sent again to the next node
+    with pytest.raises(error.PrewikkaUserError):
+        client.request("/_mapping", method="GET")
+
+    assert sent == ["POST", "GET", "GET"]
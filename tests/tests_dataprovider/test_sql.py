@@ -0,0 +1,215 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.dataprovider.helpers.sql`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import pytest
+
+from prewikka.dataprovider import COMPOSITE_TIME_FIELD, Criterion
+from prewikka.dataprovider.helpers import sql
+from prewikka.dataprovider.helpers.sql import SQLBuilder
+from prewikka.error import NotImplementedError
+from tests.benchmarks import environment as e
+
+
+_GROUPBY_PATHS = ["count(1)/order_desc", "bench.classification/group_by", "bench.severity/group_by"]
+
+
+def _builder(db, max_duration=None):
+    return SQLBuilder(e.PATHS_MAP, e.TABLES, e.JOINS, db=db, time_paths=("bench.start_time", "bench.end_time"), max_duration=max_duration)
+
+
+@pytest.fixture
+def sqlite_database():
+    """
+    In-memory SQLite database holding a few alerts.
+    """
+    db = e.BenchDatabase("sqlite")
+    if not db.has_window_functions():
+        pytest.skip("SQLite >= 3.25 is required for window functions")
+
+    db.executescript(e._SCHEMA)
+    e._insert_alerts(db, list(e.alerts(500)))
+
+    yield db
+
+    db.close()
+
+
+def test_execute_query_total(sqlite_database, monkeypatch):
+    """
+    Test `prewikka.dataprovider.helpers.sql.SQLBuilder.execute_query()` with a total.
+    """
+    builder = _builder(sqlite_database)
+    paths, _ = e.BenchAPI().parse_paths(_GROUPBY_PATHS)
+    groups = list(builder.execute_query(paths, Criterion(), False, -1, 0))
+
+    results = builder.execute_query(paths, Criterion(), False, 5, 2, with_total=True)
+    assert results.total == len(groups)
+    assert [row[0] for row in results] == [row[0] for row in groups[2:7]]
+
+    # Empty page past the last group
+    results = builder.execute_query(paths, Criterion(), False, 5, len(groups), with_total=True)
+    assert list(results) == []
+    assert results.total == len(groups)
+
+    results = builder.execute_query(paths, Criterion("bench.severity", "==", "unknown"), False, 5, 0, with_total=True)
+    assert results.total == 0
+
+    # Without window functions, the total is computed by a separate query
+    monkeypatch.setattr(sqlite_database, "has_window_functions", lambda: False)
+
+    results = builder.execute_query(paths, Criterion(), False, 5, 2, with_total=True)
+    assert results.total == len(groups)
+    assert len(list(results)) == 5
+
+    with pytest.raises(NotImplementedError):
+        builder.build_query(paths, Criterion(), False, 5, 2, with_total=True)
+
+
+def test_execute_query_partition(sqlite_database):
+    """
+    Test `prewikka.dataprovider.helpers.sql.SQLBuilder.execute_query()` with a top-N per group.
+    """
+    builder = _builder(sqlite_database)
+    paths, _ = e.BenchAPI().parse_paths(_GROUPBY_PATHS)
+    groups = list(builder.execute_query(paths, Criterion(), False, -1, 0))
+    results = list(builder.execute_query(paths, Criterion(), False, -1, 0, partition_by=(2,), partition_limit=2))
+
+    expected = []
+    for severity in set(row[2] for row in groups):
+        expected += [(severity, row[0]) for row in groups if row[2] == severity][:2]
+
+    assert sorted((row[2], row[0]) for row in results) == sorted(expected)
+    assert [row[0] for row in results] == sorted((row[0] for row in results), reverse=True)
+
+
+def test_build_cte_query_buckets(sqlite_database, monkeypatch):
+    """
+    Test `prewikka.dataprovider.helpers.sql.SQLBuilder.build_query()` on a composite time field.
+    """
+    parser = e.BenchAPI(time_field=("start_time", "end_time"))
+    parser.dataprovider_type = "bench"
+    parser.post_load()
+
+    paths, _ = parser.parse_paths(["count(1)", "bench.severity/group_by", "bench.%s:hour/order_asc,group_by" % COMPOSITE_TIME_FIELD])
+    criteria = Criterion("bench.end_time", ">=", e.END - e.PERIOD) & Criterion("bench.start_time", "<=", e.END)
+
+    # Without a known duration, rows are matched against every interval
+    reference = _builder(sqlite_database).build_query(paths, criteria, False, -1, 0)
+    assert "offsets" not in reference
+
+    # The alerts last less than a minute
+    builder = _builder(sqlite_database, max_duration=60)
+    query = builder.build_query(paths, criteria, False, -1, 0)
+    assert "offsets" in query
+
+    # Same results as when matching every row against every interval, with a single query
+    queries = []
+    query_function = sqlite_database.query
+    monkeypatch.setattr(sqlite_database, "query", lambda sql: queries.append(sql) or query_function(sql))
+
+    expected = query_function(reference)
+    assert query_function(query) == expected
+    assert [tuple(row) for row in builder.execute_query(paths, criteria, False, -1, 0)] == expected
+    assert len(queries) == 1
+
+    # Rows lasting longer than the duration are still matched against all their intervals
+    sqlite_database.executemany("INSERT INTO Bench_Alert VALUES (?, ?, ?, ?, ?)",
+                                [(10000, "long", "high", sqlite_database.datetime(e.END - e.PERIOD), sqlite_database.datetime(e.END))])
+    assert query_function(query) == query_function(reference)
+
+    # Rows spanning most intervals are matched against every interval
+    assert "offsets" not in _builder(sqlite_database, max_duration=e.PERIOD.total_seconds()).build_query(paths, criteria, False, -1, 0)
+
+    monkeypatch.setattr(sql, "_CTE_MAX_INTERVALS", 10**6)
+    assert "offsets" not in builder.build_query(paths, criteria, False, -1, 0)
+
+    # PostgreSQL expands each row into its intervals regardless of its duration
+    monkeypatch.undo()
+    monkeypatch.setattr(sqlite_database, "get_type", lambda: "pgsql")
+    assert "generate_series" in _builder(sqlite_database).build_query(paths, criteria, False, -1, 0)
+
+
+def test_build_query_joins(sqlite_database, monkeypatch):
+    """
+    Test `prewikka.dataprovider.helpers.sql.SQLBuilder.build_query()` join planning.
+    """
+    # Alerts with several sources
+    sqlite_database.executemany("INSERT INTO Bench_Source VALUES (?, ?)", [(i, "10.9.9.9") for i in range(0, 500, 3)])
+
+    builder = _builder(sqlite_database)
+    source = Criterion("bench.source", "==", "10.9.9.9")
+    classification = Criterion("bench.classification", "==", "Classification 1")
+    cases = [
+        (["bench.messageid"], source, "EXISTS"),
+        (["bench.messageid"], source | Criterion("bench.severity", "==", "high"), "EXISTS"),
+        (["bench.messageid", "bench.classification"], classification & source, "INNER JOIN"),
+        (["bench.messageid"], Criterion(None, "!", source), "LEFT JOIN"),
+        (["bench.messageid"], Criterion("bench.source", "==", None), "LEFT JOIN"),
+    ]
+
+    results = []
+    for paths, criteria, plan in cases:
+        paths, _ = e.BenchAPI().parse_paths(paths)
+        query = builder.build_query(paths, criteria, True, -1, 0)
+        assert plan in query
+        assert plan in builder.explain(paths, criteria)
+
+        results.append(sorted(sqlite_database.query(query)))
+
+    # Same rows as when LEFT JOINing everything
+    monkeypatch.setattr(SQLBuilder, "_plan_joins", lambda self, criteria, query: None)
+    for (paths, criteria, plan), expected in zip(cases, results):
+        paths, _ = e.BenchAPI().parse_paths(paths)
+        query = builder.build_query(paths, criteria, True, -1, 0)
+        assert "EXISTS" not in query and "INNER" not in query
+        assert sorted(sqlite_database.query(query)) == expected
+
+
+def test_execute_delete_batch(sqlite_database, monkeypatch):
+    """
+    Test `prewikka.dataprovider.helpers.sql.SQLBuilder.execute_delete()` with a limit.
+    """
+    builder = _builder(sqlite_database)
+    criteria = Criterion("bench.severity", "==", "high")
+    start_times = sorted(row[0] for row in sqlite_database.query("SELECT start_time FROM Bench_Alert WHERE severity = 'high'"))
+    count = len(start_times)
+
+    # The oldest objects are deleted first
+    assert builder.execute_delete(criteria, [], 10) == 10
+    assert sorted(row[0] for row in sqlite_database.query("SELECT start_time FROM Bench_Alert WHERE severity = 'high'")) == start_times[10:]
+    assert sqlite_database.query("SELECT COUNT(*) FROM Bench_Alert")[0][0] == 490
+
+    # The dataprovider deletes the remaining objects by chunks
+    dataprovider = e.BenchDataProviderManager()
+    dataprovider.add_type("bench", e.BenchAPI())
+    dataprovider.set_backend("bench", e.BenchSQLBackend(sqlite_database))
+
+    # Criteria are compiled using the type handlers of env.dataprovider
+    monkeypatch.setattr(env, "dataprovider", dataprovider)
+
+    progress = []
+    assert dataprovider.delete(criteria, type="bench", batch_size=20, progress=progress.append) == count - 10
+    assert progress[:-1] == list(range(20, count - 10, 20)) and progress[-1] == count - 10
+    assert sqlite_database.query("SELECT COUNT(*) FROM Bench_Alert WHERE severity = 'high'")[0][0] == 0
+    assert sqlite_database.query("SELECT COUNT(*) FROM Bench_Alert")[0][0] == 500 - count
@@ -24,7 +24,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import pytest
 
-from prewikka import hookmanager
+from prewikka import hookmanager, profiling
 
 
 def test_hookmanager_register():
@@ -91,3 +91,100 @@ def test_hookmanager_unregister():
     hookmanager.unregister(hook, method)
 
     assert list(hookmanager.trigger(hook, 'bar')) == []
+
+
+def test_hookmanager_unregister_owner():
+    """
+    Test `prewikka.hookmanager.HookManager.unregister()` method with an owner.
+    """
+    class Plugin(object):
+        def handler(self, x):
+            return x + '42'
+
+    hook = 'hook_7'
+    plugin1 = Plugin()
+    plugin2 = Plugin()
+
+    hookmanager.register(hook, plugin1.handler)
+    hookmanager.register(hook, plugin2.handler)
+
+    assert list(hookmanager.trigger(hook, 'bar', _owner=plugin1)) == ['bar42']
+
+    hookmanager.unregister(owner=plugin1)
+
+    assert list(hookmanager.trigger(hook, 'bar')) == ['bar42']
+    assert list(hookmanager.trigger(hook, 'bar', _owner=plugin1)) == []
+
+
+def test_hookmanager_unregister_ordering():
+    """
+    Test `prewikka.hookmanager.HookManager.unregister()` keeps handlers ordering.
+    """
+    hook = 'hook_8'
+    method = 'x'
+
+    hookmanager.register(hook, 'r', _order=3)
+    hookmanager.register(hook, method, _order=0)
+    hookmanager.register(hook, 'a', _order=2)
+    hookmanager.register(hook, 'b', _order=1)
+    hookmanager.unregister(hook, method)
+
+    assert ''.join(hookmanager.trigger(hook)) == 'bar'
+
+
+def test_hookmanager_has_handlers():
+    """
+    Test `prewikka.hookmanager.HookManager.has_handlers()` method.
+    """
+    hook = 'hook_9'
+
+    def method(x):
+        return x
+
+    assert not hookmanager.has_handlers(hook)
+    assert list(hookmanager.trigger(hook, 'bar')) == []
+
+    hookmanager.register(hook, method)
+    assert hookmanager.has_handlers(hook)
+
+    hookmanager.unregister(hook, method)
+    assert not hookmanager.has_handlers(hook)
+
+
+def test_hookmanager_trigger_batch():
+    """
+    Test `prewikka.hookmanager.HookManager.trigger_batch()` method.
+    """
+    hook = 'hook_10'
+    calls = []
+
+    hookmanager.register(hook, lambda items: calls.append(('batch', list(items))), _batch=True)
+    hookmanager.register(hook, lambda item: calls.append(('item', item)))
+
+    hookmanager.trigger_batch(hook, [1, 2])
+    assert calls == [('batch', [1, 2]), ('item', 1), ('item', 2)]
+
+    # Batch handlers get a single item list on regular triggers
+    del calls[:]
+    assert list(hookmanager.trigger(hook, 3)) == [None, None]
+    assert calls == [('batch', [3]), ('item', 3)]
+
+
+def test_hookmanager_stats(monkeypatch):
+    """
+    Test `prewikka.hookmanager.HookManager.get_stats()` method.
+    """
+    hook = 'hook_11'
+    hookmanager.register(hook, lambda x: x)
+
+    # only collected when profiling
+    list(hookmanager.trigger(hook, 'bar'))
+    assert hook not in hookmanager.hookmgr.get_stats()
+
+    monkeypatch.setattr(profiling.profiler, "enabled", True)
+    list(hookmanager.trigger(hook, 'bar'))
+    list(hookmanager.trigger(hook, 'bar'))
+
+    assert hookmanager.hookmgr.get_stats()[hook][0] == 2
+    assert hookmanager.hookmgr.get_stats()[hook][1] == 2
+    assert 'prewikka_hook_triggers_total{hook="%s"} 2' % hook in hookmanager.hookmgr.format_metrics()
@@ -23,16 +23,36 @@ Tests for `prewikka.log`.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import copy
+import logging
 import os
 import sys
 
 import pytest
 
 from prewikka.config import ConfigSection
-from prewikka.log import Log
+from prewikka.log import Log, _RecordQueue, _SMTPDigestHandler
 from tests.utils.vars import TEST_DOWNLOAD_DIR
 
 
+@pytest.fixture(autouse=True)
+def close_logs(monkeypatch):
+    """
+    Close the logs created by the test, whose handlers are added to the root logger.
+    """
+    logs = []
+    init = Log.__init__
+
+    def log_init(self, *args, **kwargs):
+        logs.append(self)
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(Log, "__init__", log_init)
+    yield
+
+    for log in logs:
+        log.close()
+
+
 def test_log():
     """
     Test `prewikka.log.Log` class.
@@ -114,9 +134,17 @@ def test_log_file():
 
     log = Log([conf])
     log.log(10, 'foo bar')
+    assert log.flush(5)
 
     assert output_file_size != os.stat(conf.file).st_size
 
+    # the handler is removed and the listener stopped once closed
+    handler, listener = log._handler, log._listener
+    log.close()
+
+    assert handler not in logging.getLogger().handlers
+    assert not listener._thread.is_alive()
+
 
 @pytest.mark.xfail(reason='pytest upgrade required (3.0+)')
 def test_log_stderr():
@@ -179,3 +207,46 @@ def test_log_invalid_format():
 
     with pytest.raises(ValueError):
         Log([conf])
+
+
+def test_log_queue():
+    """
+    Test `prewikka.log._RecordQueue` class.
+    """
+    queue = _RecordQueue(3)
+    for i in range(5):
+        queue.put(i)
+
+    # The oldest records are dropped
+    assert queue.dropped == 2
+    assert queue.get(0) == [2, 3, 4]
+    assert queue.get(0) == []
+    assert not queue.join(0)
+
+    queue.task_done(3)
+    assert queue.join(0)
+
+
+def test_log_smtp_digest(monkeypatch):
+    """
+    Test `prewikka.log._SMTPDigestHandler` class.
+    """
+    mails = []
+    hdlr = _SMTPDigestHandler("localhost", "user@localhost", ["root@localhost"], "Prewikka Test !", interval=60, size=2)
+    monkeypatch.setattr(hdlr, "_send", lambda records, skipped: mails.append(([r.getMessage() for r in records], skipped)))
+
+    def record(msg):
+        return logging.LogRecord("prewikka", logging.ERROR, __file__, 0, msg, None, None)
+
+    # The first record is sent right away, the following ones once the interval is over
+    for i in range(5):
+        hdlr.handle(record("error %d" % i))
+
+    assert mails == [(["error 0"], 0)]
+
+    hdlr._next_time = 0
+    hdlr.poll()
+    assert mails[1] == (["error 1", "error 2"], 2)
+
+    hdlr.poll()
+    assert len(mails) == 2
@@ -0,0 +1,146 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.main`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka import hookmanager, main, pluginmanager
+
+
+class _FakePlugin(pluginmanager.PluginBase):
+    """
+    Plugin recording the hooks it receives.
+    """
+    def __init__(self, events):
+        self.events = events
+        pluginmanager.PluginBase.__init__(self)
+
+    @hookmanager.register("HOOK_PLUGINS_LOAD")
+    def _loaded(self):
+        self.events.append(("load", self.name))
+
+    @hookmanager.register("HOOK_TEST_RELOAD")
+    def _triggered(self):
+        return self.name
+
+
+class _FakePluginManager(object):
+    """
+    Plugin manager of a single entrypoint, with disabled plugins failing to load.
+    """
+    def __init__(self, entrypoint, events, disabled):
+        self._entrypoint = entrypoint
+        self._events = events
+        self._disabled = disabled
+        self.plugins = {}
+
+    def add_plugin(self, mname, autoupdate=False):
+        if mname in self._disabled:
+            return None
+
+        plugin = env.all_plugins[self._entrypoint][mname](self._events)
+        plugin.name = mname
+        self.plugins[mname] = plugin
+        return plugin
+
+    def remove_plugin(self, mname):
+        return self.plugins.pop(mname, None)
+
+
+def _make_plugin_class(plugin_after=[]):
+    return type(str("FakePlugin"), (_FakePlugin,), {"plugin_after": plugin_after})
+
+
+def _setup(monkeypatch, events, disabled):
+    all_plugins = {
+        "prewikka.plugins": {
+            "foo:Foo": _make_plugin_class(),
+            "bar:Bar": _make_plugin_class(),
+            "baz:Baz": _make_plugin_class(plugin_after=["foo"]),
+        },
+        "prewikka.views": {"new:New": _make_plugin_class()},
+        "prewikka.dataprovider.type": {"data:Data": _make_plugin_class()},
+    }
+
+    monkeypatch.setattr(env, "all_plugins", all_plugins, raising=False)
+    monkeypatch.setattr(env, "pluginmanager", {
+        "prewikka.plugins": _FakePluginManager("prewikka.plugins", events, disabled),
+        "prewikka.views": _FakePluginManager("prewikka.views", events, disabled),
+    }, raising=False)
+
+    for entrypoint in ("prewikka.plugins", "prewikka.views"):
+        for mname in all_plugins[entrypoint]:
+            if mname != "new:New":
+                env.pluginmanager[entrypoint].add_plugin(mname)
+
+    del events[:]
+
+    core = main.Core.__new__(main.Core)
+    core.autoupdate = False
+
+    return core
+
+
+def _registered():
+    return sorted(hookmanager.trigger("HOOK_TEST_RELOAD"))
+
+
+def test_reload_plugins_incremental(monkeypatch):
+    """
+    Test `prewikka.main.Core._reload_plugins_incremental()` method.
+    """
+    events = []
+    disabled = set()
+    core = _setup(monkeypatch, events, disabled)
+    foo = env.pluginmanager["prewikka.plugins"].plugins["foo:Foo"]
+
+    try:
+        assert _registered() == ["bar:Bar", "baz:Baz", "foo:Foo"]
+
+        # Added plugin
+        assert core._reload_plugins_incremental({"new:New"})
+        assert "new:New" in env.pluginmanager["prewikka.views"].plugins
+        assert events == [("load", "new:New")]
+        assert _registered() == ["bar:Bar", "baz:Baz", "foo:Foo", "new:New"]
+
+        # Removed (disabled) plugin
+        del events[:]
+        disabled.add("bar:Bar")
+        assert core._reload_plugins_incremental({"bar:Bar"})
+        assert "bar:Bar" not in env.pluginmanager["prewikka.plugins"].plugins
+        assert events == []
+        assert _registered() == ["baz:Baz", "foo:Foo", "new:New"]
+
+        # Changed plugin, only the new instance receives the hooks
+        assert core._reload_plugins_incremental({"new:New"})
+        assert events == [("load", "new:New")]
+        assert _registered() == ["baz:Baz", "foo:Foo", "new:New"]
+
+        # Plugins depending on a changed plugin, and other entrypoints, require a full reload
+        del events[:]
+        assert not core._reload_plugins_incremental({"foo:Foo"})
+        assert not core._reload_plugins_incremental({"data:Data"})
+        assert env.pluginmanager["prewikka.plugins"].plugins["foo:Foo"] is foo
+        assert events == []
+    finally:
+        for manager in env.pluginmanager.values():
+            for plugin in manager.plugins.values():
+                hookmanager.unregister(owner=plugin)
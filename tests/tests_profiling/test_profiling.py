@@ -0,0 +1,81 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.profiling`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka import profiling, response
+
+
+def test_profiler_disabled():
+    """
+    Test `prewikka.profiling.Profiler.span()` when profiling is disabled.
+    """
+    profiler = profiling.Profiler()
+
+    with profiler.span("sql", statement="SELECT 1") as span:
+        span.set(rows=1)
+
+    assert profiler.format_metrics() == "# TYPE prewikka_duration_seconds histogram\n"
+
+
+def test_profiler_request():
+    """
+    Test `prewikka.profiling.Profiler` spans recording and Server-Timing header.
+    """
+    profiler = profiling.Profiler()
+    profiler.enabled = profiler.server_timing = True
+
+    profiler.start_request("/foo")
+    with profiler.span("sql", statement="SELECT 1"):
+        pass
+
+    with profiler.span("sql", statement="SELECT 2"):
+        pass
+
+    assert len(env.request.profile.spans) == 2
+    assert env.request.profile.summary()["sql"][0] == 2
+
+    resp = response.PrewikkaResponse("foo")
+    profiler.end_request(resp)
+
+    assert resp.headers["Server-Timing"].startswith("total;dur=")
+    assert 'sql;dur=' in resp.headers["Server-Timing"]
+    assert 'prewikka_duration_seconds_count{category="sql"} 2' in profiler.format_metrics()
+    assert 'prewikka_duration_seconds_count{category="request"} 1' in profiler.format_metrics()
+
+
+def test_profiler_max_spans():
+    """
+    Test `prewikka.profiling.RequestProfile` spans limit.
+    """
+    profiler = profiling.Profiler()
+    profiler.enabled = True
+    profiler.max_spans = 2
+
+    profiler.start_request("/foo")
+    for i in range(5):
+        with profiler.span("hook", hook="HOOK_DATAPROVIDER_VALUE_READ"):
+            pass
+
+    assert len(env.request.profile.spans) == 2
+    assert env.request.profile.dropped == 3
+    assert env.request.profile.summary()["hook"][0] == 5
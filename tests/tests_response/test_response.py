@@ -24,9 +24,15 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 from collections import OrderedDict
 from copy import deepcopy
+import gzip
+import io
 import os
+import zlib
 
-from prewikka.response import PrewikkaResponse, PrewikkaDownloadResponse, PrewikkaFileResponse, PrewikkaRedirectResponse
+from prewikka import response as response_module
+from prewikka.config import ConfigSection
+from prewikka.response import Compression, check_etag, make_etag, PrewikkaResponse, PrewikkaDownloadResponse, PrewikkaFileResponse, PrewikkaRedirectResponse
+from tests.utils.fixtures import FakeInitialRequest
 from tests.utils.vars import TEST_DATA_DIR
 
 
@@ -150,3 +156,200 @@ def test_prewikka_redirect_response():
     response = PrewikkaRedirectResponse('https://google.com')
 
     assert response.code == 302
+
+
+class _RecordingRequest(FakeInitialRequest):
+    """
+    Fake request recording the response.
+    """
+    def __init__(self, accept_encoding=None, if_none_match=None, **headers):
+        FakeInitialRequest.__init__(self, "/")
+        self.headers = {"accept-encoding": accept_encoding, "if-none-match": if_none_match}
+        self.headers.update(headers)
+        self.response_headers = None
+        self.data = []
+
+    def send_headers(self, headers=None, code=200, status_text=None):
+        self.response_headers = dict(headers)
+
+    def write(self, data):
+        self.data.append(data)
+
+
+def test_prewikka_response_compression(monkeypatch):
+    """
+    Test `prewikka.response.Compression` class.
+    """
+    conf = ConfigSection("compression")
+    conf.enable = "yes"
+    conf.min_size = "100"
+    conf.encodings = "gzip, deflate"
+
+    compression = Compression()
+    compression.configure(conf)
+    monkeypatch.setattr(response_module, "compression", compression)
+
+    data = "foo bar " * 1000
+
+    # gzip is preferred
+    req = _RecordingRequest("deflate, gzip;q=0.5")
+    PrewikkaResponse(data).write(req)
+    assert req.response_headers["Content-Encoding"] == "gzip"
+    assert gzip.GzipFile(fileobj=io.BytesIO(b"".join(req.data))).read() == data.encode("utf8")
+
+    req = _RecordingRequest("deflate, gzip;q=0")
+    PrewikkaResponse(data).write(req)
+    assert req.response_headers["Content-Encoding"] == "deflate"
+    assert zlib.decompress(b"".join(req.data)) == data.encode("utf8")
+
+    # Not accepted, too small, or not compressible
+    for accept_encoding, data, content_type in (("identity", data, "text/html"), ("gzip", "foo", "text/html"), ("*", data, "image/png")):
+        req = _RecordingRequest(accept_encoding)
+        response = PrewikkaResponse(data)
+        response.headers["Content-Type"] = content_type
+        response.write(req)
+
+        assert "Content-Encoding" not in req.response_headers
+        assert b"".join(req.data) == data.encode("utf8")
+
+    # Static files are compressed in chunks
+    path = os.path.join(TEST_DATA_DIR, 'file.txt')
+    with open(path, 'rb') as fd:
+        content = fd.read()
+
+    monkeypatch.setattr(compression, "min_size", 0)
+    req = _RecordingRequest("gzip")
+    PrewikkaFileResponse(path).write(req)
+    assert "Content-Length" not in req.response_headers
+    assert gzip.GzipFile(fileobj=io.BytesIO(b"".join(req.data))).read() == content
+
+
+def test_prewikka_response_etag():
+    """
+    Test `prewikka.response.PrewikkaResponse` conditional requests.
+    """
+    # JSON responses to XHR requests are validated using their body
+    req = _RecordingRequest()
+    req.is_xhr = True
+    PrewikkaResponse({"foo": "bar"}).write(req)
+
+    etag = req.response_headers["ETag"]
+    assert req.response_headers["Cache-Control"] == "private, no-cache"
+    assert req.data
+
+    req = _RecordingRequest(if_none_match='"other", W/%s' % etag)
+    req.is_xhr = True
+    response = PrewikkaResponse({"foo": "bar"})
+    response.write(req)
+    assert response.code == 304
+    assert not req.data
+
+    # Other responses are only cached on demand
+    req = _RecordingRequest(if_none_match=etag)
+    PrewikkaResponse({"foo": "bar"}).write(req)
+    assert "ETag" not in req.response_headers
+
+    # ETag given by the view
+    etag = make_etag(42)
+    assert etag != make_etag(43)
+
+    req = _RecordingRequest()
+    PrewikkaResponse("foo").set_cache(etag, max_age=60).write(req)
+    assert req.response_headers["ETag"] == etag
+    assert req.response_headers["Cache-Control"] == "private, max-age=60"
+
+    backup_headers = env.request.web.headers
+    env.request.web.headers = {"if-none-match": etag}
+    assert check_etag(etag).code == 304
+    assert check_etag(make_etag(43)) is None
+    env.request.web.headers = backup_headers
+
+
+def test_prewikka_response_etag_compression(monkeypatch):
+    """
+    Test `prewikka.response.check_etag()` with compressed responses.
+    """
+    conf = ConfigSection("compression")
+    conf.enable = "yes"
+    conf.min_size = "0"
+
+    compression = Compression()
+    compression.configure(conf)
+    monkeypatch.setattr(response_module, "compression", compression)
+
+    etag = make_etag(42)
+
+    # Each encoding has its own ETag
+    req = _RecordingRequest("gzip")
+    PrewikkaResponse("foo").set_cache(etag).write(req)
+    assert req.response_headers["Content-Encoding"] == "gzip"
+
+    gzip_etag = req.response_headers["ETag"]
+    assert gzip_etag != etag
+
+    # which the view validates with the ETag of the content
+    backup_headers = env.request.web.headers
+    env.request.web.headers = {"if-none-match": gzip_etag}
+    assert check_etag(etag).code == 304
+    assert check_etag(make_etag(43)) is None
+    env.request.web.headers = backup_headers
+
+    req = _RecordingRequest("gzip", if_none_match=gzip_etag)
+    response = PrewikkaResponse("foo").set_cache(etag)
+    response.write(req)
+    assert response.code == 304
+    assert not req.data
+
+
+def test_prewikka_file_response_range():
+    """
+    Test `prewikka.response.PrewikkaFileResponse` range requests.
+    """
+    path = os.path.join(TEST_DATA_DIR, 'file.txt')
+    with open(path, 'rb') as fd:
+        content = fd.read()
+
+    size = len(content)
+
+    req = _RecordingRequest()
+    PrewikkaFileResponse(path).write(req)
+    etag = req.response_headers["ETag"]
+    assert req.response_headers["Accept-Ranges"] == "bytes"
+    assert b"".join(req.data) == content
+
+    for value, expected in (("bytes=2-5", (2, 5)), ("bytes=3-", (3, size - 1)), ("bytes=-4", (size - 4, size - 1)),
+                            ("bytes=1-100000", (1, size - 1))):
+        req = _RecordingRequest(range=value)
+        response = PrewikkaFileResponse(path)
+        response.write(req)
+
+        start, end = expected
+        assert response.code == 206
+        assert req.response_headers["Content-Range"] == "bytes %d-%d/%d" % (start, end, size)
+        assert b"".join(req.data) == content[start:end + 1]
+
+    # Unsatisfiable range
+    req = _RecordingRequest(range="bytes=%d-" % size)
+    response = PrewikkaFileResponse(path)
+    response.write(req)
+    assert response.code == 416
+    assert not req.data
+
+    # Multiple ranges, or a modified file
+    for headers in ({"range": "bytes=0-1,3-4"}, {"range": "bytes=2-5", "if-range": '"modified"'}):
+        req = _RecordingRequest(**headers)
+        response = PrewikkaFileResponse(path)
+        response.write(req)
+        assert response.code is None
+        assert b"".join(req.data) == content
+
+    req = _RecordingRequest(range="bytes=2-5", **{"if-range": etag})
+    PrewikkaFileResponse(path).write(req)
+    assert b"".join(req.data) == content[2:6]
+
+    # Downloads
+    with open(path, 'rb') as fd:
+        req = _RecordingRequest(range="bytes=-3")
+        PrewikkaDownloadResponse(fd, filename='test.txt').write(req)
+        assert b"".join(req.data) == content[-3:]
+        assert fd.closed
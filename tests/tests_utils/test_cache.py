@@ -0,0 +1,90 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.utils.cache`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from prewikka.utils import cache
+
+
+class _Computation(object):
+    def __init__(self):
+        self.calls = []
+
+    @cache.memoize("bounded_cache", maxsize=2)
+    def bounded(self, value):
+        self.calls.append(value)
+        return value * 2
+
+    @cache.memoize("expiring_cache", ttl=60)
+    def expiring(self, value):
+        self.calls.append(value)
+        return value * 2
+
+
+def test_memoize_maxsize():
+    """
+    Test `prewikka.utils.cache.memoize` decorator with a maximum size.
+    """
+    obj = _Computation()
+
+    assert [obj.bounded(i) for i in (1, 2, 1, 3, 1, 2)] == [2, 4, 2, 6, 2, 4]
+
+    # 2 is the least recently used entry when 3 is added
+    assert obj.calls == [1, 2, 3, 2]
+    assert obj.bounded_cache.infos() == (2, 4, 2, 2, 2)
+
+    obj.bounded_cache.clear()
+    assert obj.bounded_cache.infos().size == 0
+
+
+def test_memoize_ttl(monkeypatch):
+    """
+    Test `prewikka.utils.cache.memoize` decorator with a time to live.
+    """
+    now = [1000.]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+
+    obj = _Computation()
+    obj.expiring(1)
+    obj.expiring(1)
+
+    now[0] += 61
+    obj.expiring(1)
+
+    assert obj.calls == [1, 1]
+    assert obj.expiring_cache.infos().hits == 1
+
+
+def test_get_infos():
+    """
+    Test `prewikka.utils.cache.get_infos()`.
+    """
+    objs = [_Computation() for i in range(3)]
+    for obj in objs:
+        obj.bounded(1)
+        obj.bounded(1)
+
+    infos = dict(cache.get_infos())
+    assert infos["bounded_cache"].hits >= 3
+    assert infos["bounded_cache"].maxsize == 2
+
+    assert 'prewikka_cache_entries{cache="bounded_cache"}' in cache.format_metrics()
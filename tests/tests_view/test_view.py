@@ -24,9 +24,10 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import pytest
 from werkzeug.routing import Map
+from werkzeug.urls import url_decode
 
 from prewikka.view import InvalidParameterError, InvalidParameterValueError, MissingParameterError, \
-    InvalidMethodError, InvalidViewError, ListConverter, ParameterDesc, Parameters, View
+    InvalidMethodError, InvalidViewError, ListConverter, ParameterDesc, Parameters, View, ViewManager
 
 
 def test_invalid_parameter_error():
@@ -180,3 +181,66 @@ def test_parameters_mandatory():
         parameters = Parameters(v, **params)
         parameters.mandatory('bar', str)
         parameters.normalize()
+
+
+def _url_parameters(link):
+    path, sep, query = link.partition("?")
+    return path, sorted(url_decode(query).items(multi=True))
+
+
+def test_url_template():
+    """
+    Test `prewikka.view.URLTemplate` class.
+    """
+    template = env.viewmanager.url_template("Agents.agents", status="online")
+
+    for value in ("host", "a b/c?d=e&f#g+h%i", "\u00e9t\u00e9", 42, True):
+        link = template(filter=value, offset=1)
+        expected = env.viewmanager.url_for("Agents.agents", status="online", filter=value, offset=1)
+        assert _url_parameters(link) == _url_parameters(expected)
+
+    # Values which are not substituted are built by url_for()
+    for value in (None, ["a", "b"]):
+        link = template(filter=value)
+        assert _url_parameters(link) == _url_parameters(env.viewmanager.url_for("Agents.agents", status="online", filter=value))
+
+    # Path parameters
+    template = env.viewmanager.url_template("Agents.analyze")
+    assert template(analyzerid="a b") == env.viewmanager.url_for("Agents.analyze", analyzerid="a b")
+
+    template = env.viewmanager.url_template("nonexistent.view", _default=None)
+    assert template(value="test") is None
+
+
+def test_url_template_concurrent(monkeypatch):
+    """
+    Test `prewikka.view.URLTemplate` class shared by requests with different URL adapters.
+    """
+    template = env.viewmanager.url_template("Agents.agents", status="online")
+    adapters = {name: env.viewmanager._rule_map.bind("", name) for name in ("/a", "/b")}
+    current = ["/a"]
+    links = []
+
+    agents = env.viewmanager.get_view("Agents.agents")
+    make_parameters = agents.make_parameters
+
+    def _make_parameters(**kwargs):
+        # Another request uses the template while this one builds it
+        if "filter" not in kwargs and current[0] == "/a" and not links:
+            current[0] = "/b"
+            links.append(template(filter="b"))
+            current[0] = "/a"
+
+        return make_parameters(**kwargs)
+
+    monkeypatch.setattr(agents, "make_parameters", _make_parameters)
+    monkeypatch.setattr(ViewManager, "url_adapter", property(lambda self: adapters[current[0]]))
+
+    links.append(template(filter="a"))
+    links.append(template(filter="a"))
+
+    # Each link is built with the adapter of its own request
+    assert len(links) == 3
+    for link in links:
+        path, parameters = _url_parameters(link)
+        assert path.startswith("/%s/" % dict(parameters)["filter"])
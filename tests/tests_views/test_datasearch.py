@@ -0,0 +1,72 @@
+# Copyright (C) 2020 CS GROUP - France. All Rights Reserved.
+#
+# This file is part of the Prewikka program.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Tests for `prewikka.views.datasearch`.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from datetime import timedelta
+
+from prewikka.utils import timeutil
+from prewikka.views.datasearch import livetail
+
+
+def test_livetail():
+    """
+    Test `prewikka.views.datasearch.livetail.TailSource` class.
+    """
+    now = timeutil.utcnow() + timedelta(seconds=10)
+    polls = []
+    backend = []
+
+    def fetch(since, offset):
+        polls.append((since, offset))
+        return [(t, key, key) for t, key in backend if t >= since][offset:offset + 3]
+
+    with livetail.follow("test", fetch, 0) as source:
+        with livetail.follow("test", None, 0) as source2:
+            assert source2 is source
+            assert source.clients == 2
+
+        # no new row
+        assert source.get(0, 0.1) == (0, [])
+
+        backend.extend([(now, "a"), (now, "b")])
+        assert source.get(0, 1) == (2, ["a", "b"])
+
+        # rows already seen at the same time are filtered out
+        backend.append((now, "c"))
+        assert source.get(2, 1) == (3, ["c"])
+
+        backend.append((now + timedelta(seconds=1), "d"))
+        assert source.get(3, 1) == (4, ["d"])
+        assert polls[-1] == (now, 3)
+
+        # late clients only get the rows they missed
+        assert source.get(2, 1) == (4, ["c", "d"])
+
+    assert "test" not in livetail._sources
+
+    # more rows share the same time than a single fetch returns
+    backend[:] = [(now, key) for key in "abcde"]
+    with livetail.follow("test", fetch, 0) as source:
+        assert source.get(0, 1) == (3, ["a", "b", "c"])
+        assert source.get(3, 1) == (5, ["d", "e"])
+        assert polls[-1] == (now, 3)